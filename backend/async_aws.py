@@ -0,0 +1,64 @@
+import asyncio
+import contextvars
+import functools
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+# Blocking boto3 calls run on their own bounded pool, separate from Starlette's
+# threadpool, so a slow AWS dependency can't starve the event loop or /health
+AWS_EXECUTOR_WORKERS = int(os.environ.get('AWS_EXECUTOR_WORKERS', '32'))
+AWS_CALL_TIMEOUT = float(os.environ.get('AWS_CALL_TIMEOUT', '5'))
+DISCONNECT_POLL_INTERVAL = 0.1
+
+_executor = ThreadPoolExecutor(max_workers=AWS_EXECUTOR_WORKERS, thread_name_prefix='aws')
+
+
+class AWSCallTimeout(Exception):
+    pass
+
+
+class ClientDisconnected(Exception):
+    pass
+
+
+async def _wait_for_disconnect(request):
+    while not await request.is_disconnected():
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+async def run_aws(fn, *args, timeout=AWS_CALL_TIMEOUT, request=None, **kwargs):
+    """
+    Await a blocking AWS call without blocking the event loop.
+
+    The call runs on the dedicated AWS executor with the caller's context
+    variables. It is abandoned with AWSCallTimeout after `timeout` seconds, or
+    with ClientDisconnected as soon as `request`'s client goes away. A call
+    still queued for a worker is cancelled outright; one already running
+    finishes in the background and its result is dropped.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    future = loop.run_in_executor(_executor, functools.partial(context.run, fn, *args, **kwargs))
+
+    watcher = None
+    waiters = {future}
+    if request is not None:
+        watcher = asyncio.ensure_future(_wait_for_disconnect(request))
+        waiters.add(watcher)
+
+    try:
+        done, _ = await asyncio.wait(waiters, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    finally:
+        if watcher is not None:
+            watcher.cancel()
+
+    if future in done:
+        return future.result()
+
+    future.cancel()
+    if watcher is not None and watcher in done:
+        raise ClientDisconnected()
+    raise AWSCallTimeout(f"AWS call did not complete within {timeout}s")
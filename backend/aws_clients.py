@@ -0,0 +1,112 @@
+import os
+import threading
+
+# Connection tuning shared by every client built here
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', '50'))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', '3'))
+AWS_RETRY_MODE = os.environ.get('AWS_RETRY_MODE', 'standard')
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', '2'))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', '5'))
+
+_lock = threading.Lock()
+_session = None
+_registry = {}
+
+
+def default_config(**overrides):
+    """botocore Config with pooled keep-alive connections and bounded retries."""
+    from botocore.config import Config
+
+    settings = {
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'tcp_keepalive': True,
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        'retries': {'mode': AWS_RETRY_MODE, 'max_attempts': AWS_MAX_ATTEMPTS},
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _lock:
+            if _session is None:
+                import boto3
+                _session = boto3.session.Session()
+    return _session
+
+
+def _registry_key(kind, service, region, config):
+    return (kind, service, region, tuple(sorted((name, repr(value)) for name, value in config.items())))
+
+
+def _build(kind, service, region, config):
+    key = _registry_key(kind, service, region, config)
+    instance = _registry.get(key)
+    if instance is None:
+        session = get_session()
+        # boto3 sessions are not thread safe, so clients are created under the lock
+        with _lock:
+            instance = _registry.get(key)
+            if instance is None:
+                factory = session.client if kind == 'client' else session.resource
+                instance = factory(service, region_name=region, config=default_config(**config))
+                _registry[key] = instance
+    return instance
+
+
+def get_client(service, region=None, **config):
+    """Return the shared client for (service, region, config), creating it on first use."""
+    return _build('client', service, region, config)
+
+
+def get_resource(service, region=None, **config):
+    """Return the shared resource for (service, region, config), creating it on first use."""
+    return _build('resource', service, region, config)
+
+
+def register_event_handler(event_name, handler, unique_id=None):
+    """
+    Register a botocore event handler on every client, including clients
+    already built. Later clients inherit it from the session.
+    """
+    session = get_session()
+    with _lock:
+        session.events.register(event_name, handler, unique_id=unique_id)
+        for instance in _registry.values():
+            client = instance.meta.client if hasattr(instance.meta, 'client') else instance
+            client.meta.events.register(event_name, handler, unique_id=unique_id)
+
+
+def clear():
+    """Forget every cached client (tests, or after credentials change)."""
+    with _lock:
+        _registry.clear()
+
+
+class LazyClient:
+    """
+    Stand-in for a boto3 client, resource or Table that is only built on first
+    attribute access, so importing a module does not pay for boto3 or client
+    construction.
+    """
+
+    def __init__(self, factory):
+        self._factory = factory
+        self._target = None
+
+    def __getattr__(self, name):
+        target = self._target
+        if target is None:
+            target = self._target = self._factory()
+        return getattr(target, name)
+
+
+def lazy_client(service, region=None, **config):
+    return LazyClient(lambda: get_client(service, region, **config))
+
+
+def lazy_table(name, region=None, **config):
+    return LazyClient(lambda: get_resource('dynamodb', region, **config).Table(name))
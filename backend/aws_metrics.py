@@ -0,0 +1,133 @@
+"""
+Prometheus metrics for every AWS call, recorded through botocore event hooks.
+
+Each operation is labelled with its service, operation, region and the HTTP
+route that made it. The route comes from the `current_route` context
+variable, which async_aws.run_aws carries into executor threads. Calls made
+outside a request (background cache refreshes, counter flushes) are
+labelled 'background'.
+"""
+import contextvars
+import time
+
+from aws_clients import register_event_handler
+
+current_route = contextvars.ContextVar('current_route', default='background')
+
+# Error codes botocore's standard retry mode treats as throttling
+THROTTLING_ERROR_CODES = frozenset({
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'RequestThrottledException',
+    'TooManyRequestsException', 'ProvisionedThroughputExceededException', 'TransactionInProgressException',
+    'RequestLimitExceeded', 'BandwidthLimitExceeded', 'LimitExceededException', 'RequestThrottled',
+    'SlowDown', 'PriorRequestNotComplete', 'EC2ThrottledException',
+})
+
+# AWS calls take from ~5 ms (cached DynamoDB) to several seconds (retries, timeouts)
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_START = 'aws_metrics_start'
+_LABELS = 'aws_metrics_labels'
+_ATTEMPTS = 'aws_metrics_attempts'
+
+
+class AWSCallMetrics:
+    """botocore event handlers that feed the aws_* Prometheus metrics."""
+
+    def __init__(self, registry=None):
+        import prometheus_client as prom
+
+        labels = ['service', 'operation', 'region', 'route']
+        kwargs = {'registry': registry} if registry is not None else {}
+        self.duration = prom.Histogram('aws_request_duration_seconds',
+                                       'AWS API call latency, including retries', labels,
+                                       buckets=BUCKETS, **kwargs)
+        self.requests = prom.Counter('aws_requests_total', 'AWS API calls by outcome',
+                                     labels + ['outcome'], **kwargs)
+        self.retries = prom.Counter('aws_request_retries_total', 'Retry attempts made by AWS API calls',
+                                    labels, **kwargs)
+        self.throttles = prom.Counter('aws_request_throttles_total', 'Throttled AWS API attempts',
+                                      labels + ['error_code'], **kwargs)
+
+    def install(self):
+        """Register the handlers on every client built through aws_clients."""
+        register_event_handler('before-call', self.before_call, unique_id='aws-metrics-before-call')
+        register_event_handler('after-call', self.after_call, unique_id='aws-metrics-after-call')
+        register_event_handler('after-call-error', self.after_call_error, unique_id='aws-metrics-after-call-error')
+        register_event_handler('needs-retry', self.needs_retry, unique_id='aws-metrics-needs-retry')
+        return self
+
+    def before_call(self, model, context, **kwargs):
+        # The request context travels with the call through every retry
+        context[_LABELS] = (model.service_model.service_id.hyphenize(), model.name,
+                            context.get('client_region') or 'unknown', current_route.get())
+        context[_START] = time.perf_counter()
+        context[_ATTEMPTS] = 0
+
+    def after_call(self, http_response, parsed, model, context, **kwargs):
+        self._finish(context, 'success' if http_response.status_code < 300 else 'error')
+
+    def after_call_error(self, exception, context, **kwargs):
+        # Connection errors and timeouts that outlived every retry
+        self._finish(context, 'exception')
+
+    def _finish(self, context, outcome):
+        start = context.pop(_START, None)
+        labels = context.get(_LABELS)
+        if start is None or labels is None:
+            return
+        self.duration.labels(*labels).observe(time.perf_counter() - start)
+        self.requests.labels(*labels, outcome).inc()
+        # Counted per attempt below, so calls that failed after their last retry are included
+        retries = context.pop(_ATTEMPTS, 1) - 1
+        if retries > 0:
+            self.retries.labels(*labels).inc(retries)
+
+    def needs_retry(self, response=None, request_dict=None, **kwargs):
+        # Called after every attempt, including the last one; response is
+        # (http_response, parsed), or None when the attempt raised
+        if request_dict is None:
+            return None
+        context = request_dict.get('context', {})
+        context[_ATTEMPTS] = context.get(_ATTEMPTS, 0) + 1
+        if response:
+            code = response[1].get('Error', {}).get('Code')
+            labels = context.get(_LABELS)
+            if code in THROTTLING_ERROR_CODES and labels is not None:
+                self.throttles.labels(*labels, code).inc()
+        return None
+
+
+_installed = None
+
+
+def install(registry=None):
+    """Start recording AWS call metrics (once per process). Needs prometheus_client."""
+    global _installed
+    if _installed is None:
+        _installed = AWSCallMetrics(registry).install()
+    return _installed
+
+
+class RouteLabelMiddleware:
+    """
+    ASGI middleware that sets current_route for each HTTP request. The label
+    is the matched path for the app's own routes and 'other' for anything
+    else, which keeps label cardinality bounded.
+    """
+
+    def __init__(self, app, routes):
+        self.app = app
+        self.routes = routes  # callable returning the app's route paths
+        self._paths = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        if self._paths is None:
+            self._paths = frozenset(self.routes())
+        path = scope.get('path', '')
+        token = current_route.set(path if path in self._paths else 'other')
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
@@ -0,0 +1,102 @@
+"""
+Saturation benchmark for the FastAPI app.
+
+Drives POST /visitor with many concurrent clients against a slow local AWS
+stand-in (moto plus a fixed delay per request) and, at the same time, probes
+GET /health on a fixed schedule. Reports sustained /visitor RPS and latency,
+and /health latency while /visitor is saturated.
+
+Write-behind batching, rate limiting and view dedup are disabled so every
+hit reaches DynamoDB. Pass --baseline <git-rev> to run the same load
+against an older backend/.
+
+    python benchmarks/bench_async.py --concurrency 200 --duration 10 --baseline HEAD~1
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+import httpx
+
+from bench_cold_start import checkout
+from harness import BACKEND_DIR, App, AWSStandIn, percentile
+
+HEALTH_PROBE_INTERVAL = 0.05
+
+
+async def drive(url, concurrency, duration):
+    visitor_latency = []
+    visitor_errors = 0
+    health_latency = []
+    deadline = time.monotonic() + duration
+
+    limits = httpx.Limits(max_connections=concurrency + 1, max_keepalive_connections=concurrency + 1)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+        async def visitor_worker():
+            nonlocal visitor_errors
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                try:
+                    response = await client.post('/visitor', json={'action': 'view'})
+                    if response.status_code != 200:
+                        visitor_errors += 1
+                except httpx.HTTPError:
+                    visitor_errors += 1
+                visitor_latency.append(time.perf_counter() - start)
+
+        async def health_prober():
+            while time.monotonic() < deadline:
+                start = time.perf_counter()
+                await client.get('/health')
+                health_latency.append(time.perf_counter() - start)
+                await asyncio.sleep(HEALTH_PROBE_INTERVAL)
+
+        await asyncio.gather(health_prober(), *(visitor_worker() for _ in range(concurrency)))
+
+    return {
+        'visitor_rps': len(visitor_latency) / duration,
+        'visitor_errors': visitor_errors,
+        'visitor_p50_ms': percentile(visitor_latency, 50) * 1000,
+        'visitor_p99_ms': percentile(visitor_latency, 99) * 1000,
+        'health_p50_ms': percentile(health_latency, 50) * 1000,
+        'health_p99_ms': percentile(health_latency, 99) * 1000,
+        'health_max_ms': max(health_latency, default=float('nan')) * 1000,
+    }
+
+
+def run(tree, args):
+    with AWSStandIn(latency=args.aws_latency) as aws:
+        aws.create_table()
+        env = {'COUNTER_FLUSH_INTERVAL': '0', 'VISITOR_RATE_LIMIT': '0', 'VISITOR_DEDUP_WINDOW': '0'}
+        with App(aws, tree=tree, env=env) as app:
+            return asyncio.run(drive(app.url, args.concurrency, args.duration))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=200, help='concurrent /visitor clients')
+    parser.add_argument('--duration', type=float, default=10, help='seconds of load per run')
+    parser.add_argument('--aws-latency', type=float, default=0.05, help='added delay per AWS request (seconds)')
+    parser.add_argument('--baseline', help='git revision to compare against')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {'current': run(BACKEND_DIR, args)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            results[args.baseline] = run(checkout(args.baseline, tmp), args)
+
+    columns = list(results)
+    print(f"{'metric':<20}" + ''.join(f'{column:>14}' for column in columns))
+    for metric in results['current']:
+        print(f'{metric:<20}' + ''.join(f'{results[column][metric]:>14.1f}' for column in columns))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
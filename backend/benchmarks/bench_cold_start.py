@@ -0,0 +1,178 @@
+"""
+Cold-start benchmark for the Lambda handler.
+
+Every sample runs in a fresh interpreter and measures:
+  * import_ms      - `import lambda_function`
+  * options_ms     - first invocation that does not touch AWS (CORS preflight)
+  * first_call_ms  - first POST /visitor against a moto-backed table
+  * warm_call_ms   - second POST /visitor in the same interpreter
+
+It then runs `python -X importtime -c "import lambda_function"` --runs times
+and breaks the import down by top-level package (the self time of each of its
+modules, summed), largest first. A package that shows up here but is not needed
+to answer a request is a candidate for a deferred import.
+
+Pass --baseline <git-rev> to run the same probes against an older revision of
+backend/ and print both side by side.
+
+    python benchmarks/bench_cold_start.py --runs 10 --baseline HEAD~1
+    python benchmarks/bench_cold_start.py --top 30   # longer import breakdown
+"""
+import argparse
+import io
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tarfile
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Import only: no moto, so botocore is not pre-imported on our behalf
+IMPORT_PROBE = r'''
+import json, time
+t0 = time.perf_counter()
+import lambda_function
+t1 = time.perf_counter()
+lambda_function.lambda_handler({'requestContext': {'http': {'method': 'OPTIONS'}}}, None)
+t2 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'options_ms': (t2 - t1) * 1000}))
+'''
+
+# moto must be imported before any client exists so its stubber is registered
+CALL_PROBE = r'''
+import json, time
+from moto import mock_aws
+with mock_aws():
+    import boto3
+    boto3.resource('dynamodb', region_name='us-east-1').create_table(
+        TableName='VisitorCounter',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    import lambda_function
+    event = {'body': json.dumps({'action': 'view'})}
+    t0 = time.perf_counter()
+    lambda_function.lambda_handler(event, None)
+    t1 = time.perf_counter()
+    lambda_function.lambda_handler(event, None)
+    t2 = time.perf_counter()
+print(json.dumps({'first_call_ms': (t1 - t0) * 1000, 'warm_call_ms': (t2 - t1) * 1000}))
+'''
+
+PROBE_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+    'TABLE_NAME': 'VisitorCounter',
+}
+
+
+# "import time:  self [us] | cumulative | module" lines from -X importtime
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s+(\S+)')
+
+
+def run_probe(tree, probe):
+    env = {**os.environ, **PROBE_ENV, 'PYTHONPATH': tree}
+    out = subprocess.run(
+        [sys.executable, '-c', probe], cwd=tree, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    # The handler may print; the probe result is the last line
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def measure(tree, runs):
+    run_probe(tree, IMPORT_PROBE)  # warm the OS file cache and bytecode
+    samples = {}
+    for _ in range(runs):
+        for probe in (IMPORT_PROBE, CALL_PROBE):
+            for name, value in run_probe(tree, probe).items():
+                samples.setdefault(name, []).append(value)
+    return {name: statistics.median(values) for name, values in samples.items()}
+
+
+def import_breakdown(tree, runs):
+    """
+    Median self time (ms) per top-level package while importing
+    lambda_function, plus the number of modules it loads.
+    """
+    env = {**os.environ, **PROBE_ENV, 'PYTHONPATH': tree}
+    samples = []
+    for _ in range(runs):
+        stderr = subprocess.run(
+            [sys.executable, '-X', 'importtime', '-c', 'import lambda_function'], cwd=tree, env=env,
+            capture_output=True, text=True, check=True
+        ).stderr
+        packages = {}
+        modules = 0
+        for line in stderr.splitlines():
+            match = IMPORTTIME_LINE.match(line)
+            if match:
+                package = match.group(3).split('.')[0]
+                packages[package] = packages.get(package, 0.0) + int(match.group(1)) / 1000
+                modules += 1
+        samples.append((packages, modules))
+
+    names = {name for packages, _ in samples for name in packages}
+    return {
+        'modules': statistics.median(modules for _, modules in samples),
+        'packages': {name: statistics.median(packages.get(name, 0.0) for packages, _ in samples)
+                     for name in names},
+    }
+
+
+def checkout(rev, dest):
+    """Extract backend/ at `rev` into `dest` and return the extracted directory."""
+    repo = subprocess.run(['git', 'rev-parse', '--show-toplevel'], cwd=BACKEND_DIR,
+                          capture_output=True, text=True, check=True).stdout.strip()
+    archive = subprocess.run(['git', 'archive', '--format=tar', rev, 'backend'], cwd=repo,
+                             capture_output=True, check=True).stdout
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        tar.extractall(dest, filter='data')
+    return os.path.join(dest, 'backend')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='fresh interpreters per probe (median is reported)')
+    parser.add_argument('--baseline', help='git revision to compare against')
+    parser.add_argument('--top', type=int, default=15, help='packages listed in the import breakdown')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {'current': measure(BACKEND_DIR, args.runs)}
+    imports = {'current': import_breakdown(BACKEND_DIR, args.runs)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            tree = checkout(args.baseline, tmp)
+            results[args.baseline] = measure(tree, args.runs)
+            imports[args.baseline] = import_breakdown(tree, args.runs)
+
+    columns = list(results)
+    print(f"{'metric (median ms)':<20}" + ''.join(f'{column:>14}' for column in columns))
+    for metric in results['current']:
+        print(f'{metric:<20}' + ''.join(f'{results[column].get(metric, float("nan")):>14.1f}' for column in columns))
+
+    # Largest packages in either tree, so what a change removed is listed too
+    totals = {}
+    for breakdown in imports.values():
+        for name, ms in breakdown['packages'].items():
+            totals[name] = max(totals.get(name, 0.0), ms)
+    print()
+    print(f"{'import (self ms)':<20}" + ''.join(f'{column:>14}' for column in columns))
+    for name in sorted(totals, key=totals.get, reverse=True)[:args.top]:
+        print(f'{name:<20}' + ''.join(f"{imports[column]['packages'].get(name, 0.0):>14.1f}" for column in columns))
+    print(f"{'modules imported':<20}" + ''.join(f"{imports[column]['modules']:>14.0f}" for column in columns))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump({'timings': results, 'imports': imports}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""
+Warm-invocation overhead benchmark for the Lambda handler.
+
+Runs in a fresh interpreter per tree, against moto, with write-behind batching
+enabled and every cache warmed first. That way the timed invocations never
+wait on AWS, and what is left is the handler itself: event logging, routing,
+cache lookups and serialization. API Gateway HTTP API (payload 2.0) events of
+realistic size are used. The handler's stdout goes to /dev/null while timing,
+as Lambda ships it to CloudWatch Logs out of band.
+
+Pass --baseline <git-rev> to run the same events against an older backend/.
+
+    python benchmarks/bench_handler.py --iterations 5000 --baseline HEAD~1
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_cold_start import PROBE_ENV, checkout
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r'''
+import contextlib, datetime, json, os, sys, time
+from moto import mock_aws
+
+ITERATIONS = int(sys.argv[1])
+
+def http_event(method, path, query=None, body=None, headers=None):
+    return {
+        'version': '2.0',
+        'routeKey': f'{method} {path}',
+        'rawPath': path,
+        'rawQueryString': '&'.join(f'{k}={v}' for k, v in (query or {}).items()),
+        'headers': {
+            'accept': '*/*', 'accept-encoding': 'gzip, deflate, br', 'content-type': 'application/json',
+            'host': 'abc123.execute-api.us-east-1.amazonaws.com', 'origin': 'https://gauravyadav.site',
+            'referer': 'https://gauravyadav.site/', 'user-agent': 'Mozilla/5.0 (X11; Linux x86_64) Firefox/131.0',
+            'x-amzn-trace-id': 'Root=1-67000000-0123456789abcdef01234567',
+            'x-forwarded-for': '203.0.113.10', 'x-forwarded-port': '443', 'x-forwarded-proto': 'https',
+            **(headers or {}),
+        },
+        'queryStringParameters': query,
+        'requestContext': {
+            'accountId': '123456789012', 'apiId': 'abc123', 'domainName': 'abc123.execute-api.us-east-1.amazonaws.com',
+            'http': {'method': method, 'path': path, 'protocol': 'HTTP/1.1', 'sourceIp': '203.0.113.10',
+                     'userAgent': 'Mozilla/5.0 (X11; Linux x86_64) Firefox/131.0'},
+            'requestId': 'AbCdEfGhIjKlMnO=', 'routeKey': f'{method} {path}', 'stage': '$default',
+            'time': '18/Oct/2026:12:00:00 +0000', 'timeEpoch': 1792324800000,
+        },
+        'body': json.dumps(body) if body is not None else None,
+        'isBase64Encoded': False,
+    }
+
+class Context:
+    function_name = 'VisitorCounterFunction'
+
+with mock_aws():
+    import boto3
+    boto3.resource('dynamodb', region_name='us-east-1').create_table(
+        TableName='VisitorCounter',
+        KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+        AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+        BillingMode='PAY_PER_REQUEST')
+    s3 = boto3.client('s3', region_name='ap-south-1')
+    s3.create_bucket(Bucket='g2u7a8.photos', CreateBucketConfiguration={'LocationConstraint': 'ap-south-1'})
+    for i in range(50):
+        s3.put_object(Bucket='g2u7a8.photos', Key=f'IMG_{i:05d}.jpg', Body=b'')
+    boto3.client('cloudwatch', region_name='us-east-1').put_metric_data(Namespace='AWS/Lambda', MetricData=[
+        {'MetricName': name, 'Value': 10.0, 'Dimensions': [{'Name': 'FunctionName', 'Value': 'VisitorCounterFunction'}],
+         'Timestamp': datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=1)}
+        for name in ('Invocations', 'Duration')])
+
+    import lambda_function
+    context = Context()
+    events = {
+        'options': {'requestContext': {'http': {'method': 'OPTIONS'}}},
+        'gallery': http_event('GET', '/gallery'),
+        'metrics': http_event('GET', '/metrics'),
+        'visitor': http_event('POST', '/visitor', body={'action': 'view'}),
+    }
+    # Warm every cache and client; a 304 needs the ETag from a first response
+    for event in events.values():
+        lambda_function.lambda_handler(event, context)
+    etag = lambda_function.lambda_handler(events['gallery'], context)['headers'].get('ETag')
+    if etag:
+        events['gallery_304'] = http_event('GET', '/gallery', headers={'if-none-match': etag})
+
+    results = {}
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        for name, event in events.items():
+            lambda_function.lambda_handler(event, context)
+            start = time.perf_counter()
+            for _ in range(ITERATIONS):
+                lambda_function.lambda_handler(event, context)
+            results[f'{name}_us'] = (time.perf_counter() - start) / ITERATIONS * 1e6
+
+    # Flush the batched views while moto is still active
+    lambda_function.counter.close()
+print(json.dumps(results))
+'''
+
+
+def measure(tree, iterations):
+    env = {**os.environ, **PROBE_ENV, 'PYTHONPATH': tree, 'GALLERY_BUCKET_NAME': 'g2u7a8.photos',
+           # Keep /visitor in memory so the timings exclude DynamoDB
+           'COUNTER_FLUSH_INTERVAL': '3600', 'COUNTER_FLUSH_THRESHOLD': str(10 ** 9),
+           # Every timed /visitor call comes from the same client
+           'VISITOR_RATE_LIMIT': '0', 'VISITOR_DEDUP_WINDOW': '0'}
+    out = subprocess.run(
+        [sys.executable, '-c', PROBE, str(iterations)], cwd=tree, env=env,
+        capture_output=True, text=True, check=True
+    ).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000, help='warm invocations per route')
+    parser.add_argument('--baseline', help='git revision to compare against')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    results = {'current': measure(BACKEND_DIR, args.iterations)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            results[args.baseline] = measure(checkout(args.baseline, tmp), args.iterations)
+
+    columns = list(results)
+    print(f"{'route (mean us)':<20}" + ''.join(f'{column:>14}' for column in columns))
+    for metric in results['current']:
+        print(f'{metric:<20}' + ''.join(f'{results[column].get(metric, float("nan")):>14.1f}' for column in columns))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
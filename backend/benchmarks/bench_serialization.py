@@ -0,0 +1,106 @@
+"""
+Micro-benchmark for response serialization.
+
+Encodes a /visitor body (DynamoDB Decimals) and /metrics bodies for every
+window (one datetime per datapoint) with:
+  * stdlib        - json.dumps with the old DecimalEncoder / json_serial hooks
+                    (the previous Lambda path)
+  * fastapi       - jsonable_encoder + json.dumps (the previous FastAPI path),
+                    when FastAPI is installed
+  * fallback      - serialization.dumps without orjson
+  * orjson        - serialization.dumps with orjson, when it is installed
+
+    python benchmarks/bench_serialization.py --iterations 2000
+"""
+import argparse
+import importlib
+import json
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serialization
+from cloudwatch_metrics import METRICS_WINDOWS, build_payload
+
+
+class DecimalEncoder(json.JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return int(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+def json_serial(obj):
+    if isinstance(obj, datetime):
+        return obj.isoformat()
+    raise TypeError("Type not serializable")
+
+
+def metrics_payload(hours):
+    now = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    hours_back = [now - timedelta(hours=h) for h in range(hours)]
+    return build_payload({
+        'invocations': {timestamp: 40.0 + i for i, timestamp in enumerate(hours_back)},
+        'latency': {timestamp: 12.5 + i / 10 for i, timestamp in enumerate(hours_back)},
+    })
+
+
+def stdlib_dumps(body):
+    # The old handler used DecimalEncoder for /visitor and json_serial for /metrics
+    if 'invocations' in body:
+        return json.dumps(body, default=json_serial)
+    return json.dumps(body, cls=DecimalEncoder)
+
+
+def encoders():
+    yield 'stdlib', stdlib_dumps
+    try:
+        from fastapi.encoders import jsonable_encoder
+        yield 'fastapi', lambda body: json.dumps(jsonable_encoder(body))
+    except ImportError:
+        pass
+
+    orjson = serialization.orjson
+    serialization.orjson = None
+    sys.modules['orjson'] = None  # make the reload take the fallback branch
+    fallback = importlib.reload(serialization)
+    yield 'fallback', fallback.dumps
+
+    if orjson is not None:
+        sys.modules['orjson'] = orjson
+        yield 'orjson', importlib.reload(serialization).dumps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000, help='encodes per payload (best of 5 is reported)')
+    parser.add_argument('--json', dest='json_path', help='also write the results to this file')
+    args = parser.parse_args()
+
+    payloads = {'visitor': {'views': Decimal(123456), 'downloads': Decimal(789)}}
+    for hours in METRICS_WINDOWS:
+        payloads[f'metrics_{hours}h'] = metrics_payload(hours)
+
+    results = {}
+    for name, encode in encoders():
+        results[name] = {}
+        for payload_name, body in payloads.items():
+            best = min(timeit.repeat(lambda: encode(body), number=args.iterations, repeat=5))
+            results[name][f'{payload_name}_us'] = best / args.iterations * 1e6
+
+    columns = list(results)
+    print(f"{'payload (us/encode)':<20}" + ''.join(f'{column:>12}' for column in columns))
+    for metric in results['stdlib']:
+        print(f'{metric:<20}' + ''.join(f'{results[column][metric]:>12.2f}' for column in columns))
+
+    if args.json_path:
+        with open(args.json_path, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
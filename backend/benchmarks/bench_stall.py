@@ -0,0 +1,142 @@
+"""
+DynamoDB stall benchmark for the FastAPI app.
+
+Drives POST /visitor through three phases against the local AWS stand-in:
+healthy, stalled (every DynamoDB request delayed by --stall-delay seconds)
+and recovered. For each phase it reports RPS, p50/p99 latency and errors.
+Afterwards it waits for the app to reconcile and compares the stored view
+count with the number of views the app acknowledged. Any difference is
+reported as lost (or double-counted) increments.
+
+Write-behind batching is off by default so every hit goes to DynamoDB,
+along with rate limiting and view dedup. Exits with status 1 if increments
+were lost or the stalled p99 exceeds --max-stall-p99. Pass --baseline
+<git-rev> to run the same scenario against an older backend/.
+
+    python benchmarks/bench_stall.py --baseline HEAD~1
+
+Keep --stall-delay below botocore's read timeout (AWS_READ_TIMEOUT, 5 s).
+Longer stalls make botocore retry writes that the stand-in still applies,
+which counts them twice (ADD is not idempotent).
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+
+import httpx
+
+from bench_cold_start import checkout
+from harness import BACKEND_DIR, App, AWSStandIn, percentile
+
+APP_ENV = {
+    'COUNTER_FLUSH_INTERVAL': '0',
+    'VISITOR_RATE_LIMIT': '0',
+    'VISITOR_DEDUP_WINDOW': '0',
+}
+
+
+async def drive(client, concurrency, duration):
+    latencies = []
+    acknowledged = 0
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal acknowledged, errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.post('/visitor', json={'action': 'view'})
+                if response.status_code == 200:
+                    acknowledged += 1
+                else:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return {
+        'requests': len(latencies),
+        'acknowledged': acknowledged,
+        'errors': errors,
+        'rps': len(latencies) / duration,
+        'p50_ms': percentile(latencies, 50) * 1000,
+        'p99_ms': percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_phases(app, aws, args):
+    phases = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app.url, limits=limits, timeout=30) as client:
+        for name, delay in (('healthy', 0.0), ('stalled', args.stall_delay), ('recovered', 0.0)):
+            aws.stall(delay)
+            phases[name] = await drive(client, args.concurrency, args.duration)
+            print(f"  {name:<10} {phases[name]['rps']:>8.1f} rps  p50 {phases[name]['p50_ms']:>8.1f} ms  "
+                  f"p99 {phases[name]['p99_ms']:>8.1f} ms  errors {phases[name]['errors']}", flush=True)
+    return phases
+
+
+def stored_views(aws):
+    item = aws.client('dynamodb').get_item(TableName='VisitorCounter',
+                                           Key={'id': {'S': 'visitor_stats'}}).get('Item', {})
+    return int(item.get('views', {}).get('N', 0))
+
+
+def run(tree, args):
+    env = dict(APP_ENV)
+    for item in args.env:
+        key, value = item.split('=', 1)
+        env[key] = value
+
+    with AWSStandIn() as aws:
+        aws.create_table()
+        with App(aws, tree=tree, env=env) as app:
+            phases = asyncio.run(run_phases(app, aws, args))
+
+            # Abandoned writes finish, the circuit half-opens and the local delta is sent
+            acknowledged = sum(phase['acknowledged'] for phase in phases.values())
+            deadline = time.monotonic() + args.settle
+            while stored_views(aws) < acknowledged and time.monotonic() < deadline:
+                time.sleep(0.5)
+            stored = stored_views(aws)
+
+    return {'phases': phases, 'acknowledged': acknowledged, 'stored': stored, 'lost': acknowledged - stored}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent clients')
+    parser.add_argument('--duration', type=float, default=5, help='seconds per phase')
+    parser.add_argument('--stall-delay', type=float, default=3.0, help='delay per DynamoDB request while stalled')
+    parser.add_argument('--settle', type=float, default=20, help='seconds to wait for reconciliation')
+    parser.add_argument('--max-stall-p99', type=float, default=1500, help='allowed p99 while stalled (ms)')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app setting')
+    parser.add_argument('--baseline', help='git revision to compare against')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+
+    print('current tree:')
+    results = {'current': run(BACKEND_DIR, args)}
+    if args.baseline:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(f'{args.baseline}:')
+            results[args.baseline] = run(checkout(args.baseline, tmp), args)
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for label, result in results.items():
+            print(f"{label}: {result['acknowledged']} views acknowledged, {result['stored']} stored, "
+                  f"{result['lost']} lost")
+
+    current = results['current']
+    if current['lost'] != 0 or current['phases']['stalled']['p99_ms'] > args.max_stall_p99:
+        raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,229 @@
+"""
+Endpoint benchmark suite for the FastAPI app.
+
+Starts backend/main.py under uvicorn against the local moto stand-in, seeded
+with the visitor table, a gallery bucket and a day of Lambda metrics. Each
+scenario is then driven by a closed-loop driver: --concurrency clients
+sending back to back for --duration seconds, after a short warm-up. For
+every scenario it records:
+  * rps, p50_ms, p99_ms and errors (non-2xx/304 responses)
+  * aws_calls_per_request, in total and per service, counted by the stand-in
+
+Results are written as JSON (--output). Pass --compare <results.json> to
+check them against an earlier run. The check exits with status 1 if any
+scenario lost more than --max-rps-drop of its throughput, its p99 grew by
+more than --max-p99-increase, or it made more than --max-aws-calls-increase
+extra AWS calls per request.
+
+    python benchmarks/bench_suite.py --output baseline.json
+    # ... change caching or batching ...
+    python benchmarks/bench_suite.py --output current.json --compare baseline.json
+
+Rate limiting and view dedup are off by default (every request comes from
+one address); pass --env KEY=VALUE to change any app setting.
+"""
+import argparse
+import asyncio
+import json
+import platform
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+from harness import BACKEND_DIR, App, AWSStandIn, percentile
+
+GALLERY_IMAGES = 200
+METRICS_HOURS = 24
+
+APP_ENV = {
+    'GALLERY_BUCKET_NAME': 'g2u7a8.photos',
+    'VISITOR_RATE_LIMIT': '0',
+    'VISITOR_DEDUP_WINDOW': '0',
+}
+
+# name -> (method, path, JSON body)
+SCENARIOS = {
+    'health': ('GET', '/health', None),
+    'visitor_view': ('POST', '/visitor', {'action': 'view'}),
+    'visitor_download': ('POST', '/visitor', {'action': 'download'}),
+    'visitor_stats': ('GET', '/visitor/stats', None),
+    'gallery': ('GET', '/gallery', None),
+    'gallery_304': ('GET', '/gallery', None),  # sent with If-None-Match
+    'gallery_page': ('GET', '/gallery?limit=50', None),
+    'gallery_ndjson': ('GET', '/gallery?stream=ndjson', None),
+    'metrics_24h': ('GET', '/metrics?hours=24', None),
+    'metrics_168h': ('GET', '/metrics?hours=168', None),
+}
+
+# metric -> (comparison, option holding the allowed change)
+CHECKS = {
+    'rps': ('drop', 'max_rps_drop'),
+    'p99_ms': ('increase', 'max_p99_increase'),
+    'aws_calls_per_request': ('absolute', 'max_aws_calls_increase'),
+}
+
+
+async def drive(client, method, path, body, headers, concurrency, duration):
+    latencies = []
+    errors = 0
+    deadline = time.monotonic() + duration
+
+    async def worker():
+        nonlocal errors
+        while time.monotonic() < deadline:
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body, headers=headers)
+                await response.aread()
+                if response.status_code >= 400:
+                    errors += 1
+            except httpx.HTTPError:
+                errors += 1
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+async def run_scenarios(app, aws, names, args):
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=app.url, limits=limits, timeout=30) as client:
+        etag = (await client.get('/gallery')).headers.get('etag')
+
+        for name in names:
+            method, path, body = SCENARIOS[name]
+            headers = {'If-None-Match': etag} if name == 'gallery_304' and etag else None
+
+            # Warm caches, connections and lazily built clients outside the measurement
+            await drive(client, method, path, body, headers, args.concurrency, args.warmup)
+
+            before = aws.calls()
+            start = time.perf_counter()
+            latencies, errors = await drive(client, method, path, body, headers, args.concurrency, args.duration)
+            elapsed = time.perf_counter() - start
+            after = aws.calls()
+
+            requests = len(latencies)
+            calls = {service: after[service] - before[service] for service in after}
+            results[name] = {
+                'requests': requests,
+                'errors': errors,
+                'rps': requests / elapsed,
+                'p50_ms': percentile(latencies, 50) * 1000,
+                'p99_ms': percentile(latencies, 99) * 1000,
+                'aws_calls_per_request': sum(calls.values()) / requests if requests else 0.0,
+                'aws_calls_by_service': {service: n / requests for service, n in calls.items() if n and requests},
+            }
+            print(format_row(name, results[name]), flush=True)
+    return results
+
+
+def run(args):
+    names = args.scenarios or list(SCENARIOS)
+    env = dict(APP_ENV)
+    for item in args.env:
+        key, value = item.split('=', 1)
+        env[key] = value
+
+    with AWSStandIn(latency=args.aws_latency) as aws:
+        aws.create_table()
+        aws.create_gallery(images=GALLERY_IMAGES)
+        aws.create_metrics(hours=METRICS_HOURS)
+        with App(aws, env=env, workers=args.workers) as app:
+            results = asyncio.run(run_scenarios(app, aws, names, args))
+
+    return {
+        'meta': {
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'git_rev': git_rev(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'concurrency': args.concurrency,
+            'duration': args.duration,
+            'aws_latency': args.aws_latency,
+            'workers': args.workers,
+            'env': env,
+        },
+        'results': results,
+    }
+
+
+def git_rev():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=BACKEND_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def format_row(name, result):
+    return (f"{name:<18} {result['rps']:>9.1f} rps  p50 {result['p50_ms']:>8.1f} ms  "
+            f"p99 {result['p99_ms']:>8.1f} ms  aws/req {result['aws_calls_per_request']:>6.3f}  "
+            f"errors {result['errors']}")
+
+
+def compare(current, baseline, args):
+    """Return a list of regressions of `current` against `baseline`."""
+    regressions = []
+    for name, result in current['results'].items():
+        before = baseline['results'].get(name)
+        if before is None:
+            continue
+        for metric, (kind, option) in CHECKS.items():
+            allowed = getattr(args, option)
+            old, new = before[metric], result[metric]
+            if kind == 'drop':
+                failed = new < old * (1 - allowed)
+            elif kind == 'increase':
+                failed = new > old * (1 + allowed)
+            else:
+                failed = new > old + allowed
+            if failed:
+                regressions.append(f"{name}: {metric} {old:.3f} -> {new:.3f}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('scenarios', nargs='*', metavar='scenario',
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument('--concurrency', type=int, default=20, help='concurrent clients per scenario')
+    parser.add_argument('--duration', type=float, default=5, help='measured seconds per scenario')
+    parser.add_argument('--warmup', type=float, default=1, help='unmeasured seconds before each scenario')
+    parser.add_argument('--aws-latency', type=float, default=0.0, help='added delay per AWS request (seconds)')
+    parser.add_argument('--workers', type=int, default=1, help='uvicorn worker processes')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app setting')
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='results JSON to check for regressions against')
+    parser.add_argument('--max-rps-drop', type=float, default=0.10, help='allowed relative RPS drop')
+    parser.add_argument('--max-p99-increase', type=float, default=0.25, help='allowed relative p99 increase')
+    parser.add_argument('--max-aws-calls-increase', type=float, default=0.01,
+                        help='allowed absolute increase in AWS calls per request')
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario(s): {', '.join(unknown)}")
+
+    current = run(args)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(current, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args)
+        if regressions:
+            print(f"Regressions against {args.compare}:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print(f"No regressions against {args.compare}")
+
+
+if __name__ == '__main__':
+    main()
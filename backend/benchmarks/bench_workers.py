@@ -0,0 +1,150 @@
+"""
+Worker scaling benchmark for the multi-worker serving profile.
+
+Starts the app under gunicorn (gunicorn.conf.py) with 1, 2, ... N workers
+against the local moto stand-in. For each size it drives POST /visitor and
+GET /gallery for --duration seconds. The load comes from --client-processes
+separate processes so the load generator is not the bottleneck. For every
+worker count and path it reports RPS, speedup over one worker, p99 and AWS
+calls per request. With shared state, the AWS calls should stay flat as
+workers are added: one listing and one counter flush per interval for the
+whole server, however many workers it has.
+
+    python benchmarks/bench_workers.py --workers 1,2,4
+    python benchmarks/bench_workers.py --no-shared   # each worker keeps its own caches and counter
+
+Scaling is capped by the CPUs the stand-in and the load generator leave
+free, so run it on a machine with more cores than the largest worker count.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import time
+
+import httpx
+
+from harness import App, AWSStandIn, percentile
+
+APP_ENV = {
+    'GALLERY_BUCKET_NAME': 'g2u7a8.photos',
+    'VISITOR_RATE_LIMIT': '0',
+    'VISITOR_DEDUP_WINDOW': '0',
+}
+
+# name -> (method, path, JSON body)
+PATHS = {
+    'visitor': ('POST', '/visitor', {'action': 'view'}),
+    'gallery': ('GET', '/gallery', None),
+}
+
+
+def _client_process(url, method, path, body, concurrency, duration, results):
+    async def run():
+        latencies = []
+        errors = 0
+        deadline = time.monotonic() + duration
+        limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+        async with httpx.AsyncClient(base_url=url, limits=limits, timeout=30) as client:
+            async def worker():
+                nonlocal errors
+                while time.monotonic() < deadline:
+                    start = time.perf_counter()
+                    try:
+                        response = await client.request(method, path, json=body)
+                        if response.status_code >= 400:
+                            errors += 1
+                    except httpx.HTTPError:
+                        errors += 1
+                    latencies.append(time.perf_counter() - start)
+
+            await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return latencies, errors
+
+    results.put(asyncio.run(run()))
+
+
+def drive(url, name, args, duration):
+    method, path, body = PATHS[name]
+    results = multiprocessing.Queue()
+    per_process = max(1, args.concurrency // args.client_processes)
+    processes = [multiprocessing.Process(target=_client_process,
+                                         args=(url, method, path, body, per_process, duration, results))
+                 for _ in range(args.client_processes)]
+    for process in processes:
+        process.start()
+    latencies, errors = [], 0
+    for _ in processes:
+        process_latencies, process_errors = results.get()
+        latencies.extend(process_latencies)
+        errors += process_errors
+    for process in processes:
+        process.join()
+    return latencies, errors
+
+
+def run(args):
+    env = dict(APP_ENV)
+    if not args.shared:
+        env['SHARED_STATE_PATH'] = ''
+    for item in args.env:
+        key, value = item.split('=', 1)
+        env[key] = value
+
+    results = {}
+    with AWSStandIn(latency=args.aws_latency) as aws:
+        aws.create_table()
+        aws.create_gallery(images=200)
+        for workers in args.workers:
+            with App(aws, env=env, workers=workers, server='gunicorn') as app:
+                results[workers] = {}
+                for name in PATHS:
+                    drive(app.url, name, args, args.warmup)
+                    before = sum(aws.calls().values())
+                    latencies, errors = drive(app.url, name, args, args.duration)
+                    calls = sum(aws.calls().values()) - before
+                    results[workers][name] = {
+                        'rps': len(latencies) / args.duration,
+                        'p99_ms': percentile(latencies, 99) * 1000,
+                        'errors': errors,
+                        'aws_calls_per_request': calls / len(latencies) if latencies else 0.0,
+                    }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cpus = len(os.sched_getaffinity(0))
+    parser.add_argument('--workers', default=','.join(str(n) for n in sorted({1, max(1, cpus // 2), cpus})),
+                        help='comma-separated worker counts (default: 1, half and all CPUs)')
+    parser.add_argument('--concurrency', type=int, default=64, help='concurrent clients, over all client processes')
+    parser.add_argument('--client-processes', type=int, default=2, help='load generator processes')
+    parser.add_argument('--duration', type=float, default=5, help='measured seconds per path')
+    parser.add_argument('--warmup', type=float, default=1, help='unmeasured seconds before each path')
+    parser.add_argument('--aws-latency', type=float, default=0.005, help='added delay per AWS request (seconds)')
+    parser.add_argument('--no-shared', dest='shared', action='store_false',
+                        help='give every worker its own caches and counter')
+    parser.add_argument('--env', action='append', default=[], metavar='KEY=VALUE', help='extra app setting')
+    parser.add_argument('--json', action='store_true', help='print results as JSON')
+    args = parser.parse_args()
+    try:
+        args.workers = [int(n) for n in args.workers.split(',')]
+    except ValueError:
+        parser.error('--workers must be comma-separated integers')
+
+    results = run(args)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    print(f"{'workers':>7}  {'path':<8} {'rps':>9} {'speedup':>8} {'p99 ms':>9} {'aws/req':>8} {'errors':>6}")
+    for workers, paths in results.items():
+        for name, result in paths.items():
+            speedup = result['rps'] / results[args.workers[0]][name]['rps']
+            print(f"{workers:>7}  {name:<8} {result['rps']:>9.1f} {speedup:>7.2f}x {result['p99_ms']:>9.1f} "
+                  f"{result['aws_calls_per_request']:>8.4f} {result['errors']:>6}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,207 @@
+"""
+Shared pieces for the HTTP benchmarks: a local moto stand-in for AWS, a
+uvicorn or gunicorn subprocess running backend/main.py, and small
+statistics helpers.
+"""
+import multiprocessing
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AWS_ENV = {
+    'AWS_DEFAULT_REGION': 'us-east-1',
+    'AWS_REGION': 'us-east-1',
+    'AWS_ACCESS_KEY_ID': 'testing',
+    'AWS_SECRET_ACCESS_KEY': 'testing',
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(url, timeout=1):
+                return
+        except Exception:
+            if time.monotonic() > deadline:
+                raise RuntimeError(f"{url} did not come up within {timeout}s")
+            time.sleep(0.1)
+
+
+def percentile(values, pct):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+# Services whose requests the stand-in counts; anything else is counted as 'other'
+COUNTED_SERVICES = ('dynamodb', 's3', 'monitoring', 'other')
+
+
+def _service_name(environ):
+    # SigV4 credential scope: Credential=<key>/<date>/<region>/<service>/aws4_request
+    auth = environ.get('HTTP_AUTHORIZATION', '')
+    scope = auth.split('Credential=', 1)[-1].split(',', 1)[0].split('/')
+    service = scope[3] if len(scope) > 3 else 'other'
+    return service if service in COUNTED_SERVICES else 'other'
+
+
+def _serve_aws(port, latency, calls, stall):
+    import logging
+    from moto.moto_server.werkzeug_app import DomainDispatcherApplication, create_backend_app
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+
+    app = DomainDispatcherApplication(create_backend_app)
+    # moto applies UpdateItem ADDs as read-modify-write, so concurrent ones can
+    # lose increments; DynamoDB itself applies them atomically
+    dynamodb_lock = threading.Lock()
+
+    def slow_app(environ, start_response):
+        # Control-plane calls from the harness itself are neither delayed nor counted
+        if environ.get('PATH_INFO', '').startswith('/moto-api'):
+            return app(environ, start_response)
+
+        service = _service_name(environ)
+        with calls.get_lock():
+            calls[COUNTED_SERVICES.index(service)] += 1
+        if latency:
+            time.sleep(latency)
+        if service != 'dynamodb':
+            return app(environ, start_response)
+        if stall.value:
+            time.sleep(stall.value)
+        with dynamodb_lock:
+            return list(app(environ, start_response))
+
+    make_server('127.0.0.1', port, slow_app, threaded=True).serve_forever()
+
+
+class AWSStandIn:
+    """
+    moto server in its own process, with an optional fixed delay per AWS request
+    to imitate real service latency. Every AWS request is counted per service
+    (see calls()), and DynamoDB can be slowed down at runtime (see stall()).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.port = free_port()
+        self.endpoint = f'http://127.0.0.1:{self.port}'
+        self._calls = multiprocessing.Array('q', len(COUNTED_SERVICES))
+        self._stall = multiprocessing.Value('d', 0.0)
+        self._process = None
+
+    def __enter__(self):
+        self._process = multiprocessing.Process(target=_serve_aws,
+                                                args=(self.port, self.latency, self._calls, self._stall), daemon=True)
+        self._process.start()
+        wait_until_up(f'{self.endpoint}/moto-api/')
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.join()
+
+    def calls(self):
+        """AWS requests served so far: {service: count}."""
+        with self._calls.get_lock():
+            return dict(zip(COUNTED_SERVICES, self._calls[:]))
+
+    def stall(self, seconds):
+        """Delay every DynamoDB request by `seconds` from now on (0 ends the stall)."""
+        self._stall.value = seconds
+
+    def client(self, service, region='us-east-1'):
+        import boto3
+        return boto3.client(service, region_name=region, endpoint_url=self.endpoint,
+                            aws_access_key_id='testing', aws_secret_access_key='testing')
+
+    def create_table(self, name='VisitorCounter'):
+        self.client('dynamodb').create_table(
+            TableName=name,
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+
+    def create_gallery(self, bucket='g2u7a8.photos', images=50):
+        s3 = self.client('s3', 'ap-south-1')
+        s3.create_bucket(Bucket=bucket, CreateBucketConfiguration={'LocationConstraint': 'ap-south-1'})
+        for i in range(images):
+            s3.put_object(Bucket=bucket, Key=f'IMG_{i:05d}.jpg', Body=b'\xff\xd8\xff\xd9')
+
+    def create_metrics(self, function_name='VisitorCounterFunction', hours=24):
+        """One Invocations and one Duration datapoint per hour for the last `hours`."""
+        from datetime import datetime, timedelta, timezone
+
+        now = datetime.now(timezone.utc) - timedelta(minutes=1)
+        dimensions = [{'Name': 'FunctionName', 'Value': function_name}]
+        data = []
+        for hour in range(hours):
+            timestamp = now - timedelta(hours=hour)
+            data.append({'MetricName': 'Invocations', 'Dimensions': dimensions, 'Timestamp': timestamp,
+                         'Value': 40.0 + hour, 'Unit': 'Count'})
+            data.append({'MetricName': 'Duration', 'Dimensions': dimensions, 'Timestamp': timestamp,
+                         'Value': 12.5 + hour / 10, 'Unit': 'Milliseconds'})
+        cloudwatch = self.client('cloudwatch')
+        for start in range(0, len(data), 20):
+            cloudwatch.put_metric_data(Namespace='AWS/Lambda', MetricData=data[start:start + 20])
+
+
+class App:
+    """
+    backend/main.py in a subprocess, pointed at an AWSStandIn. `server` is
+    'uvicorn' or 'gunicorn' (the multi-worker profile in gunicorn.conf.py,
+    with its shared state in a private temporary directory).
+    """
+
+    def __init__(self, aws, tree=BACKEND_DIR, env=None, workers=1, server='uvicorn'):
+        self.aws = aws
+        self.tree = tree
+        self.env = env or {}
+        self.workers = workers
+        self.server = server
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        self._process = None
+        self._state_dir = None
+
+    def __enter__(self):
+        env = {**os.environ, **AWS_ENV, 'AWS_ENDPOINT_URL': self.aws.endpoint, 'PYTHONPATH': self.tree}
+        if self.server == 'gunicorn':
+            self._state_dir = tempfile.mkdtemp(prefix='bench-state-')
+            env['SHARED_STATE_PATH'] = os.path.join(self._state_dir, 'state.db')
+            env['PROMETHEUS_MULTIPROC_DIR'] = os.path.join(self._state_dir, 'prometheus')
+            command = ['gunicorn', '-c', 'gunicorn.conf.py', '--bind', f'127.0.0.1:{self.port}',
+                       '--workers', str(self.workers), '--log-level', 'warning', 'main:app']
+        else:
+            command = ['uvicorn', 'main:app', '--host', '127.0.0.1', '--port', str(self.port),
+                       '--workers', str(self.workers), '--log-level', 'warning', '--no-access-log']
+        env.update(self.env)
+        self._process = subprocess.Popen([sys.executable, '-m'] + command, cwd=self.tree, env=env)
+        wait_until_up(f'{self.url}/health')
+        return self
+
+    def __exit__(self, *exc):
+        self._process.terminate()
+        self._process.wait()
+        if self._state_dir is not None:
+            shutil.rmtree(self._state_dir, ignore_errors=True)
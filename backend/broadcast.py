@@ -0,0 +1,176 @@
+import asyncio
+import os
+import time
+
+from serialization import dumps
+
+# Live visitor counts pushed over Server-Sent Events (GET /visitor/stream)
+SSE_MAX_UPDATES_PER_SECOND = float(os.environ.get('SSE_MAX_UPDATES_PER_SECOND', '2'))
+SSE_POLL_INTERVAL = float(os.environ.get('SSE_POLL_INTERVAL', '2'))       # Re-read to pick up other writers
+SSE_MAX_SUBSCRIBERS = int(os.environ.get('SSE_MAX_SUBSCRIBERS', '5000'))  # Open streams per process
+SSE_HEARTBEAT_INTERVAL = float(os.environ.get('SSE_HEARTBEAT_INTERVAL', '15'))
+SSE_RETRY_MS = 5000
+
+
+class TooManySubscribers(Exception):
+    pass
+
+
+class CountBroadcaster:
+    """
+    Fans visitor counts out to every open stream from one read loop.
+
+    While at least one subscriber is connected, a single task reads the counts
+    after a local increment (notify()) or every `poll_interval` seconds,
+    whichever comes first, but never more than `max_rate` times per second.
+    Changed counts are published as a new version. Subscribers don't have
+    queues: each one waits for the next version and always gets the latest
+    counts, so a slow client skips intermediate updates instead of building
+    a backlog. The cost per update is one read, however many tabs are open.
+    """
+
+    def __init__(self, read_counts, max_rate=SSE_MAX_UPDATES_PER_SECOND, poll_interval=SSE_POLL_INTERVAL,
+                 max_subscribers=SSE_MAX_SUBSCRIBERS):
+        self.read_counts = read_counts  # async callable returning { views, downloads }
+        self.min_interval = 1 / max_rate if max_rate > 0 else 0
+        self.poll_interval = poll_interval
+        self.max_subscribers = max_subscribers
+
+        self.subscribers = 0
+        self.counts = None
+        self.version = 0
+        self.reads = 0
+        self.publishes = 0
+
+        self._published = None  # asyncio.Event set (and replaced) on every publish
+        self._dirty = None      # asyncio.Event set by notify()
+        self._loop = None
+        self._task = None
+
+    def _ensure_started(self):
+        if self._task is None or self._task.done():
+            self._loop = asyncio.get_running_loop()
+            self._published = asyncio.Event()
+            self._dirty = asyncio.Event()
+            self._task = asyncio.ensure_future(self._run())
+
+    def notify(self):
+        """Signal that the counts changed locally. Safe to call from any thread."""
+        loop = self._loop
+        if loop is None or self._task is None or self._task.done():
+            return
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if running is loop:
+            self._dirty.set()
+        else:
+            loop.call_soon_threadsafe(self._dirty.set)
+
+    async def _run(self):
+        while self.subscribers:
+            started = time.monotonic()
+            # Cleared before the read, so a notify() during the read or the
+            # coalescing sleep below triggers the next read
+            self._dirty.clear()
+            try:
+                counts = await self.read_counts()
+                self.reads += 1
+            except Exception as e:
+                print(f"Broadcast Error: {str(e)}")
+            else:
+                if counts != self.counts:
+                    self._publish(counts)
+
+            # Coalesce: at most one read per min_interval however often notify() fires
+            elapsed = time.monotonic() - started
+            if elapsed < self.min_interval:
+                await asyncio.sleep(self.min_interval - elapsed)
+
+            try:
+                await asyncio.wait_for(self._dirty.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def _publish(self, counts):
+        self.counts = counts
+        self.version += 1
+        self.publishes += 1
+        published, self._published = self._published, asyncio.Event()
+        published.set()
+
+    def subscribe(self):
+        """
+        Open a Subscription, or raise TooManySubscribers when the limit is
+        reached. The caller must close() it.
+        """
+        if self.subscribers >= self.max_subscribers:
+            raise TooManySubscribers(f"Too many open streams (limit {self.max_subscribers})")
+        self.subscribers += 1
+        self._ensure_started()
+        return Subscription(self)
+
+    def stats(self):
+        return {
+            'subscribers': self.subscribers,
+            'max_subscribers': self.max_subscribers,
+            'reads': self.reads,
+            'publishes': self.publishes,
+        }
+
+
+class Subscription:
+    """Async iterator of counts: the current counts first (once known), then every change."""
+
+    def __init__(self, broadcaster):
+        self.broadcaster = broadcaster
+        self.seen = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        broadcaster = self.broadcaster
+        if broadcaster.version == self.seen:
+            await broadcaster._published.wait()
+        self.seen = broadcaster.version
+        return broadcaster.counts
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self.broadcaster.subscribers -= 1
+
+
+def sse_event(data, event=None):
+    """Encode one Server-Sent Events message."""
+    lines = [f'event: {event}'] if event else []
+    lines.append(f'data: {dumps(data)}')
+    return ('\n'.join(lines) + '\n\n').encode('utf-8')
+
+
+async def sse_stream(subscription, heartbeat=SSE_HEARTBEAT_INTERVAL):
+    """
+    Encode a Subscription as an SSE body, with a comment line every
+    `heartbeat` seconds so idle proxies keep the connection open. The
+    subscription is closed when the stream ends or the client goes away.
+    """
+    yield f'retry: {SSE_RETRY_MS}\n\n'.encode('utf-8')
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(subscription.__anext__())
+            done, _ = await asyncio.wait({pending}, timeout=heartbeat)
+            if not done:
+                yield b': ping\n\n'
+                continue
+            counts = pending.result()
+            pending = None
+            yield sse_event(counts, 'counts')
+    finally:
+        if pending is not None:
+            pending.cancel()
+        subscription.close()
@@ -0,0 +1,98 @@
+"""
+Circuit breaker for calls to a struggling dependency.
+
+The breaker counts consecutive bad calls. A call is bad when it raises or
+when it takes at least `slow_call_seconds`, so a backend that still answers,
+but slowly, trips it as well. After `failure_threshold` bad calls in a row
+the circuit opens and allow() refuses calls for `reset_timeout` seconds.
+Then one trial call is let through (half-open). If it goes well the circuit
+closes; if not it opens again.
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold=5, slow_call_seconds=0.5, reset_timeout=5.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.slow_call_seconds = slow_call_seconds
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = None
+        self._trial_in_flight = False
+        self.trips = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._state
+
+    def allow(self):
+        """
+        True if a call may go out now. When the circuit is half-open only one
+        caller gets True, and that caller must then report with record(), or
+        with release() if it never made the call.
+        """
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and self.clock() - self._opened_at >= self.reset_timeout:
+                self._state = HALF_OPEN
+                self._trial_in_flight = False
+            if self._state == HALF_OPEN and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record(self, elapsed, failed=False):
+        """Report the outcome of an allowed call that took `elapsed` seconds."""
+        with self._lock:
+            if failed or elapsed >= self.slow_call_seconds:
+                self._failures += 1
+                if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+                    self._open()
+            else:
+                self._failures = 0
+                self._state = CLOSED
+                self._trial_in_flight = False
+
+    def release(self):
+        """Hand back an allow() whose call was never made, so the next caller can be the half-open trial."""
+        with self._lock:
+            self._trial_in_flight = False
+
+    def call(self, fn, *args, **kwargs):
+        """Run `fn` through the breaker, raising CircuitOpen instead when it is open."""
+        if not self.allow():
+            raise CircuitOpen()
+        start = self.clock()
+        try:
+            result = fn(*args, **kwargs)
+        except Exception:
+            self.record(self.clock() - start, failed=True)
+            raise
+        self.record(self.clock() - start)
+        return result
+
+    def stats(self):
+        with self._lock:
+            return {'state': self._state, 'consecutive_failures': self._failures, 'trips': self.trips}
+
+    def _open(self):
+        if self._state != OPEN:
+            self.trips += 1
+        self._state = OPEN
+        self._opened_at = self.clock()
+        self._trial_in_flight = False
@@ -0,0 +1,166 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+# Hourly buckets over the last day, as shown on the status page
+METRICS_PERIOD = 3600
+METRICS_WINDOW_HOURS = 24
+# Windows a client may ask for with ?hours= (each one gets its own cache entry)
+METRICS_WINDOWS = (1, 6, 24, 72, 168)
+# How long an assembled response is reused before the newest bucket is re-fetched
+METRICS_CACHE_TTL = float(os.environ.get('METRICS_CACHE_TTL', '60'))
+
+# (query id, metric name, statistic, datapoint unit)
+SERIES = (
+    ('invocations', 'Invocations', 'Sum', 'Count'),
+    ('latency', 'Duration', 'Average', 'Milliseconds'),
+)
+
+
+def floor_to_period(moment, period=METRICS_PERIOD):
+    return datetime.fromtimestamp(int(moment.timestamp()) // period * period, tz=timezone.utc)
+
+
+def fetch_series(cloudwatch, function_name, start_time, end_time, period=METRICS_PERIOD):
+    """
+    Fetch invocations and average duration for a Lambda function with a
+    single get_metric_data request (following NextToken if CloudWatch pages).
+
+    Returns {query id: {timestamp: value}}.
+    """
+    queries = [{
+        'Id': query_id,
+        'MetricStat': {
+            'Metric': {
+                'Namespace': 'AWS/Lambda',
+                'MetricName': metric_name,
+                'Dimensions': [{'Name': 'FunctionName', 'Value': function_name}],
+            },
+            'Period': period,
+            'Stat': stat,
+        },
+        'ReturnData': True,
+    } for query_id, metric_name, stat, _ in SERIES]
+
+    series = {query_id: {} for query_id, _, _, _ in SERIES}
+    params = {
+        'MetricDataQueries': queries,
+        'StartTime': start_time,
+        'EndTime': end_time,
+        'ScanBy': 'TimestampAscending',
+    }
+    while True:
+        response = cloudwatch.get_metric_data(**params)
+        for result in response.get('MetricDataResults', []):
+            series[result['Id']].update(zip(result['Timestamps'], result['Values']))
+        if not response.get('NextToken'):
+            return series
+        params['NextToken'] = response['NextToken']
+
+
+def build_payload(series):
+    """Shape the cached buckets like the original get_metric_statistics response."""
+    points = {}
+    for query_id, _, stat, unit in SERIES:
+        points[query_id] = [
+            {'Timestamp': timestamp, stat: value, 'Unit': unit}
+            for timestamp, value in sorted(series[query_id].items())
+        ]
+
+    sorted_invocations = points['invocations']
+    sorted_latency = points['latency']
+
+    total_invocations = sum(item['Sum'] for item in sorted_invocations)
+
+    if sorted_latency:
+        avg_duration = sum(item['Average'] for item in sorted_latency) / len(sorted_latency)
+    else:
+        avg_duration = 0.0
+
+    chart_data = [{
+        'timestamp': point['Timestamp'].isoformat(),
+        'value': point['Average']
+    } for point in sorted_latency]
+
+    return {
+        'invocations': sorted_invocations,
+        'latency': sorted_latency,
+        'total_invocations': total_invocations,
+        'avg_duration': avg_duration,
+        'chart_data': chart_data
+    }
+
+
+class _WindowState:
+    def __init__(self):
+        self.series = {query_id: {} for query_id, _, _, _ in SERIES}
+        self.payload = None
+        self.refreshed_at = None
+        self.lock = threading.Lock()
+
+
+class MetricsCache:
+    """
+    Server-side cache for the /metrics dashboard, keyed by (function, window).
+
+    The first request for a window pulls every hourly bucket. After that only
+    the two newest buckets onwards are re-fetched and merged, and
+    buckets that fall out of the window are dropped. Concurrent requests for
+    the same window wait for one in-flight refresh instead of each querying
+    CloudWatch, so a period costs one upstream query however many dashboards
+    are open. With `shared` (a shared_state.SharedState) that also holds
+    across worker processes.
+    """
+
+    def __init__(self, cloudwatch, ttl=METRICS_CACHE_TTL, period=METRICS_PERIOD, shared=None):
+        self.cloudwatch = cloudwatch
+        self.ttl = ttl
+        self.period = period
+        self.shared = shared
+        self._windows = {}
+        self._lock = threading.Lock()
+
+    def get(self, function_name, hours=METRICS_WINDOW_HOURS):
+        if hours not in METRICS_WINDOWS:
+            raise ValueError(f"hours must be one of {', '.join(map(str, METRICS_WINDOWS))}")
+
+        with self._lock:
+            state = self._windows.setdefault((function_name, hours), _WindowState())
+
+        with state.lock:
+            if state.payload is not None and time.monotonic() - state.refreshed_at < self.ttl:
+                return state.payload
+            if self.shared is None:
+                self._refresh(state, function_name, hours)
+                return state.payload
+
+            payload, age = self.shared.load(f'metrics:{function_name}:{hours}', self.ttl,
+                                            lambda: self._refresh(state, function_name, hours))
+            state.payload = payload
+            state.refreshed_at = time.monotonic() - age
+            return payload
+
+    def _refresh(self, state, function_name, hours):
+        end_time = datetime.now(timezone.utc)
+        window_start = floor_to_period(end_time - timedelta(hours=hours), self.period)
+
+        known = [timestamp for points in state.series.values() for timestamp in points]
+        if known:
+            # The newest bucket is still accumulating, and the one before it keeps
+            # growing for a while after it closes (its last minutes plus CloudWatch's
+            # ingestion lag), so fetch both again with anything after them
+            start_time = max(window_start, max(known) - timedelta(seconds=self.period))
+        else:
+            start_time = window_start
+
+        fresh = fetch_series(self.cloudwatch, function_name, start_time, end_time, self.period)
+        for query_id, points in fresh.items():
+            merged = state.series[query_id]
+            merged.update(points)
+            for timestamp in [timestamp for timestamp in merged if timestamp < window_start]:
+                del merged[timestamp]
+
+        state.payload = build_payload(state.series)
+        state.refreshed_at = time.monotonic()
+        return state.payload
@@ -0,0 +1,463 @@
+import atexit
+import contextvars
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+from aws_clients import AWS_MAX_POOL_CONNECTIONS
+from circuit_breaker import CircuitBreaker
+
+# The single DynamoDB item that holds the running totals
+COUNTER_KEY = 'visitor_stats'
+COUNTER_FIELDS = ('views', 'downloads')
+
+# Number of shard items to spread increments over (0 keeps the single legacy item)
+COUNTER_SHARDS = int(os.environ.get('COUNTER_SHARDS', '0'))
+
+# batch_get_item accepts at most 100 keys per request
+BATCH_GET_LIMIT = 100
+
+# Circuit breaker around the counter's DynamoDB calls (see ResilientCounterStore).
+# A call is abandoned after COUNTER_CALL_TIMEOUT seconds; COUNTER_BREAKER_FAILURES
+# failed or slow (>= COUNTER_SLOW_CALL_SECONDS) calls in a row open the circuit
+# for COUNTER_BREAKER_RESET seconds.
+COUNTER_BREAKER = os.environ.get('COUNTER_BREAKER', '1') == '1'
+COUNTER_CALL_TIMEOUT = float(os.environ.get('COUNTER_CALL_TIMEOUT', '1.0'))
+COUNTER_SLOW_CALL_SECONDS = float(os.environ.get('COUNTER_SLOW_CALL_SECONDS', '0.5'))
+COUNTER_BREAKER_FAILURES = int(os.environ.get('COUNTER_BREAKER_FAILURES', '5'))
+COUNTER_BREAKER_RESET = float(os.environ.get('COUNTER_BREAKER_RESET', '5'))
+# Threads making store calls for the breaker: one per AWS executor thread that
+# may be waiting on it (async_aws.py), but no more than the connection pool
+COUNTER_STORE_WORKERS = min(int(os.environ.get('AWS_EXECUTOR_WORKERS', '32')), AWS_MAX_POOL_CONNECTIONS)
+
+
+class CounterUnavailable(Exception):
+    """The store cannot be reached and no totals are known yet. Increments passed in are still kept."""
+
+
+def field_for_action(action):
+    """Map a /visitor action ('view' or 'download') to its counter attribute."""
+    return 'downloads' if action == 'download' else 'views'
+
+
+def counts_from_item(item):
+    """Build the { views, downloads } response from a raw DynamoDB item."""
+    return {
+        'views': int(item.get('views', item.get('count', 0))),  # Fallback to old 'count' if views empty
+        'downloads': int(item.get('downloads', 0)),
+    }
+
+
+class CounterStore:
+    """Reads and writes the visitor totals kept on one DynamoDB item."""
+
+    def __init__(self, table, key=COUNTER_KEY):
+        self.table = table
+        self.key = key
+
+    def add(self, deltas):
+        """
+        Apply several counter increments with a single atomic ADD and return
+        the new totals from the same request (ReturnValues=ALL_NEW), so no
+        read-after-write round trip is needed.
+        """
+        deltas = {field: n for field, n in deltas.items() if n}
+        if not deltas:
+            return self.read()
+
+        clauses = []
+        names = {}
+        values = {}
+        for i, (field, n) in enumerate(sorted(deltas.items())):
+            names[f'#f{i}'] = field
+            values[f':n{i}'] = n
+            clauses.append(f'#f{i} :n{i}')
+
+        response = self.table.update_item(
+            Key={'id': self.key},
+            UpdateExpression='ADD ' + ', '.join(clauses),
+            ExpressionAttributeNames=names,
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_NEW'
+        )
+        return counts_from_item(response.get('Attributes', {}))
+
+    def read(self):
+        response = self.table.get_item(Key={'id': self.key})
+        return counts_from_item(response.get('Item', {}))
+
+    def warm(self):
+        """Build the (lazy) table client now, so the first call only pays for the request."""
+        return self.table.meta
+
+
+class ShardedCounterStore(CounterStore):
+    """
+    Spreads the visitor totals over `shards` items (`visitor_stats#0..N-1`).
+
+    Each increment lands on a random shard so writes are no longer capped by a
+    single item's partition throughput; reads sum every shard with one
+    batch_get_item. The original `visitor_stats` item is read as an extra
+    shard, so existing totals (including the legacy `count` attribute) carry
+    over without a migration step.
+    """
+
+    def __init__(self, table, shards, key=COUNTER_KEY):
+        super().__init__(table, key)
+        if shards < 1:
+            raise ValueError("shards must be at least 1")
+        self.shards = shards
+        self.shard_keys = [f'{key}#{i}' for i in range(shards)]
+
+    def add(self, deltas):
+        """Increment one random shard, then sum all shards for the new totals."""
+        shard = CounterStore(self.table, random.choice(self.shard_keys))
+        shard.add(deltas)
+        return self.read()
+
+    def read(self):
+        totals = dict.fromkeys(COUNTER_FIELDS, 0)
+        for item in self._batch_get([self.key] + self.shard_keys):
+            for field, n in counts_from_item(item).items():
+                totals[field] += n
+        return totals
+
+    def _batch_get(self, keys):
+        client = self.table.meta.client
+        items = []
+        for start in range(0, len(keys), BATCH_GET_LIMIT):
+            request = {self.table.name: {'Keys': [{'id': key} for key in keys[start:start + BATCH_GET_LIMIT]]}}
+            while request:
+                response = client.batch_get_item(RequestItems=request)
+                items.extend(response.get('Responses', {}).get(self.table.name, []))
+                request = response.get('UnprocessedKeys')
+        return items
+
+
+def make_counter_store(table, shards=None):
+    """Return the counter store for the configured COUNTER_SHARDS mode."""
+    shards = COUNTER_SHARDS if shards is None else shards
+    if shards > 0:
+        return ShardedCounterStore(table, shards)
+    return CounterStore(table)
+
+
+class ResilientCounterStore:
+    """
+    Wraps a counter store so counting carries on while DynamoDB is failing
+    or stalled.
+
+    Every call goes through a CircuitBreaker and is abandoned after running
+    for `call_timeout` seconds. A call that waited that long for a free
+    worker is not sent, so callers wait at most twice that. Increments
+    from a write that fails, times out or is refused by the open circuit go
+    into a local delta. The caller gets the last known totals plus that
+    delta. The next call the breaker lets through sends the delta with its
+    own increments in one atomic ADD, which reconciles the stored totals
+    once DynamoDB is back.
+
+    A write that timed out may still land later. Its increments are held
+    apart until it finishes. They are dropped if it succeeded, and moved to
+    the local delta if it failed. (A write that DynamoDB applied but
+    reported as failed, e.g. a read timeout retried by botocore, can still
+    be counted twice; ADD is not idempotent.)
+    """
+
+    def __init__(self, store, breaker=None, call_timeout=COUNTER_CALL_TIMEOUT, workers=COUNTER_STORE_WORKERS):
+        self.store = store
+        self.breaker = breaker or CircuitBreaker(COUNTER_BREAKER_FAILURES, COUNTER_SLOW_CALL_SECONDS,
+                                                 COUNTER_BREAKER_RESET)
+        self.call_timeout = call_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='counter-store')
+        self._warmed = False
+
+        self._lock = threading.Lock()
+        self._local = dict.fromkeys(COUNTER_FIELDS, 0)        # not yet sent
+        self._unconfirmed = dict.fromkeys(COUNTER_FIELDS, 0)  # sent, outcome unknown
+        self._known = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.fallbacks = 0
+        self.timeouts = 0
+        self.errors = 0
+
+    def add(self, deltas):
+        with self._lock:
+            for field, n in deltas.items():
+                self._local[field] += n
+        return self._sync()
+
+    def read(self):
+        return self._sync()
+
+    def pending(self):
+        """Increments counted locally that the store has not confirmed yet."""
+        with self._lock:
+            return sum(self._local.values()) + sum(self._unconfirmed.values())
+
+    def reconcile(self):
+        """Send the local delta now, if there is one and the breaker allows a call."""
+        with self._lock:
+            if not any(self._local.values()):
+                return
+        self._sync()
+
+    def start(self, interval=1.0):
+        """Reconcile every `interval` seconds in the background, and once more on exit."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='counter-reconciler',
+                                            daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.reconcile()
+        except Exception as e:
+            print(f"Counter Reconcile Error: {str(e)}")
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.reconcile()
+            except Exception as e:
+                print(f"Counter Reconcile Error: {str(e)}")
+
+    def _sync(self):
+        if not self.breaker.allow():
+            self.fallbacks += 1
+            return self._estimate()
+
+        with self._lock:
+            batch = self._local
+            self._local = dict.fromkeys(COUNTER_FIELDS, 0)
+            for field, n in batch.items():
+                self._unconfirmed[field] += n
+
+        # A cold process imports boto3 and builds the client here, outside the timed call
+        if not self._warmed:
+            try:
+                self.store.warm()
+            except Exception:
+                pass  # the call below fails the same way and is handled there
+            self._warmed = True
+
+        # Run with the caller's context variables (route label for aws_metrics). The
+        # timeout and the breaker's latency run from when the call starts, not from
+        # when it was queued; a call still queued after call_timeout is not sent at all
+        started = threading.Event()
+        timing = {}
+
+        def timed(fn, *args):
+            timing['start'] = time.monotonic()
+            started.set()
+            try:
+                return fn(*args)
+            finally:
+                timing['end'] = time.monotonic()
+
+        call = (self.store.add, batch) if any(batch.values()) else (self.store.read,)
+        future = self._executor.submit(contextvars.copy_context().run, timed, *call)
+        if not started.wait(self.call_timeout) and future.cancel():
+            # Not a verdict on the store, but the breaker must not keep waiting for this call
+            self.breaker.release()
+            with self._lock:
+                for field, n in batch.items():
+                    self._unconfirmed[field] -= n
+                    self._local[field] += n
+            self.fallbacks += 1
+            return self._estimate()
+        started.wait()
+
+        try:
+            totals = future.result(timeout=max(0.0, timing['start'] + self.call_timeout - time.monotonic()))
+        except FutureTimeout:
+            self.breaker.record(time.monotonic() - timing['start'], failed=True)
+            self.timeouts += 1
+            future.add_done_callback(lambda done: self._settle(batch, done))
+            return self._estimate()
+        except Exception as e:
+            self.breaker.record(timing['end'] - timing['start'], failed=True)
+            self.errors += 1
+            self._settle(batch, future)
+            print(f"Counter Store Error: {str(e)}")
+            return self._estimate()
+        self.breaker.record(timing['end'] - timing['start'])
+
+        with self._lock:
+            for field, n in batch.items():
+                self._unconfirmed[field] -= n
+            self._known = totals
+            return {field: totals[field] + self._local[field] for field in COUNTER_FIELDS}
+
+    def _settle(self, batch, future):
+        # A write finished after all: forget its increments if they landed, else send them again
+        with self._lock:
+            for field, n in batch.items():
+                self._unconfirmed[field] -= n
+            if future.exception() is not None:
+                for field, n in batch.items():
+                    self._local[field] += n
+            else:
+                self._known = future.result()
+
+    def _estimate(self):
+        with self._lock:
+            if self._known is None:
+                raise CounterUnavailable("Counter store unavailable and no totals known yet")
+            return {
+                field: self._known[field] + self._local[field] + self._unconfirmed[field]
+                for field in COUNTER_FIELDS
+            }
+
+    def stats(self):
+        with self._lock:
+            local = sum(self._local.values())
+            unconfirmed = sum(self._unconfirmed.values())
+        return {
+            **self.breaker.stats(),
+            'local_increments': local,
+            'unconfirmed_increments': unconfirmed,
+            'fallbacks': self.fallbacks,
+            'timeouts': self.timeouts,
+            'errors': self.errors,
+        }
+
+
+class CounterAggregator:
+    """
+    Write-behind aggregator for the visitor counters.
+
+    Increments are collected in memory and written to the store as one ADD
+    per flush, either every `flush_interval` seconds (background thread) or
+    as soon as `flush_threshold` increments are pending. Callers still get
+    up-to-date totals: the last totals read from the store plus everything
+    not yet persisted.
+    """
+
+    def __init__(self, store, flush_interval=1.0, flush_threshold=100):
+        self.store = store
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+
+        self._lock = threading.Lock()        # guards the counters below
+        self._flush_lock = threading.Lock()  # one flush in flight at a time
+        self._pending = dict.fromkeys(COUNTER_FIELDS, 0)
+        self._inflight = dict.fromkeys(COUNTER_FIELDS, 0)
+        self._base = None
+        self._oldest_pending = None
+        self._last_flush = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.flushes = 0
+        self.flushed_increments = 0
+
+    def start(self):
+        """Start the periodic flusher and flush whatever is left on exit."""
+        if self._thread is None and self.flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name='counter-flusher', daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        try:
+            self.flush()
+        except Exception as e:
+            print(f"Counter Flush Error: {str(e)}")
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Counter Flush Error: {str(e)}")
+
+    def increment(self, field, n=1):
+        """Record `n` increments of `field` and return the current totals."""
+        with self._lock:
+            self._pending[field] += n
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            pending = sum(self._pending.values())
+
+        if pending >= self.flush_threshold:
+            self.flush()
+        return self.counts()
+
+    def counts(self):
+        if self._base is None:
+            # Serialise the first read with flushes so a batch is never counted twice
+            with self._flush_lock:
+                if self._base is None:
+                    base = self.store.read()
+                    with self._lock:
+                        self._base = base
+
+        with self._lock:
+            return {
+                field: self._base[field] + self._inflight[field] + self._pending[field]
+                for field in COUNTER_FIELDS
+            }
+
+    def flush(self):
+        """Write all pending increments to the store in one request."""
+        with self._flush_lock:
+            with self._lock:
+                batch = self._pending
+                if not any(batch.values()):
+                    return
+                oldest = self._oldest_pending
+                self._pending = dict.fromkeys(COUNTER_FIELDS, 0)
+                self._inflight = batch
+                self._oldest_pending = None
+
+            try:
+                totals = self.store.add(batch)
+            except CounterUnavailable:
+                # The store kept the batch itself and will reconcile it; only the totals are missing
+                with self._lock:
+                    self._inflight = dict.fromkeys(COUNTER_FIELDS, 0)
+                raise
+            except Exception:
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    for field, n in batch.items():
+                        self._pending[field] += n
+                    self._inflight = dict.fromkeys(COUNTER_FIELDS, 0)
+                    if self._oldest_pending is None or oldest < self._oldest_pending:
+                        self._oldest_pending = oldest
+                raise
+
+            # The store returns totals that include this batch and any writes
+            # made by other processes since the last flush
+            with self._lock:
+                self._base = totals
+                self._inflight = dict.fromkeys(COUNTER_FIELDS, 0)
+                self._last_flush = time.monotonic()
+                self.flushes += 1
+                self.flushed_increments += sum(batch.values())
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                'pending': sum(self._pending.values()),
+                'flush_lag_seconds': now - self._oldest_pending if self._oldest_pending is not None else 0.0,
+                'seconds_since_flush': now - self._last_flush if self._last_flush is not None else None,
+                'flushes': self.flushes,
+                'flushed_increments': self.flushed_increments,
+            }
@@ -0,0 +1,264 @@
+import base64
+import binascii
+import bisect
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import namedtuple
+
+from serialization import dumps_bytes
+
+# Gallery bucket is in ap-south-1
+GALLERY_REGION = 'ap-south-1'
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.webp')
+
+# Serve a listing for GALLERY_CACHE_TTL seconds, then keep serving it for up to
+# GALLERY_STALE_TTL more seconds while a background refresh fetches a new one
+GALLERY_CACHE_TTL = float(os.environ.get('GALLERY_CACHE_TTL', '300'))
+GALLERY_STALE_TTL = float(os.environ.get('GALLERY_STALE_TTL', '3600'))
+
+# Largest page a client can ask for with ?limit=
+GALLERY_PAGE_MAX = 1000
+
+# URLs per chunk of a ?stream= response. StreamingResponse runs a sync generator
+# in the threadpool one chunk at a time, and S3 lists up to 1000 keys per page,
+# so batching below that costs no latency
+GALLERY_STREAM_BATCH = 100
+
+# details: per-image metadata (dimensions, placeholder) when loaded from the manifest, else None
+GallerySnapshot = namedtuple('GallerySnapshot', ['keys', 'images', 'etag', 'fetched_at', 'details'])
+
+
+def image_url(bucket, key):
+    # Standard S3 Path-Style Public URL format (required for buckets with dots in name to avoid SSL errors)
+    return f"https://s3.{GALLERY_REGION}.amazonaws.com/{bucket}/{key}"
+
+
+def is_image_key(key):
+    return key.lower().endswith(IMAGE_EXTENSIONS) and not key.endswith('/')
+
+
+def iter_gallery_objects(s3_client, bucket, start_after=None):
+    """
+    Yield the list_objects_v2 entry of every image in the gallery bucket, in key order.
+
+    Follows continuation tokens page by page, so the first images are
+    available as soon as the first S3 page arrives.
+    """
+    params = {'Bucket': bucket}
+    if start_after:
+        params['StartAfter'] = start_after
+
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(**params):
+        for obj in page.get('Contents', []):
+            if is_image_key(obj['Key']):
+                yield obj
+
+
+def iter_gallery_images(s3_client, bucket, start_after=None):
+    """Yield (key, url) for every image in the gallery bucket, in key order."""
+    for obj in iter_gallery_objects(s3_client, bucket, start_after):
+        yield obj['Key'], image_url(bucket, obj['Key'])
+
+
+def list_gallery_images(s3_client, bucket):
+    """List (key, url) for every image in the gallery bucket, across all pages."""
+    return list(iter_gallery_images(s3_client, bucket))
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Turn a ?cursor= value back into the key to start after (ValueError if malformed)."""
+    if not re.fullmatch(r'[A-Za-z0-9_-]+', cursor):
+        raise ValueError("Invalid cursor")
+    try:
+        return base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+    except (binascii.Error, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+def parse_limit(limit):
+    """Validate a ?limit= value (ValueError if it is not 1..GALLERY_PAGE_MAX)."""
+    limit = int(limit)
+    if not 1 <= limit <= GALLERY_PAGE_MAX:
+        raise ValueError(f"limit must be between 1 and {GALLERY_PAGE_MAX}")
+    return limit
+
+
+def gallery_page(cache, s3_client, bucket, limit, cursor=None):
+    """
+    One page of the gallery as {'images': [...], 'next_cursor': ...}.
+
+    Served from the cached snapshot when one is usable; otherwise only this
+    page is listed from S3 (StartAfter + early stop) while the cache warms up
+    in the background.
+    """
+    start_after = decode_cursor(cursor) if cursor else None
+
+    snapshot = cache.peek()
+    if snapshot is not None:
+        start = bisect.bisect_right(snapshot.keys, start_after) if start_after else 0
+        keys = snapshot.keys[start:start + limit]
+        images = snapshot.images[start:start + limit]
+        has_more = start + limit < len(snapshot.keys)
+    else:
+        keys, images = [], []
+        has_more = False
+        for key, url in iter_gallery_images(s3_client, bucket, start_after):
+            if len(keys) == limit:
+                has_more = True
+                break
+            keys.append(key)
+            images.append(url)
+
+    return {
+        'images': images,
+        'next_cursor': encode_cursor(keys[-1]) if has_more else None,
+    }
+
+
+def stream_gallery(cache, s3_client, bucket, fmt='ndjson'):
+    """
+    Yield the gallery as encoded chunks of GALLERY_STREAM_BATCH URLs while
+    it is being listed.
+
+    `fmt` is 'ndjson' (one {"url": ...} object per line) or 'json' (the
+    usual {"images": [...]} document, emitted incrementally).
+    """
+    snapshot = cache.peek()
+    if snapshot is not None:
+        urls = iter(snapshot.images)
+    else:
+        urls = (url for _, url in iter_gallery_images(s3_client, bucket))
+
+    if fmt == 'ndjson':
+        for batch in _batches(urls, GALLERY_STREAM_BATCH):
+            yield b''.join(dumps_bytes({'url': url}) + b'\n' for url in batch)
+        return
+
+    yield b'{"images": ['
+    separator = b''
+    for batch in _batches(urls, GALLERY_STREAM_BATCH):
+        yield separator + b', '.join(dumps_bytes(url) for url in batch)
+        separator = b', '
+    yield b']}'
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def etag_matches(if_none_match, etag):
+    """Check an If-None-Match request header against the current ETag."""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(',')]
+    return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+
+
+class GalleryCache:
+    """
+    TTL cache for the gallery listing with stale-while-revalidate.
+
+    A fresh snapshot is returned as is. A stale one is still returned while a
+    single background thread refreshes it. When there is nothing usable the
+    caller loads synchronously, and concurrent callers wait for that one load
+    instead of each listing the bucket.
+
+    With `shared` (a shared_state.SharedState), loads go through the store
+    first, so worker processes reuse one another's listing.
+    """
+
+    def __init__(self, loader, ttl=GALLERY_CACHE_TTL, stale_ttl=GALLERY_STALE_TTL, shared=None):
+        self.loader = loader
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.shared = shared
+        self._snapshot = None
+        self._refresh_lock = threading.Lock()
+
+    def get(self):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                return snapshot
+            if age < self.ttl + self.stale_ttl:
+                self._refresh_in_background()
+                return snapshot
+
+        with self._refresh_lock:
+            # Another caller may have loaded it while we waited
+            snapshot = self._snapshot
+            if snapshot is not None and time.monotonic() - snapshot.fetched_at < self.ttl:
+                return snapshot
+            return self._load()
+
+    def peek(self):
+        """
+        Return a usable snapshot without ever blocking on S3.
+
+        Stale or missing snapshots schedule a background refresh; None is
+        returned when there is nothing that may still be served.
+        """
+        snapshot = self._snapshot
+        age = time.monotonic() - snapshot.fetched_at if snapshot is not None else None
+        if age is not None and age < self.ttl:
+            return snapshot
+
+        self._refresh_in_background()
+        if age is not None and age < self.ttl + self.stale_ttl:
+            return snapshot
+        return None
+
+    def headers(self, snapshot):
+        """Caching headers that let browsers and proxies revalidate with the ETag."""
+        max_age = max(0, int(self.ttl - (time.monotonic() - snapshot.fetched_at)))
+        return {
+            'ETag': snapshot.etag,
+            'Cache-Control': f'public, max-age={max_age}, stale-while-revalidate={int(self.stale_ttl)}',
+        }
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _load(self):
+        # (key, url) per image, or (key, url, details) when read from the manifest
+        if self.shared is not None:
+            entries, age = self.shared.load('gallery', self.ttl, self.loader)
+        else:
+            entries, age = self.loader(), 0.0
+        keys = [entry[0] for entry in entries]
+        images = [entry[1] for entry in entries]
+        details = [entry[2] for entry in entries] if entries and len(entries[0]) > 2 else None
+        digest = hashlib.sha1(json.dumps([images, details]).encode('utf-8')).hexdigest()[:20]
+        snapshot = GallerySnapshot(keys, images, f'"{digest}"', time.monotonic() - age, details)
+        self._snapshot = snapshot
+        return snapshot
+
+    def _refresh_in_background(self):
+        if not self._refresh_lock.acquire(blocking=False):
+            return  # a refresh is already running
+        threading.Thread(target=self._background_refresh, name='gallery-refresh', daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._load()
+        except Exception as e:
+            print(f"Gallery Refresh Error: {str(e)}")
+        finally:
+            self._refresh_lock.release()
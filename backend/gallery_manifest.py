@@ -0,0 +1,286 @@
+"""
+Precomputed gallery manifest.
+
+The manifest is one compact JSON object stored in the gallery bucket that
+lists every image along with its ETag, size, last-modified time, dimensions
+and a tiny placeholder thumbnail. When it exists, GET /gallery serves it
+with a single S3 GET rather than listing the bucket.
+
+manifest_handler rebuilds it on a schedule (GalleryManifestFunction, every
+few minutes), so uploads and deletions show up without a backend deploy.
+The Jenkins pipeline also rebuilds it, with Pillow for the placeholders.
+
+Rebuilds are incremental. Images whose ETag matches the previous manifest
+are carried over as they are, so only new or changed objects are fetched
+(and, in a build with Pillow, images still missing their placeholder).
+Without Pillow, only the first GALLERY_HEADER_BYTES of each image are read
+to get its dimensions, and no placeholder is made.
+
+    python gallery_manifest.py --bucket g2u7a8.photos
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from aws_clients import lazy_client
+from gallery import GALLERY_REGION, image_url, iter_gallery_objects
+from serialization import dumps_bytes
+
+GALLERY_BUCKET_NAME = os.environ.get('GALLERY_BUCKET_NAME', 'g2u7a8.photos')
+# Not an image extension, so the manifest never lists itself
+GALLERY_MANIFEST_KEY = os.environ.get('GALLERY_MANIFEST_KEY', 'gallery-manifest.json')
+MANIFEST_VERSION = 1
+
+# Enough of a file to reach the JPEG frame header past typical EXIF blocks
+GALLERY_HEADER_BYTES = int(os.environ.get('GALLERY_HEADER_BYTES', str(64 * 1024)))
+PLACEHOLDER_SIZE = 16  # Longest side of the placeholder thumbnail, in pixels
+INSPECT_WORKERS = 8
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# JPEG start-of-frame markers (SOF0-SOF15 except DHT, JPG and DAC)
+JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+EXIF_ORIENTATION_TAG = 0x0112
+
+
+def image_dimensions(data):
+    """
+    (width, height) as displayed, parsed from the start of a PNG, JPEG or
+    WebP file, or None if they are not in `data`. JPEGs rotated by their EXIF
+    orientation have their width and height swapped, as browsers do.
+    """
+    try:
+        if data.startswith(PNG_SIGNATURE) and data[12:16] == b'IHDR':
+            return struct.unpack('>II', data[16:24])
+        if data.startswith(b'\xff\xd8'):
+            return _jpeg_dimensions(data)
+        if data.startswith(b'RIFF') and data[8:12] == b'WEBP':
+            return _webp_dimensions(data)
+    except struct.error:
+        pass  # truncated header
+    return None
+
+
+def _jpeg_dimensions(data):
+    orientation = 1
+    i = 2
+    while i + 4 <= len(data):
+        if data[i] != 0xFF:
+            return None
+        marker = data[i + 1]
+        if marker == 0xFF:  # fill byte
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:  # markers without a length
+            i += 2
+            continue
+        length, = struct.unpack('>H', data[i + 2:i + 4])
+        if marker == 0xE1 and data[i + 4:i + 10] == b'Exif\x00\x00':
+            orientation = _exif_orientation(data[i + 10:i + 2 + length]) or orientation
+        elif marker in JPEG_SOF_MARKERS:
+            height, width = struct.unpack('>HH', data[i + 5:i + 9])
+            return (height, width) if orientation >= 5 else (width, height)
+        i += 2 + length
+    return None
+
+
+def _exif_orientation(tiff):
+    order = {b'II': '<', b'MM': '>'}.get(tiff[:2])
+    if order is None:
+        return None
+    ifd, = struct.unpack(order + 'I', tiff[4:8])
+    count, = struct.unpack(order + 'H', tiff[ifd:ifd + 2])
+    for n in range(count):
+        entry = ifd + 2 + n * 12
+        tag, = struct.unpack(order + 'H', tiff[entry:entry + 2])
+        if tag == EXIF_ORIENTATION_TAG:
+            return struct.unpack(order + 'H', tiff[entry + 8:entry + 10])[0]
+    return None
+
+
+def _webp_dimensions(data):
+    chunk = data[12:16]
+    if chunk == b'VP8 ':
+        width, height = struct.unpack('<HH', data[26:30])
+        return width & 0x3FFF, height & 0x3FFF
+    if chunk == b'VP8L':
+        bits, = struct.unpack('<I', data[21:25])
+        return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+    if chunk == b'VP8X':
+        return int.from_bytes(data[24:27], 'little') + 1, int.from_bytes(data[27:30], 'little') + 1
+    return None
+
+
+def make_placeholder(data):
+    """A tiny JPEG thumbnail of the image as a data: URI, or None if it cannot be decoded. Needs Pillow."""
+    from PIL import Image, ImageOps
+
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            img.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))  # Decode JPEGs at reduced scale
+            thumb = ImageOps.exif_transpose(img).convert('RGB')
+            thumb.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+            out = io.BytesIO()
+            thumb.save(out, 'JPEG', quality=60)
+    except Exception as e:
+        print(f"Placeholder Error: {str(e)}")
+        return None
+    return 'data:image/jpeg;base64,' + base64.b64encode(out.getvalue()).decode('ascii')
+
+
+def pillow_available():
+    try:
+        import PIL  # noqa: F401
+        return True
+    except ImportError:
+        return False
+
+
+def inspect_image(s3_client, bucket, obj, placeholders):
+    """The manifest entry for one listed object, reading as little of it as needed."""
+    params = {'Bucket': bucket, 'Key': obj['Key']}
+    if not placeholders:
+        params['Range'] = f'bytes=0-{GALLERY_HEADER_BYTES - 1}'
+    data = s3_client.get_object(**params)['Body'].read()
+
+    dimensions = image_dimensions(data)
+    return {
+        'key': obj['Key'],
+        'url': image_url(bucket, obj['Key']),
+        'etag': obj['ETag'],
+        'size': obj['Size'],
+        'last_modified': obj['LastModified'],
+        'width': dimensions[0] if dimensions else None,
+        'height': dimensions[1] if dimensions else None,
+        'placeholder': make_placeholder(data) if placeholders else None,
+    }
+
+
+def build_manifest(s3_client, bucket, previous=None, placeholders=None):
+    """
+    Scan the bucket and return (manifest, stats).
+
+    Entries from `previous` whose ETag is unchanged are reused; the rest are
+    inspected in parallel. Placeholders are made when Pillow is installed
+    unless `placeholders` says otherwise, and then entries without one are
+    inspected again as well.
+    """
+    if placeholders is None:
+        placeholders = pillow_available()
+    known = {entry['key']: entry for entry in (previous or {}).get('images', [])}
+
+    images = []
+    changed = []
+    for obj in iter_gallery_objects(s3_client, bucket):
+        entry = known.get(obj['Key'])
+        # An entry made without Pillow (the scheduled rebuild) is redone once placeholders can be made
+        missing_placeholder = placeholders and entry is not None and entry['placeholder'] is None
+        if entry is not None and entry['etag'] == obj['ETag'] and not missing_placeholder:
+            images.append(entry)
+        else:
+            changed.append((len(images), obj))
+            images.append(None)
+
+    with ThreadPoolExecutor(max_workers=INSPECT_WORKERS) as pool:
+        entries = pool.map(lambda obj: inspect_image(s3_client, bucket, obj, placeholders),
+                           [obj for _, obj in changed])
+        for (index, _), entry in zip(changed, entries):
+            images[index] = entry
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'bucket': bucket,
+        'generated_at': datetime.now(timezone.utc),
+        'images': images,
+    }
+    stats = {'images': len(images), 'reused': len(images) - len(changed), 'inspected': len(changed)}
+    return manifest, stats
+
+
+def load_manifest(s3_client, bucket, key=GALLERY_MANIFEST_KEY):
+    """The stored manifest for `bucket`, or None if there is no usable one."""
+    # Imported here: botocore is already loaded once a client exists, and the
+    # Lambda handler imports this module on every cold start
+    from botocore.exceptions import ClientError
+
+    try:
+        body = s3_client.get_object(Bucket=bucket, Key=key)['Body'].read()
+    except ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('NoSuchKey', '404'):
+            return None
+        raise
+
+    manifest = json.loads(body)
+    if manifest.get('version') != MANIFEST_VERSION or manifest.get('bucket') != bucket:
+        return None
+    return manifest
+
+
+def save_manifest(s3_client, bucket, manifest, key=GALLERY_MANIFEST_KEY):
+    s3_client.put_object(Bucket=bucket, Key=key, Body=dumps_bytes(manifest),
+                         ContentType='application/json', CacheControl='no-cache')
+
+
+def update_manifest(s3_client, bucket, key=GALLERY_MANIFEST_KEY, full=False, placeholders=None):
+    """Rebuild the stored manifest incrementally, writing it only if an image changed."""
+    previous = None if full else load_manifest(s3_client, bucket, key)
+    manifest, stats = build_manifest(s3_client, bucket, previous, placeholders)
+
+    # Round-trip the new entries so timestamps compare as the stored strings do
+    unchanged = previous is not None and json.loads(dumps_bytes(manifest['images'])) == previous['images']
+    if not unchanged:
+        save_manifest(s3_client, bucket, manifest, key)
+    stats['written'] = not unchanged
+    return stats
+
+
+def manifest_entries(manifest):
+    """(key, url, details) per image, in the form GalleryCache loaders return."""
+    return [
+        (entry['key'], entry['url'],
+         {'width': entry['width'], 'height': entry['height'], 'placeholder': entry['placeholder']})
+        for entry in manifest['images']
+    ]
+
+
+gallery_s3 = lazy_client('s3', GALLERY_REGION, signature_version='s3v4')
+
+
+def manifest_handler(event, context):
+    """
+    Lambda entry point, run on a schedule: pick up images added to, changed
+    in or removed from the gallery bucket since the last rebuild. One listing
+    per run; only new images are read, and the manifest is only written when
+    something changed. It reads image headers only; new images get their
+    placeholder from the next pipeline build, which has Pillow.
+    """
+    stats = update_manifest(gallery_s3, GALLERY_BUCKET_NAME, placeholders=False)
+    if stats['written']:
+        print(f"Gallery manifest rebuilt: {stats['images']} images, {stats['inspected']} inspected")
+    return stats
+
+
+def main():
+    import boto3
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bucket', default=GALLERY_BUCKET_NAME)
+    parser.add_argument('--key', default=GALLERY_MANIFEST_KEY, help='object key of the manifest')
+    parser.add_argument('--region', default=GALLERY_REGION)
+    parser.add_argument('--full', action='store_true', help='inspect every image, ignoring the stored manifest')
+    parser.add_argument('--no-placeholders', dest='placeholders', action='store_const', const=False,
+                        help='only record dimensions, even if Pillow is installed')
+    args = parser.parse_args()
+
+    s3_client = boto3.client('s3', region_name=args.region)
+    stats = update_manifest(s3_client, args.bucket, args.key, args.full, args.placeholders)
+    print(f"{stats['images']} images: {stats['reused']} reused, {stats['inspected']} inspected, "
+          f"manifest {'written' if stats['written'] else 'unchanged'}")
+
+
+if __name__ == '__main__':
+    main()
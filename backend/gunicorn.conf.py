@@ -0,0 +1,55 @@
+"""
+Multi-worker serving profile for the FastAPI app (main.py).
+
+    gunicorn -c gunicorn.conf.py main:app
+
+Runs one uvicorn worker per CPU available to the container (cgroup quota or
+CPU affinity) unless WEB_CONCURRENCY is set. The workers share caches and
+batched counter increments through a SQLite file in /dev/shm (see
+shared_state.py), and Prometheus metrics through PROMETHEUS_MULTIPROC_DIR,
+so /internal/metrics reports the whole server rather than one worker.
+"""
+import math
+import os
+import shutil
+
+
+def available_cpus():
+    # cgroup v2 CPU quota ("max 100000" when unlimited), then the CPUs we may run on
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            return max(1, math.ceil(int(quota) / int(period)))
+    except (OSError, ValueError):
+        pass
+    return len(os.sched_getaffinity(0))
+
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+workers = int(os.environ.get('WEB_CONCURRENCY', available_cpus()))
+worker_class = 'uvicorn_worker.UvicornWorker'
+graceful_timeout = 10  # time for workers to flush batched counts on shutdown
+keepalive = 5
+accesslog = None
+
+# Inherited by the workers, which open these when main.py is imported
+os.environ.setdefault('SHARED_STATE_PATH', '/dev/shm/cloud-resume-state.db')
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/cloud-resume-prometheus')
+
+
+def on_starting(server):
+    # Metric files from a previous run would be added to this one's
+    metrics_dir = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir)
+
+    # Increments a previous run did not get to write are kept and sent by the new workers
+    if os.path.exists(os.environ['SHARED_STATE_PATH']):
+        from shared_state import SharedState
+        SharedState(os.environ['SHARED_STATE_PATH']).reset()
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
@@ -0,0 +1,338 @@
+"""
+Visitor history: views and downloads per minute, hour and day.
+
+The VisitorCounter table's DynamoDB stream is the event log. Each change
+to a counter item carries the old and new totals, and history_handler
+(a second Lambda fed by the stream in batches) appends the differences to
+per-minute buckets in the VisitorHistory table (partition key `resolution`,
+sort key `start`). Neither the serving path nor the counter schema
+changes.
+
+Lambda retries a whole stream batch when the handler fails, so appends
+are idempotent: each bucket remembers the last stream sequence number
+applied per counter item, and a write for a batch it has already seen is
+skipped (a conditional update).
+
+compact() rolls finished hours of minute buckets into hour buckets, then
+finished days into day buckets, and records how far it has got in
+watermarks. Minute and hour buckets expire through the table's TTL once
+they have been rolled up.
+
+GET /visitor/history?window= reads day buckets up to the day watermark,
+hour buckets up to the hour watermark and minute buckets after that, so a
+query touches a number of items proportional to the buckets it returns,
+never to the number of visits.
+"""
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from aws_clients import lazy_table
+from counter import COUNTER_FIELDS, COUNTER_KEY, counts_from_item
+
+HISTORY_TABLE_NAME = os.environ.get('HISTORY_TABLE_NAME', 'VisitorHistory')
+# Results per window are reused for this many seconds
+HISTORY_CACHE_TTL = float(os.environ.get('HISTORY_CACHE_TTL', '30'))
+# An hour is rolled up once it ended this long ago, to let stream records for it arrive
+COMPACTION_DELAY = timedelta(minutes=10)
+# Upper bound on hours rolled up per run, so a long backlog is caught up over several runs
+COMPACTION_MAX_HOURS = 24 * 7
+
+RESOLUTIONS = {
+    'minute': (timedelta(minutes=1), '%Y-%m-%dT%H:%M'),
+    'hour': (timedelta(hours=1), '%Y-%m-%dT%H'),
+    'day': (timedelta(days=1), '%Y-%m-%d'),
+}
+# Minute and hour buckets are kept until their roll-ups are long settled
+RETENTION = {'minute': timedelta(days=2), 'hour': timedelta(days=90), 'day': None}
+
+# ?window= -> (resolution, number of buckets, the last one being the current one)
+HISTORY_WINDOWS = {
+    '1h': ('minute', 60),
+    '24h': ('hour', 24),
+    '7d': ('hour', 168),
+    '30d': ('day', 30),
+    '365d': ('day', 365),
+}
+
+# Coarsest first: which bucket sizes a query at each resolution may read
+_TIERS = {'minute': ('minute',), 'hour': ('hour', 'minute'), 'day': ('day', 'hour', 'minute')}
+_META = {'resolution': 'meta', 'start': 'watermarks'}
+
+
+def floor_to(moment, resolution):
+    if resolution == 'day':
+        return moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    if resolution == 'hour':
+        return moment.replace(minute=0, second=0, microsecond=0)
+    return moment.replace(second=0, microsecond=0)
+
+
+def bucket_key(moment, resolution):
+    return moment.strftime(RESOLUTIONS[resolution][1])
+
+
+def parse_bucket(key, resolution):
+    return datetime.strptime(key, RESOLUTIONS[resolution][1]).replace(tzinfo=timezone.utc)
+
+
+def _numbers(image):
+    # Stream images are in DynamoDB JSON ({'views': {'N': '5'}}); only the counts matter here
+    return {name: int(value['N']) for name, value in image.items() if 'N' in value}
+
+
+def _counter_item(record):
+    """The counter item a stream record changed, or None if it is not a counter insert or update."""
+    if record.get('eventName') not in ('INSERT', 'MODIFY'):
+        return None
+    item_id = record.get('dynamodb', {}).get('Keys', {}).get('id', {}).get('S', '')
+    if item_id != COUNTER_KEY and not item_id.startswith(COUNTER_KEY + '#'):
+        return None
+    return item_id
+
+
+def _sequence(record):
+    # Up to 40 digits, more than a DynamoDB number holds; padded so strings compare in order
+    return record['dynamodb']['SequenceNumber'].zfill(40)
+
+
+def deltas_from_records(records):
+    """
+    {minute: {field: increment}} from DynamoDB stream records of the counter
+    table. Records for other items, removals and decreases are ignored.
+    """
+    minutes = {}
+    for record in records:
+        if _counter_item(record) is None:
+            continue
+        data = record['dynamodb']
+
+        old = counts_from_item(_numbers(data.get('OldImage', {})))
+        new = counts_from_item(_numbers(data.get('NewImage', {})))
+        at = datetime.fromtimestamp(float(data['ApproximateCreationDateTime']), tz=timezone.utc)
+        bucket = minutes.setdefault(floor_to(at, 'minute'), dict.fromkeys(COUNTER_FIELDS, 0))
+        for field in COUNTER_FIELDS:
+            bucket[field] += max(0, new[field] - old[field])
+    return {minute: deltas for minute, deltas in minutes.items() if any(deltas.values())}
+
+
+class HistoryStore:
+    """Reads and writes the time buckets in the VisitorHistory table."""
+
+    def __init__(self, table, cache_ttl=HISTORY_CACHE_TTL):
+        self.table = table
+        self.cache_ttl = cache_ttl
+        self._cache = {}  # window -> (payload, fetched at)
+        self._lock = threading.Lock()
+
+    def append(self, deltas_by_minute, source=None, sequence=None):
+        """
+        ADD each minute's increments to its bucket, and to roll-ups that
+        already cover it. With `source` (a counter item) and `sequence` (the
+        last stream sequence number in the increments), a bucket that has
+        already had increments from that item up to `sequence` is left alone,
+        so a replayed batch is not counted twice.
+        """
+        marks = self.watermarks()
+        for minute, deltas in sorted(deltas_by_minute.items()):
+            self._add('minute', minute, deltas, source, sequence)
+            # Late records for periods that were already rolled up go straight into the roll-ups
+            if marks['hour'] is not None and minute < marks['hour']:
+                self._add('hour', floor_to(minute, 'hour'), deltas, source, sequence)
+            if marks['day'] is not None and minute < marks['day']:
+                self._add('day', floor_to(minute, 'day'), deltas, source, sequence)
+
+    def compact(self, now=None):
+        """Roll finished hours up from minutes and finished days up from hours."""
+        now = now or datetime.now(timezone.utc)
+        marks = self.watermarks()
+        hour_mark = marks['hour'] or self._first_bucket('minute', 'hour') or floor_to(now, 'hour')
+        day_mark = marks['day'] or self._first_bucket('hour', 'day') or floor_to(hour_mark, 'day')
+
+        hours = 0
+        while hour_mark + timedelta(hours=1) <= now - COMPACTION_DELAY and hours < COMPACTION_MAX_HOURS:
+            self._roll_up('minute', 'hour', hour_mark)
+            hour_mark += timedelta(hours=1)
+            hours += 1
+
+        days = 0
+        while day_mark + timedelta(days=1) <= hour_mark:
+            self._roll_up('hour', 'day', day_mark)
+            day_mark += timedelta(days=1)
+            days += 1
+
+        if (hour_mark, day_mark) != (marks['hour'], marks['day']):
+            self.table.put_item(Item={**_META, 'hour': bucket_key(hour_mark, 'hour'),
+                                      'day': bucket_key(day_mark, 'day')})
+        return {'hours': hours, 'days': days}
+
+    def watermarks(self):
+        """Start of the first hour and day that have not been rolled up (None before the first run)."""
+        item = self.table.get_item(Key=_META).get('Item', {})
+        return {
+            'hour': parse_bucket(item['hour'], 'hour') if 'hour' in item else None,
+            'day': parse_bucket(item['day'], 'day') if 'day' in item else None,
+        }
+
+    def history(self, window):
+        """query() for the current time, cached per window for cache_ttl seconds."""
+        if window not in HISTORY_WINDOWS:
+            raise ValueError(f"window must be one of {', '.join(HISTORY_WINDOWS)}")
+        with self._lock:
+            cached = self._cache.get(window)
+        if cached is not None and time.monotonic() - cached[1] < self.cache_ttl:
+            return cached[0]
+
+        payload = self.query(window)
+        with self._lock:
+            self._cache[window] = (payload, time.monotonic())
+        return payload
+
+    def query(self, window, now=None):
+        """
+        The window's buckets, oldest first and zero-filled, with their totals.
+        The last bucket is the current, still growing one.
+        """
+        resolution, count = HISTORY_WINDOWS[window]
+        step = RESOLUTIONS[resolution][0]
+        now = now or datetime.now(timezone.utc)
+        last = floor_to(now, resolution)
+        start = last - step * (count - 1)
+        end = last + step
+
+        buckets = {start + step * i: dict.fromkeys(COUNTER_FIELDS, 0) for i in range(count)}
+        marks = self.watermarks()
+        cursor = start
+        for tier in _TIERS[resolution]:
+            limit = end if tier == 'minute' else marks[tier]
+            if limit is None or limit <= cursor:
+                continue
+            limit = min(limit, end)
+            for moment, counts in self._range(tier, cursor, limit):
+                bucket = buckets[floor_to(moment, resolution)]
+                for field in COUNTER_FIELDS:
+                    bucket[field] += counts[field]
+            cursor = limit
+
+        series = [{'start': moment.isoformat(), **counts} for moment, counts in sorted(buckets.items())]
+        return {
+            'window': window,
+            'resolution': resolution,
+            'buckets': series,
+            'totals': {field: sum(bucket[field] for bucket in series) for field in COUNTER_FIELDS},
+        }
+
+    def _range(self, resolution, start, end):
+        """(bucket start, counts) for the stored buckets in [start, end)."""
+        for item in self._items(resolution, start, end):
+            yield parse_bucket(item['start'], resolution), {f: int(item.get(f, 0)) for f in COUNTER_FIELDS}
+
+    def _items(self, resolution, start, end):
+        last = end - RESOLUTIONS[resolution][0]
+        if last < start:
+            return
+        params = {
+            'KeyConditionExpression': '#r = :r AND #s BETWEEN :first AND :last',
+            'ExpressionAttributeNames': {'#r': 'resolution', '#s': 'start'},
+            'ExpressionAttributeValues': {':r': resolution, ':first': bucket_key(start, resolution),
+                                          ':last': bucket_key(last, resolution)},
+        }
+        while True:
+            response = self.table.query(**params)
+            yield from response.get('Items', [])
+            if 'LastEvaluatedKey' not in response:
+                return
+            params['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def _first_bucket(self, resolution, floor_resolution):
+        response = self.table.query(KeyConditionExpression='#r = :r', ExpressionAttributeNames={'#r': 'resolution'},
+                                    ExpressionAttributeValues={':r': resolution}, Limit=1)
+        items = response.get('Items', [])
+        return floor_to(parse_bucket(items[0]['start'], resolution), floor_resolution) if items else None
+
+    def _roll_up(self, source, target, start):
+        totals = dict.fromkeys(COUNTER_FIELDS, 0)
+        sequences = {}
+        for item in self._items(source, start, start + RESOLUTIONS[target][0]):
+            for field in COUNTER_FIELDS:
+                totals[field] += int(item.get(field, 0))
+            # Carried over, so a replayed batch is not added to the roll-up either
+            for name, value in item.items():
+                if name.startswith('seq:') and value > sequences.get(name, ''):
+                    sequences[name] = value
+        if any(totals.values()):
+            # A plain put, so running the same roll-up twice is harmless
+            self.table.put_item(Item={'resolution': target, 'start': bucket_key(start, target), **totals,
+                                      **sequences, **self._expiry(target, start)})
+
+    def _add(self, resolution, start, deltas, source=None, sequence=None):
+        names = {}
+        values = {}
+        clauses = []
+        for i, field in enumerate(COUNTER_FIELDS):
+            names[f'#f{i}'] = field
+            values[f':n{i}'] = deltas.get(field, 0)
+            clauses.append(f'#f{i} :n{i}')
+        expression = 'ADD ' + ', '.join(clauses)
+
+        assignments = []
+        expiry = self._expiry(resolution, start)
+        if expiry:
+            names['#e'] = 'expires_at'
+            values[':e'] = expiry['expires_at']
+            assignments.append('#e = :e')
+        params = {}
+        if source is not None:
+            names['#q'] = f'seq:{source}'
+            values[':q'] = sequence
+            assignments.append('#q = :q')
+            params['ConditionExpression'] = 'attribute_not_exists(#q) OR #q < :q'
+        if assignments:
+            expression += ' SET ' + ', '.join(assignments)
+
+        client = self.table.meta.client
+        try:
+            self.table.update_item(Key={'resolution': resolution, 'start': bucket_key(start, resolution)},
+                                   UpdateExpression=expression, ExpressionAttributeNames=names,
+                                   ExpressionAttributeValues=values, **params)
+        except client.exceptions.ConditionalCheckFailedException:
+            pass  # Already applied by an earlier attempt at this batch
+
+    def _expiry(self, resolution, start):
+        retention = RETENTION[resolution]
+        if retention is None:
+            return {}
+        return {'expires_at': int((start + retention).timestamp())}
+
+
+history_store = HistoryStore(lazy_table(HISTORY_TABLE_NAME))
+
+
+def history_handler(event, context):
+    """
+    Lambda entry point for the counter table's stream (and a schedule):
+    append the batch's increments, then roll up whatever has finished.
+    """
+    # Grouped per counter item: sequence numbers only order the records of one item
+    by_item = {}
+    for record in event.get('Records', []):
+        item_id = _counter_item(record)
+        if item_id is not None:
+            by_item.setdefault(item_id, []).append(record)
+
+    minutes = set()
+    for item_id, records in by_item.items():
+        deltas = deltas_from_records(records)
+        if deltas:
+            history_store.append(deltas, item_id, max(_sequence(record) for record in records))
+            minutes.update(deltas)
+
+    # A failed roll-up is retried by the next run; failing here would only
+    # replay the stream batch for nothing
+    try:
+        compacted = history_store.compact()
+    except Exception as e:
+        print(f"History Compaction Error: {str(e)}")
+        compacted = None
+    return {'minutes': len(minutes), 'compacted': compacted}
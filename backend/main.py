@@ -1,15 +1,34 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Request, HTTPException
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from prometheus_fastapi_instrumentator import Instrumentator
 from pydantic import BaseModel
-import boto3
+from starlette.background import BackgroundTask
 import os
-import json
-from decimal import Decimal
-from datetime import datetime, timedelta
-from botocore.config import Config
-
-app = FastAPI()
+import aws_metrics
+from async_aws import AWSCallTimeout, ClientDisconnected, run_aws
+from broadcast import CountBroadcaster, TooManySubscribers, sse_stream
+from cloudwatch_metrics import METRICS_WINDOW_HOURS
+from gallery import stream_gallery
+from ratelimit import client_address
+from serialization import dumps_bytes
+from service import VisitorService
+from shared_state import open_shared_state
+
+@asynccontextmanager
+async def lifespan(app):
+    service.start()
+    yield
+    service.close()
+
+# Responses are encoded by serialization.dumps_bytes (orjson when installed),
+# which handles Decimals and datetimes itself
+class FastJSONResponse(JSONResponse):
+    def render(self, content):
+        return dumps_bytes(content)
+
+app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
 
 # Input Models
 class VisitorAction(BaseModel):
@@ -25,150 +44,123 @@ app.add_middleware(
 )
 
 # Prometheus Instrumentation
-Instrumentator().instrument(app).expose(app)
+# Served on its own path: /metrics is the CloudWatch dashboard route below
+PROMETHEUS_METRICS_PATH = os.environ.get('PROMETHEUS_METRICS_PATH', '/internal/metrics')
+Instrumentator(excluded_handlers=[PROMETHEUS_METRICS_PATH]).instrument(app).expose(
+    app, endpoint=PROMETHEUS_METRICS_PATH, include_in_schema=False)
+
+# Latency, retries and throttling of every AWS call, per operation, region and route
+aws_metrics.install()
+app.add_middleware(aws_metrics.RouteLabelMiddleware, routes=lambda: [route.path for route in app.routes])
 
 # Initialize AWS Clients
-# In K8s, these will pick up IAM Roles for Service Accounts (IRSA) or Env Vars
-dynamodb = boto3.resource('dynamodb', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+# In K8s, these will pick up IAM Roles for Service Accounts (IRSA) or Env Vars.
+# Clients, caches and the counter live in service.py, shared with the Lambda handler.
+AWS_REGION = os.environ.get('AWS_REGION', 'us-east-1')
 TABLE_NAME = os.environ.get('TABLE_NAME', 'VisitorCounter')
-table = dynamodb.Table(TABLE_NAME)
-
-s3 = boto3.client('s3', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
 BUCKET_NAME = os.environ.get('BUCKET_NAME', 'gauravyadav.site')
 GALLERY_BUCKET_NAME = os.environ.get('GALLERY_BUCKET_NAME', 'g2u7a8.photos')
 
-cloudwatch = boto3.client('cloudwatch', region_name=os.environ.get('AWS_REGION', 'us-east-1'))
+# Write-behind counter: views/downloads are batched in memory and flushed as one ADD
+# every COUNTER_FLUSH_INTERVAL seconds or COUNTER_FLUSH_THRESHOLD increments (0 disables)
+COUNTER_FLUSH_INTERVAL = float(os.environ.get('COUNTER_FLUSH_INTERVAL', '1.0'))
+COUNTER_FLUSH_THRESHOLD = int(os.environ.get('COUNTER_FLUSH_THRESHOLD', '100'))
+
+# Under gunicorn (gunicorn.conf.py) the workers share caches and batched counts
+# through SHARED_STATE_PATH; unset, everything stays in this process
+service = VisitorService(TABLE_NAME, GALLERY_BUCKET_NAME, AWS_REGION,
+                         flush_interval=COUNTER_FLUSH_INTERVAL, flush_threshold=COUNTER_FLUSH_THRESHOLD,
+                         shared=open_shared_state())
+gallery_cache = service.gallery_cache
+counter = service.counter
+
+# Live counts for GET /visitor/stream: one read loop per process, however many streams are open
+async def read_counts():
+    return await run_aws(service.current_counts)
+
+broadcaster = CountBroadcaster(read_counts)
 
-# Helper
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return int(obj)
-        return super(DecimalEncoder, self).default(obj)
+# Routes are async: blocking boto3 calls go through aws_call(), which runs them on
+# the dedicated AWS executor with a timeout and gives up if the client disconnects
+async def aws_call(fn, *args, request=None):
+    try:
+        return await run_aws(fn, *args, request=request)
+    except AWSCallTimeout as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except ClientDisconnected:
+        # Nobody is listening any more; 499 is nginx's "client closed request"
+        raise HTTPException(status_code=499, detail="Client disconnected")
+
+def respond(reply):
+    """Turn a service.Reply into a FastAPI response."""
+    if reply.status >= 400:
+        raise HTTPException(status_code=reply.status, detail=reply.body['error'], headers=reply.headers or None)
+    if reply.body is None:
+        return Response(status_code=reply.status, headers=reply.headers)
+    return FastJSONResponse(reply.body, status_code=reply.status, headers=reply.headers)
 
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 @app.get("/gallery")
-def get_gallery():
-    try:
-        # Gallery bucket is in ap-south-1
-        s3_gallery = boto3.client('s3', region_name='ap-south-1', config=Config(signature_version='s3v4'))
-        
-        response = s3_gallery.list_objects_v2(Bucket=GALLERY_BUCKET_NAME)
-        image_urls = []
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                key = obj['Key']
-                if key.lower().endswith(('.jpg', '.jpeg', '.png', '.webp')) and not key.endswith('/'):
-                    url = f"https://s3.ap-south-1.amazonaws.com/{GALLERY_BUCKET_NAME}/{key}"
-                    image_urls.append(url)
-        
-        return {"images": image_urls}
-    except Exception as e:
-        print(f"S3 Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def get_gallery(request: Request):
+    params = request.query_params
+
+    # ?stream=ndjson|json: send URLs while S3 pages are still arriving
+    stream = params.get('stream')
+    if stream:
+        if stream not in ('ndjson', 'json'):
+            raise HTTPException(status_code=400, detail="stream must be 'ndjson' or 'json'")
+        media_type = 'application/x-ndjson' if stream == 'ndjson' else 'application/json'
+        return StreamingResponse(stream_gallery(gallery_cache, service.s3_gallery, GALLERY_BUCKET_NAME, stream),
+                                 media_type=media_type)
+
+    # ?limit=&cursor=: one page at a time; otherwise the cached listing with ETag/304
+    return respond(await aws_call(service.gallery, params, request.headers.get('if-none-match'), request=request))
 
 @app.get("/metrics")
-def get_metrics():
-    try:
-        end_time = datetime.utcnow()
-        start_time = end_time - timedelta(days=1)
-        
-        # We need to know the *Function Name* if looking up Lambda metrics, 
-        # BUT since we are now on K8s, old CloudWatch Lambda metrics won't apply to this new app directly
-        # UNLESS we are still monitoring the old Lambda.
-        # For transition, we will return empty or mock data, or look up specific metrics if defined.
-        # Let's assume we want to view the OLD Lambda's metrics for now until we add Prometheus.
-        
-        function_name = "VisitorCounterFunction"
-        
-        invocations = cloudwatch.get_metric_statistics(
-            Namespace='AWS/Lambda',
-            MetricName='Invocations',
-            Dimensions=[{'Name': 'FunctionName', 'Value': function_name}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,
-            Statistics=['Sum']
-        )
-        
-        latency = cloudwatch.get_metric_statistics(
-            Namespace='AWS/Lambda',
-            MetricName='Duration',
-            Dimensions=[{'Name': 'FunctionName', 'Value': function_name}],
-            StartTime=start_time,
-            EndTime=end_time,
-            Period=3600,
-            Statistics=['Average']
-        )
-        
-        def sort_points(points):
-            return sorted(points, key=lambda x: x['Timestamp'])
-
-        sorted_invocations = sort_points(invocations['Datapoints'])
-        sorted_latency = sort_points(latency['Datapoints'])
-
-        total_invocations = sum(item['Sum'] for item in sorted_invocations)
-        
-        if sorted_latency:
-            avg_duration = sum(item['Average'] for item in sorted_latency) / len(sorted_latency)
-        else:
-            avg_duration = 0.0
-            
-        chart_data = []
-        for point in sorted_latency:
-            chart_data.append({
-                'timestamp': point['Timestamp'].isoformat(),
-                'value': point['Average']
-            })
-
-        return {
-            'invocations': sorted_invocations,
-            'latency': sorted_latency,
-            'total_invocations': total_invocations,
-            'avg_duration': avg_duration,
-            'chart_data': chart_data
-        }
-
-    except Exception as e:
-        print(f"Metrics Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+async def get_metrics(request: Request, hours: int = METRICS_WINDOW_HOURS):
+    # We need to know the *Function Name* if looking up Lambda metrics,
+    # BUT since we are now on K8s, old CloudWatch Lambda metrics won't apply to this new app directly
+    # UNLESS we are still monitoring the old Lambda.
+    # Let's assume we want to view the OLD Lambda's metrics for now until we add Prometheus.
+    function_name = "VisitorCounterFunction"
+
+    return respond(await aws_call(service.metrics, function_name, hours, request=request))
 
 @app.post("/visitor")
-def update_visitor(data: VisitorAction):
+async def update_visitor(data: VisitorAction, request: Request):
+    client_ip = client_address(request.client.host if request.client else None, request.headers.get('x-forwarded-for'))
+    reply = await aws_call(service.record_visit, data.action, client_ip, request.headers.get('user-agent'),
+                           request=request)
+    if reply.status == 200:
+        broadcaster.notify()
+    return respond(reply)
+
+@app.get("/visitor/stream")
+async def stream_visitor_counts():
+    # Server-Sent Events: a "counts" event with { views, downloads } on every change,
+    # at most SSE_MAX_UPDATES_PER_SECOND per second
     try:
-        action = data.action
-        if action == 'download':
-            update_expression = "SET #d = if_not_exists(#d, :start) + :inc"
-            expression_attribute_names = {'#d': 'downloads'}
-        else:
-            update_expression = "SET #v = if_not_exists(#v, :start) + :inc"
-            expression_attribute_names = {'#v': 'views'}
-
-        table.update_item(
-            Key={'id': 'visitor_stats'},
-            UpdateExpression=update_expression,
-            ExpressionAttributeNames=expression_attribute_names,
-            ExpressionAttributeValues={
-                ':inc': 1,
-                ':start': 0
-            },
-            ReturnValues="UPDATED_NEW"
-        )
-        
-        final_item = table.get_item(Key={'id': 'visitor_stats'})
-        item = final_item.get('Item', {})
-        
-        views_count = int(item.get('views', item.get('count', 0)))
-        downloads_count = int(item.get('downloads', 0))
-
-        return {
-            'views': views_count,
-            'downloads': downloads_count
-        }
-
-    except Exception as e:
-        print(f"DB Error: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        subscription = broadcaster.subscribe()
+    except TooManySubscribers as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': '30'})
+
+    return StreamingResponse(
+        sse_stream(subscription),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        # Also runs if the client leaves before the stream starts
+        background=BackgroundTask(subscription.close),
+    )
+
+@app.get("/visitor/history")
+async def get_visitor_history(request: Request, window: str = '24h'):
+    # Pre-aggregated minute/hour/day buckets, so the cost depends on the window, not the traffic
+    return respond(await aws_call(service.visitor_history, window, request=request))
+
+@app.get("/visitor/stats")
+async def get_visitor_stats():
+    reply = service.visitor_stats()
+    return respond(reply._replace(body={**reply.body, 'stream': broadcaster.stats()}))
@@ -0,0 +1,186 @@
+"""
+Abuse protection for POST /visitor.
+
+A per-client token bucket caps how fast one address can hit the counter, and
+a time-windowed dedup set turns repeated views from the same visitor into
+reads of counts that are already cached. Both keep state in bounded LRU
+maps in process memory. Set RATE_LIMIT_BACKEND=redis (with REDIS_URL and the
+redis package installed) to share that state between processes and pods.
+"""
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Token bucket per client address: VISITOR_RATE_LIMIT requests/second sustained,
+# bursts of up to VISITOR_RATE_BURST (0 disables)
+VISITOR_RATE_LIMIT = float(os.environ.get('VISITOR_RATE_LIMIT', '2'))
+VISITOR_RATE_BURST = float(os.environ.get('VISITOR_RATE_BURST', '20'))
+# A visitor's repeated views within this many seconds are only counted once (0 disables)
+VISITOR_DEDUP_WINDOW = float(os.environ.get('VISITOR_DEDUP_WINDOW', '300'))
+RATE_LIMIT_MAX_CLIENTS = int(os.environ.get('RATE_LIMIT_MAX_CLIENTS', '100000'))  # Per map, LRU-evicted
+RATE_LIMIT_BACKEND = os.environ.get('RATE_LIMIT_BACKEND', 'memory')  # 'memory' or 'redis'
+REDIS_URL = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+# Number of reverse proxies in front of the app that append to X-Forwarded-For.
+# 0 uses the socket peer address, which is only right without a proxy.
+TRUSTED_PROXY_HOPS = int(os.environ.get('TRUSTED_PROXY_HOPS', '0'))
+
+
+def client_address(peer, forwarded_for=None, hops=TRUSTED_PROXY_HOPS):
+    """
+    The client's IP address. With `hops` trusted proxies, that is the entry
+    the outermost one appended to X-Forwarded-For. Entries further left are
+    supplied by the client and can be forged.
+    """
+    if hops > 0 and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(',')]
+        if len(addresses) >= hops:
+            return addresses[-hops]
+    return peer
+
+
+def fingerprint(*parts):
+    """Fixed-size key for a visitor (address + user agent), so the maps stay bounded."""
+    return hashlib.blake2b('|'.join(part or '' for part in parts).encode('utf-8'), digest_size=12).hexdigest()
+
+
+class TokenBucketLimiter:
+    """
+    In-memory token buckets, one per key, in an LRU map of at most `max_keys`.
+
+    An evicted client simply starts again with a full bucket.
+    """
+
+    def __init__(self, rate=VISITOR_RATE_LIMIT, burst=VISITOR_RATE_BURST, max_keys=RATE_LIMIT_MAX_CLIENTS,
+                 clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self.clock = clock
+        self._buckets = OrderedDict()  # key -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def allow(self, key):
+        """Take a token for `key`. Returns (allowed, seconds until the next token)."""
+        now = self.clock()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = self._buckets[key] = [self.burst, now]
+                if len(self._buckets) > self.max_keys:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(key)
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+                bucket[1] = now
+
+            if bucket[0] >= 1:
+                bucket[0] -= 1
+                return True, 0.0
+            return False, (1 - bucket[0]) / self.rate
+
+
+class DedupWindow:
+    """
+    Remembers keys for `window` seconds, in an LRU map of at most `max_keys`.
+
+    Entries are kept in first-seen order, so expired ones are dropped from the
+    front as new keys arrive.
+    """
+
+    def __init__(self, window=VISITOR_DEDUP_WINDOW, max_keys=RATE_LIMIT_MAX_CLIENTS, clock=time.monotonic):
+        self.window = window
+        self.max_keys = max_keys
+        self.clock = clock
+        self._seen = OrderedDict()  # key -> first seen
+        self._lock = threading.Lock()
+
+    def seen(self, key):
+        """True if `key` was already seen in the window; otherwise remember it and return False."""
+        now = self.clock()
+        with self._lock:
+            first = self._seen.get(key)
+            if first is not None and now - first < self.window:
+                return True
+            self._seen.pop(key, None)
+            self._seen[key] = now
+
+            while self._seen:
+                oldest_key, oldest = next(iter(self._seen.items()))
+                if now - oldest < self.window and len(self._seen) <= self.max_keys:
+                    break
+                del self._seen[oldest_key]
+            return False
+
+    def forget(self, key):
+        """Drop `key`, so its next appearance is not a repeat (e.g. the first one failed)."""
+        with self._lock:
+            self._seen.pop(key, None)
+
+
+# KEYS[1] = bucket key; ARGV = rate, burst, now. Returns {allowed, tokens}.
+_TOKEN_BUCKET_SCRIPT = """
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local ts = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(tokens)}
+"""
+
+
+class RedisTokenBucketLimiter:
+    """TokenBucketLimiter with the buckets in Redis, updated atomically by a Lua script."""
+
+    def __init__(self, client, rate=VISITOR_RATE_LIMIT, burst=VISITOR_RATE_BURST, prefix='ratelimit:'):
+        self.rate = rate
+        self.burst = burst
+        self.prefix = prefix
+        self._script = client.register_script(_TOKEN_BUCKET_SCRIPT)
+
+    def allow(self, key):
+        allowed, tokens = self._script(keys=[self.prefix + key], args=[self.rate, self.burst, time.time()])
+        if allowed:
+            return True, 0.0
+        return False, (1 - float(tokens)) / self.rate
+
+
+class RedisDedupWindow:
+    """DedupWindow backed by Redis keys that expire after the window."""
+
+    def __init__(self, client, window=VISITOR_DEDUP_WINDOW, prefix='dedup:'):
+        self.client = client
+        self.window = window
+        self.prefix = prefix
+
+    def seen(self, key):
+        # SET NX only succeeds for the first view in the window
+        return not self.client.set(self.prefix + key, 1, nx=True, ex=max(1, math.ceil(self.window)))
+
+    def forget(self, key):
+        self.client.delete(self.prefix + key)
+
+
+def make_guards(rate=VISITOR_RATE_LIMIT, burst=VISITOR_RATE_BURST, window=VISITOR_DEDUP_WINDOW,
+                backend=RATE_LIMIT_BACKEND):
+    """(limiter, dedup) for the configured backend; either is None when disabled."""
+    if backend == 'redis':
+        try:
+            import redis
+            client = redis.Redis.from_url(REDIS_URL)
+            return (RedisTokenBucketLimiter(client, rate, burst) if rate > 0 else None,
+                    RedisDedupWindow(client, window) if window > 0 else None)
+        except ImportError:
+            print("Rate Limit Error: redis is not installed, using in-memory rate limiting")
+
+    return (TokenBucketLimiter(rate, burst) if rate > 0 else None,
+            DedupWindow(window) if window > 0 else None)
@@ -0,0 +1,46 @@
+"""
+JSON encoding for response bodies.
+
+Uses orjson when it is installed. orjson encodes datetimes natively and runs
+the Decimal hook in C. Without orjson, the standard library json module is
+used with the same hook. Both produce the same JSON for our payloads:
+DynamoDB Decimals become ints (or floats when fractional), and datetimes
+become ISO 8601 strings.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def default(obj):
+    """Encode the types the json module can't: DynamoDB Decimals and datetimes."""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+    BACKEND = 'orjson'
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS)
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=default, option=orjson.OPT_NON_STR_KEYS).decode()
+else:
+    BACKEND = 'json'
+
+    _encoder = json.JSONEncoder(default=default, separators=(',', ':'))
+
+    def dumps_bytes(obj):
+        return _encoder.encode(obj).encode()
+
+    def dumps(obj):
+        return _encoder.encode(obj)
@@ -0,0 +1,231 @@
+"""
+Request handling shared by the Lambda handler (lambda_function.py) and the
+FastAPI app (main.py).
+
+Each entry point builds one VisitorService with its own defaults and only
+translates between its transport and the Reply objects returned here, so
+caching, batching and error handling behave the same on both.
+"""
+import math
+import threading
+from collections import namedtuple
+
+from aws_clients import lazy_client, lazy_table
+from cloudwatch_metrics import METRICS_WINDOW_HOURS, MetricsCache
+from counter import (
+    COUNTER_BREAKER, CounterAggregator, CounterUnavailable, ResilientCounterStore, field_for_action,
+    make_counter_store,
+)
+from gallery import (
+    GALLERY_PAGE_MAX, GALLERY_REGION, GalleryCache, etag_matches, gallery_page,
+    list_gallery_images, parse_limit,
+)
+from gallery_manifest import GALLERY_MANIFEST_KEY, load_manifest, manifest_entries
+from history import HISTORY_TABLE_NAME, HistoryStore
+from ratelimit import fingerprint, make_guards
+from shared_state import SharedCounterAggregator
+
+# status: HTTP status, body: JSON-serializable payload (None for an empty body),
+# headers: extra response headers
+Reply = namedtuple('Reply', ['status', 'body', 'headers'])
+
+
+def ok(body, headers=None):
+    return Reply(200, body, headers or {})
+
+
+def error(status, message):
+    return Reply(status, {'error': message}, {})
+
+
+class VisitorService:
+    """The AWS clients, caches and visitor counter behind every route."""
+
+    def __init__(self, table_name, gallery_bucket, region=None, flush_interval=0, flush_threshold=100,
+                 guards=None, shared=None):
+        # shared: a shared_state.SharedState when several worker processes serve
+        # together; caches and batched counts then live there instead of in process
+        # Clients come from the shared registry and are only built on first use
+        self.table = lazy_table(table_name, region)
+
+        # IMPORTANT: Gallery bucket is in ap-south-1, so it needs a regional
+        # client (with SigV4, which ap-south-1 requires) to sign URLs correctly
+        self.s3_gallery = lazy_client('s3', GALLERY_REGION, signature_version='s3v4')
+        self.gallery_bucket = gallery_bucket
+        self.gallery_manifest_key = GALLERY_MANIFEST_KEY
+        self.gallery_cache = GalleryCache(self.load_gallery, shared=shared)
+
+        self.cloudwatch = lazy_client('cloudwatch', region)
+        self.metrics_cache = MetricsCache(self.cloudwatch, shared=shared)
+
+        # One item, or COUNTER_SHARDS shard items for higher write throughput,
+        # behind a circuit breaker that counts locally while DynamoDB is down
+        self.counter_store = make_counter_store(self.table)
+        if COUNTER_BREAKER:
+            self.counter_store = ResilientCounterStore(self.counter_store)
+
+        # Optional write-behind batching of increments (see counter.CounterAggregator)
+        self.counter = None
+        if flush_interval > 0 and shared is not None:
+            self.counter = SharedCounterAggregator(self.counter_store, shared, flush_interval, flush_threshold)
+        elif flush_interval > 0:
+            self.counter = CounterAggregator(self.counter_store, flush_interval, flush_threshold)
+
+        # Views and downloads over time, written from the counter table's stream (see history.py)
+        self.history = HistoryStore(lazy_table(HISTORY_TABLE_NAME, region))
+
+        # Per-client rate limit and view dedup in front of the counter (see ratelimit.py)
+        self.limiter, self.dedup = guards if guards is not None else make_guards()
+        self._last_counts = None
+        self._last_counts_lock = threading.Lock()
+        self.duplicate_views = 0
+        self.rate_limited = 0
+
+    def load_gallery(self):
+        """
+        Gallery entries from the precomputed manifest (one GET), or from a
+        bucket listing when there is none (see gallery_manifest.py).
+        """
+        if self.gallery_manifest_key:
+            manifest = load_manifest(self.s3_gallery, self.gallery_bucket, self.gallery_manifest_key)
+            if manifest is not None:
+                return manifest_entries(manifest)
+        return list_gallery_images(self.s3_gallery, self.gallery_bucket)
+
+    def start(self):
+        """Start the background flushing and reconciliation threads (long-running servers)."""
+        if self.counter is not None:
+            self.counter.start()
+        if isinstance(self.counter_store, ResilientCounterStore):
+            self.counter_store.start()
+
+    def close(self):
+        # Flush batched increments into the store before it reconciles for the last time
+        if self.counter is not None:
+            self.counter.close()
+        if isinstance(self.counter_store, ResilientCounterStore):
+            self.counter_store.close()
+
+    def gallery(self, params, if_none_match=None):
+        """
+        GET /gallery: the cached listing (with ETag/304), or one page for
+        ?limit=&cursor=. ?details=1 adds each image's dimensions and
+        placeholder when the listing came from the manifest.
+        """
+        try:
+            if 'limit' in params or 'cursor' in params:
+                limit = parse_limit(params.get('limit', GALLERY_PAGE_MAX))
+                return ok(gallery_page(self.gallery_cache, self.s3_gallery, self.gallery_bucket,
+                                       limit, params.get('cursor')))
+
+            snapshot = self.gallery_cache.get()
+        except ValueError as e:
+            return error(400, str(e))
+        except Exception as e:
+            print(f"S3 Error: {str(e)}")
+            return error(500, 'Failed to fetch gallery images')
+
+        headers = self.gallery_cache.headers(snapshot)
+        if etag_matches(if_none_match, snapshot.etag):
+            return Reply(304, None, headers)
+        body = {'images': snapshot.images}
+        if params.get('details') not in (None, '', '0', 'false'):
+            body['details'] = snapshot.details
+        return ok(body, headers)
+
+    def metrics(self, function_name, hours=METRICS_WINDOW_HOURS):
+        """GET /metrics: Invocations and Duration for the last `hours`."""
+        try:
+            return ok(self.metrics_cache.get(function_name, int(hours)))
+        except ValueError as e:
+            return error(400, str(e))
+        except Exception as e:
+            print(f"Metrics Error: {str(e)}")
+            return error(500, str(e))
+
+    def record_visit(self, action='view', client_ip=None, user_agent=None):
+        """
+        POST /visitor: count a view or download and return { views, downloads }.
+
+        When the client is known, it is rate limited by address (429), and a
+        repeat view by the same address and user agent within the dedup
+        window returns the cached counts without writing. A view whose write
+        is lost is forgotten again, so the client's retry is counted; one the
+        store kept for later (CounterUnavailable) stays remembered.
+        """
+        remembered = None
+        try:
+            field = field_for_action(action)
+            if client_ip is not None:
+                if self.limiter is not None:
+                    allowed, retry_after = self.limiter.allow(client_ip)
+                    if not allowed:
+                        self.rate_limited += 1
+                        reply = error(429, 'Too many requests')
+                        return reply._replace(headers={'Retry-After': str(math.ceil(retry_after))})
+
+                if field == 'views' and self.dedup is not None:
+                    key = fingerprint(client_ip, user_agent)
+                    if self.dedup.seen(key):
+                        self.duplicate_views += 1
+                        return ok(self.cached_counts())
+                    remembered = key
+
+            if self.counter is not None:
+                # Usually in-memory only, but a threshold flush writes to DynamoDB inline
+                return ok(self.counter.increment(field))
+
+            # The update returns the complete stats in the same round trip
+            counts = self.counter_store.add({field: 1})
+            with self._last_counts_lock:
+                self._last_counts = counts
+            return ok(counts)
+        except CounterUnavailable as e:
+            # The increment is kept and reconciled later, so a retry would count it twice
+            print(f"DB Error: {str(e)}")
+            return error(500, str(e))
+        except Exception as e:
+            print(f"DB Error: {str(e)}")
+            if remembered is not None:
+                self.dedup.forget(remembered)
+            return error(500, str(e))
+
+    def cached_counts(self):
+        """The most recent totals this process has seen, reading them only if it has none."""
+        if self.counter is not None:
+            return self.counter.counts()
+        with self._last_counts_lock:
+            counts = self._last_counts
+        if counts is None:
+            counts = self.current_counts()
+        return counts
+
+    def current_counts(self):
+        """Totals as this process knows them (in memory when batching, else one read)."""
+        if self.counter is not None:
+            return self.counter.counts()
+        counts = self.counter_store.read()
+        with self._last_counts_lock:
+            self._last_counts = counts
+        return counts
+
+    def visitor_history(self, window='24h'):
+        """GET /visitor/history: views and downloads per bucket over ?window= (1h, 24h, 7d, 30d, 365d)."""
+        try:
+            return ok(self.history.history(window))
+        except ValueError as e:
+            return error(400, str(e))
+        except Exception as e:
+            print(f"History Error: {str(e)}")
+            return error(500, str(e))
+
+    def visitor_stats(self):
+        """GET /visitor/stats: write-behind batching, circuit breaker and abuse protection state."""
+        stats = {'batching': self.counter is not None}
+        if self.counter is not None:
+            stats.update(self.counter.stats())
+        if isinstance(self.counter_store, ResilientCounterStore):
+            stats['circuit'] = self.counter_store.stats()
+        stats['duplicate_views'] = self.duplicate_views
+        stats['rate_limited'] = self.rate_limited
+        return ok(stats)
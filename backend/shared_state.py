@@ -0,0 +1,302 @@
+"""
+State shared by the worker processes of one server (see gunicorn.conf.py).
+
+A small SQLite database, by default in /dev/shm, holds:
+  * cache entries (gallery listing, metrics payloads) with an expiry, so a
+    listing fetched by one worker is reused by the others
+  * leases, so only one worker at a time loads a missing entry or flushes
+    the counters
+  * the counter's pending increments, the batch being written and the last
+    totals read from DynamoDB, so every worker reports the same counts and
+    the host sends one ADD per flush interval instead of one per worker
+
+SQLite serialises writers with its own file locks, which is plenty for a
+handful of workers. Values are stored as JSON, so datetimes come back as
+ISO strings.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from counter import COUNTER_FIELDS, CounterAggregator, CounterUnavailable
+from serialization import dumps_bytes
+
+# Empty keeps all state in process (the default for a single worker)
+SHARED_STATE_PATH = os.environ.get('SHARED_STATE_PATH', '')
+# How long a worker waits for another one that is loading the same entry
+SHARED_LOAD_WAIT = float(os.environ.get('SHARED_LOAD_WAIT', '5'))
+# A claimed counter batch older than this belonged to a worker that died mid-flush
+STALE_FLUSH_SECONDS = 30
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB, stored_at REAL, expires_at REAL);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, owner TEXT, expires_at REAL);
+CREATE TABLE IF NOT EXISTS counter (field TEXT PRIMARY KEY, pending INTEGER, inflight INTEGER, base INTEGER);
+CREATE TABLE IF NOT EXISTS counter_meta (id INTEGER PRIMARY KEY CHECK (id = 1), oldest_pending REAL,
+                                         claimed_at REAL, last_flush REAL, flushes INTEGER,
+                                         flushed_increments INTEGER);
+"""
+
+
+class SharedState:
+    def __init__(self, path, owner=None):
+        self.path = path
+        self.owner = owner or str(os.getpid())  # lease holder id, one per worker
+        self._local = threading.local()
+        db = self._db()
+        db.executescript(_SCHEMA)
+        with self._transaction() as db:
+            db.executemany('INSERT OR IGNORE INTO counter VALUES (?, 0, 0, NULL)', [(f,) for f in COUNTER_FIELDS])
+            db.execute('INSERT OR IGNORE INTO counter_meta VALUES (1, NULL, NULL, NULL, 0, 0)')
+
+    def reset(self):
+        """Forget cached values, leases and totals left by a previous server run, keeping unsent increments."""
+        with self._transaction() as db:
+            db.execute('DELETE FROM cache')
+            db.execute('DELETE FROM leases')
+            db.execute('UPDATE counter SET pending = pending + inflight, inflight = 0, base = NULL')
+            db.execute('UPDATE counter_meta SET claimed_at = NULL')
+
+    def _db(self):
+        # One connection per thread; sqlite3 connections can't be shared between threads
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    def _transaction(self):
+        return _Transaction(self._db())
+
+    # Cache
+
+    def get(self, key):
+        """(value, seconds since it was stored), or None if missing or expired."""
+        now = time.time()
+        row = self._db().execute('SELECT value, stored_at FROM cache WHERE key = ? AND expires_at > ?',
+                                 (key, now)).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), max(0.0, now - row[1])
+
+    def set(self, key, value, ttl):
+        now = time.time()
+        self._db().execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                           (key, dumps_bytes(value), now, now + ttl))
+
+    def load(self, key, ttl, loader, wait=SHARED_LOAD_WAIT):
+        """
+        (value, age) for `key`, calling `loader` only if no worker has stored a
+        fresh value. When another worker is already loading it, wait up to
+        `wait` seconds for its result before loading here as well.
+        """
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+
+        lease = f'load:{key}'
+        deadline = time.monotonic() + wait
+        while not self.acquire(lease, wait):
+            time.sleep(0.02)
+            hit = self.get(key)
+            if hit is not None:
+                return hit
+            if time.monotonic() > deadline:
+                return loader(), 0.0
+        try:
+            hit = self.get(key)  # stored while we were acquiring the lease
+            if hit is not None:
+                return hit
+            value = loader()
+            self.set(key, value, ttl)
+            return value, 0.0
+        finally:
+            self.release(lease)
+
+    # Leases
+
+    def acquire(self, name, ttl):
+        """Take (or renew) the named lease for `ttl` seconds if it is free or ours."""
+        now = time.time()
+        with self._transaction() as db:
+            row = db.execute('SELECT owner, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+            if row is not None and row[0] != self.owner and row[1] > now:
+                return False
+            db.execute('INSERT OR REPLACE INTO leases VALUES (?, ?, ?)', (name, self.owner, now + ttl))
+            return True
+
+    def release(self, name):
+        self._db().execute('DELETE FROM leases WHERE name = ? AND owner = ?', (name, self.owner))
+
+    # Counter
+
+    def add_pending(self, deltas):
+        """Add increments to the shared pending batch and return its new size."""
+        with self._transaction() as db:
+            for field, n in deltas.items():
+                db.execute('UPDATE counter SET pending = pending + ? WHERE field = ?', (n, field))
+            db.execute('UPDATE counter_meta SET oldest_pending = COALESCE(oldest_pending, ?)', (time.time(),))
+            return db.execute('SELECT SUM(pending) FROM counter').fetchone()[0]
+
+    def counter_state(self):
+        """(base totals or None, inflight, pending) as {field: n} maps."""
+        rows = self._db().execute('SELECT field, pending, inflight, base FROM counter').fetchall()
+        base = {field: b for field, _, _, b in rows}
+        return (None if None in base.values() else base,
+                {field: i for field, _, i, _ in rows},
+                {field: p for field, p, _, _ in rows})
+
+    def set_base(self, totals, only_if_missing=False):
+        with self._transaction() as db:
+            for field in COUNTER_FIELDS:
+                condition = ' AND base IS NULL' if only_if_missing else ''
+                db.execute('UPDATE counter SET base = ? WHERE field = ?' + condition, (totals[field], field))
+
+    def claim_pending(self, min_interval=0.0):
+        """
+        Move the pending increments to the in-flight batch and return
+        (batch, time the oldest of them was added), or None if there are none,
+        another worker is flushing, or the last flush was less than
+        `min_interval` seconds ago.
+        """
+        now = time.time()
+        with self._transaction() as db:
+            claimed_at, last_flush, oldest = db.execute(
+                'SELECT claimed_at, last_flush, oldest_pending FROM counter_meta').fetchone()
+            if claimed_at is not None:
+                if now - claimed_at < STALE_FLUSH_SECONDS:
+                    return None
+                # Its owner died mid-flush; send the batch again (it may be counted twice)
+                db.execute('UPDATE counter SET pending = pending + inflight, inflight = 0')
+            elif last_flush is not None and now - last_flush < min_interval:
+                return None
+
+            batch = dict(db.execute('SELECT field, pending FROM counter').fetchall())
+            if not any(batch.values()):
+                db.execute('UPDATE counter_meta SET claimed_at = NULL, oldest_pending = NULL')
+                return None
+            db.execute('UPDATE counter SET inflight = pending, pending = 0')
+            db.execute('UPDATE counter_meta SET claimed_at = ?, oldest_pending = NULL', (now,))
+            return batch, oldest if oldest is not None else now
+
+    def complete_flush(self, batch, totals):
+        """
+        The claimed batch was written; `totals` (if known) include it. Counts
+        only grow, so the new base is never below the old one plus the batch,
+        even when `totals` is a degraded estimate from a worker whose view of
+        the store is behind the others'.
+        """
+        with self._transaction() as db:
+            if totals is not None:
+                db.executemany('UPDATE counter SET base = MAX(COALESCE(base, 0) + inflight, ?) WHERE field = ?',
+                               [(totals[field], field) for field in COUNTER_FIELDS])
+            else:
+                db.execute('UPDATE counter SET base = base + inflight')
+            db.execute('UPDATE counter SET inflight = 0')
+            db.execute('UPDATE counter_meta SET claimed_at = NULL, last_flush = ?, flushes = flushes + 1, '
+                       'flushed_increments = flushed_increments + ?', (time.time(), sum(batch.values())))
+
+    def abort_flush(self, batch, oldest):
+        """The claimed batch could not be written; put it back to be retried."""
+        with self._transaction() as db:
+            db.execute('UPDATE counter SET pending = pending + inflight, inflight = 0')
+            db.execute('UPDATE counter_meta SET claimed_at = NULL, '
+                       'oldest_pending = MIN(COALESCE(oldest_pending, ?), ?)', (oldest, oldest))
+
+    def counter_meta(self):
+        row = self._db().execute('SELECT oldest_pending, last_flush, flushes, flushed_increments, claimed_at '
+                                 'FROM counter_meta').fetchone()
+        return dict(zip(('oldest_pending', 'last_flush', 'flushes', 'flushed_increments', 'claimed_at'), row))
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on error."""
+
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
+        return False
+
+
+class SharedCounterAggregator(CounterAggregator):
+    """
+    CounterAggregator whose pending increments and totals live in SharedState.
+
+    Every worker adds its increments to the same batch and reports the same
+    counts. Each worker runs the flusher thread, but a flush only goes out
+    when no other worker is flushing and `flush_interval` has passed since
+    the last one, so the host writes one ADD per interval.
+    """
+
+    def __init__(self, store, shared, flush_interval=1.0, flush_threshold=100):
+        super().__init__(store, flush_interval, flush_threshold)
+        self.shared = shared
+
+    def increment(self, field, n=1):
+        pending = self.shared.add_pending({field: n})
+        if pending >= self.flush_threshold:
+            self._flush(min_interval=0)
+        return self.counts()
+
+    def counts(self):
+        base, inflight, pending = self.shared.counter_state()
+        if base is None:
+            base = self.store.read()
+            self.shared.set_base(base, only_if_missing=True)
+        return {field: base[field] + inflight[field] + pending[field] for field in COUNTER_FIELDS}
+
+    def flush(self):
+        """Write the shared pending increments now, unless another worker is already doing so."""
+        self._flush(min_interval=0)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self._flush(min_interval=self.flush_interval * 0.9)
+            except Exception as e:
+                print(f"Counter Flush Error: {str(e)}")
+
+    def _flush(self, min_interval):
+        claimed = self.shared.claim_pending(min_interval)
+        if claimed is None:
+            return
+        batch, oldest = claimed
+        try:
+            totals = self.store.add(batch)
+        except CounterUnavailable:
+            # The store kept the batch itself and will reconcile it; only the totals are missing
+            self.shared.complete_flush(batch, None)
+            raise
+        except Exception:
+            self.shared.abort_flush(batch, oldest)
+            raise
+        self.shared.complete_flush(batch, totals)
+
+    def stats(self):
+        now = time.time()
+        meta = self.shared.counter_meta()
+        _, _, pending = self.shared.counter_state()
+        return {
+            'pending': sum(pending.values()),
+            'flush_lag_seconds': now - meta['oldest_pending'] if meta['oldest_pending'] is not None else 0.0,
+            'seconds_since_flush': now - meta['last_flush'] if meta['last_flush'] is not None else None,
+            'flushes': meta['flushes'],
+            'flushed_increments': meta['flushed_increments'],
+            'shared': True,
+        }
+
+
+def open_shared_state(path=SHARED_STATE_PATH):
+    """The SharedState at `path`, or None when sharing is disabled."""
+    return SharedState(path) if path else None
@@ -0,0 +1,57 @@
+import asyncio
+import contextvars
+import threading
+import time
+import unittest
+from async_aws import AWSCallTimeout, ClientDisconnected, run_aws
+
+route = contextvars.ContextVar('route', default=None)
+
+class FakeRequest:
+    """Minimal stand-in for a Starlette request whose client can hang up"""
+    def __init__(self):
+        self.disconnected = False
+
+    async def is_disconnected(self):
+        return self.disconnected
+
+
+class TestRunAWS(unittest.IsolatedAsyncioTestCase):
+    async def test_returns_result_off_the_event_loop(self):
+        """Test that the call runs on an AWS worker thread and its result is returned"""
+        loop_thread = threading.current_thread().name
+        result = await run_aws(lambda: threading.current_thread().name)
+        self.assertNotEqual(result, loop_thread)
+        self.assertTrue(result.startswith('aws'))
+
+    async def test_propagates_errors_and_context(self):
+        """Test that exceptions surface and context variables reach the worker"""
+        route.set('/visitor')
+        self.assertEqual(await run_aws(route.get), '/visitor')
+        with self.assertRaises(KeyError):
+            await run_aws({}.__getitem__, 'missing')
+
+    async def test_timeout(self):
+        """Test that a stalled call is abandoned after the timeout"""
+        start = time.monotonic()
+        with self.assertRaises(AWSCallTimeout):
+            await run_aws(time.sleep, 1, timeout=0.05)
+        self.assertLess(time.monotonic() - start, 0.5)
+
+    async def test_client_disconnect(self):
+        """Test that a call is abandoned once the client goes away"""
+        request = FakeRequest()
+        asyncio.get_running_loop().call_later(0.05, setattr, request, 'disconnected', True)
+        with self.assertRaises(ClientDisconnected):
+            await run_aws(time.sleep, 1, request=request, timeout=5)
+
+    async def test_event_loop_stays_responsive(self):
+        """Test that slow calls don't block other coroutines"""
+        slow = asyncio.ensure_future(run_aws(time.sleep, 0.2))
+        start = time.monotonic()
+        await asyncio.sleep(0.01)
+        self.assertLess(time.monotonic() - start, 0.1)
+        await slow
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+import asyncio
+import unittest
+from unittest import mock
+import boto3
+from botocore.exceptions import EndpointConnectionError
+from moto import mock_aws
+from prometheus_client import CollectorRegistry
+import aws_clients
+from async_aws import run_aws
+from aws_metrics import AWSCallMetrics, RouteLabelMiddleware, current_route
+
+
+@mock_aws
+class TestAWSCallMetrics(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.registry = CollectorRegistry()
+        cls.metrics = AWSCallMetrics(cls.registry).install()
+
+    def setUp(self):
+        boto3.client('dynamodb', region_name='us-east-1').create_table(
+            TableName='VisitorCounter',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST'
+        )
+        self.client = aws_clients.get_client('dynamodb', 'us-east-1')
+
+    def sample(self, name, **labels):
+        return self.registry.get_sample_value(name, labels) or 0
+
+    def test_records_operation_latency_per_route(self):
+        """Test that each call is timed and labelled with operation, region and route"""
+        labels = {'service': 'dynamodb', 'operation': 'GetItem', 'region': 'us-east-1', 'route': '/visitor'}
+        before = self.sample('aws_request_duration_seconds_count', **labels)
+
+        async def handle_request():
+            current_route.set('/visitor')
+            await run_aws(self.client.get_item, TableName='VisitorCounter', Key={'id': {'S': 'visitor_stats'}})
+
+        asyncio.run(handle_request())
+
+        self.assertEqual(self.sample('aws_request_duration_seconds_count', **labels), before + 1)
+        self.assertEqual(self.sample('aws_requests_total', outcome='success', **labels), before + 1)
+
+    def test_background_calls(self):
+        """Test that calls outside a request are labelled 'background'"""
+        labels = {'service': 'dynamodb', 'operation': 'UpdateItem', 'region': 'us-east-1', 'route': 'background'}
+        before = self.sample('aws_request_duration_seconds_count', **labels)
+        self.client.update_item(TableName='VisitorCounter', Key={'id': {'S': 'visitor_stats'}},
+                                UpdateExpression='ADD #v :n', ExpressionAttributeNames={'#v': 'views'},
+                                ExpressionAttributeValues={':n': {'N': '1'}})
+        self.assertEqual(self.sample('aws_request_duration_seconds_count', **labels), before + 1)
+
+    def test_errors_and_throttling(self):
+        """Test that error responses and throttled attempts are counted"""
+        labels = {'service': 'dynamodb', 'operation': 'GetItem', 'region': 'us-east-1', 'route': 'background'}
+        before = self.sample('aws_requests_total', outcome='error', **labels)
+        with self.assertRaises(self.client.exceptions.ResourceNotFoundException):
+            self.client.get_item(TableName='Missing', Key={'id': {'S': 'x'}})
+        self.assertEqual(self.sample('aws_requests_total', outcome='error', **labels), before + 1)
+
+        context = {'aws_metrics_labels': ('dynamodb', 'UpdateItem', 'us-east-1', '/visitor')}
+        response = (None, {'Error': {'Code': 'ProvisionedThroughputExceededException'}})
+        self.metrics.needs_retry(response=response, request_dict={'context': context})
+        self.assertEqual(self.sample('aws_request_throttles_total', service='dynamodb', operation='UpdateItem',
+                                     region='us-east-1', route='/visitor',
+                                     error_code='ProvisionedThroughputExceededException'), 1)
+
+    def test_retries_counted_when_call_fails(self):
+        """Test that a call failing after its last retry records every retry attempt"""
+        client = aws_clients.get_client('dynamodb', 'us-east-1', retries={'total_max_attempts': 2, 'mode': 'standard'})
+        labels = {'service': 'dynamodb', 'operation': 'GetItem', 'region': 'us-east-1', 'route': 'background'}
+        before = self.sample('aws_request_retries_total', **labels)
+        failures = self.sample('aws_requests_total', outcome='exception', **labels)
+
+        def refuse(**kwargs):
+            raise EndpointConnectionError(endpoint_url='https://dynamodb.us-east-1.amazonaws.com')
+
+        client.meta.events.register('before-send.dynamodb.GetItem', refuse)
+        try:
+            with self.assertRaises(EndpointConnectionError):
+                client.get_item(TableName='VisitorCounter', Key={'id': {'S': 'visitor_stats'}})
+        finally:
+            client.meta.events.unregister('before-send.dynamodb.GetItem', refuse)
+
+        self.assertEqual(self.sample('aws_request_retries_total', **labels), before + 1)
+        self.assertEqual(self.sample('aws_requests_total', outcome='exception', **labels), failures + 1)
+
+        # A call that succeeds first time records no retries
+        client.get_item(TableName='VisitorCounter', Key={'id': {'S': 'visitor_stats'}})
+        self.assertEqual(self.sample('aws_request_retries_total', **labels), before + 1)
+
+
+class TestAppMetricsRoutes(unittest.TestCase):
+    def test_metrics_path_is_the_cloudwatch_route(self):
+        """Test that GET /metrics reaches the CloudWatch route and Prometheus is served on its own path"""
+        from fastapi.testclient import TestClient
+        import main
+        from service import ok
+
+        client = TestClient(main.app)
+        with mock.patch.object(main.service, 'metrics', return_value=ok({'total_invocations': 7})) as metrics:
+            response = client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'total_invocations': 7})
+        metrics.assert_called_once()
+
+        response = client.get(main.PROMETHEUS_METRICS_PATH)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('# HELP', response.text)
+
+
+class TestRouteLabelMiddleware(unittest.IsolatedAsyncioTestCase):
+    async def test_route_label(self):
+        """Test that known paths are used as labels and anything else is 'other'"""
+        seen = []
+
+        async def app(scope, receive, send):
+            seen.append(current_route.get())
+
+        middleware = RouteLabelMiddleware(app, routes=lambda: ['/visitor', '/gallery'])
+        await middleware({'type': 'http', 'path': '/visitor'}, None, None)
+        await middleware({'type': 'http', 'path': '/wp-login.php'}, None, None)
+
+        self.assertEqual(seen, ['/visitor', 'other'])
+        self.assertEqual(current_route.get(), 'background')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import asyncio
+import json
+import unittest
+from broadcast import CountBroadcaster, TooManySubscribers, sse_stream
+
+SUBSCRIBERS = 2000
+
+
+class FakeCounts:
+    """Stands in for the counter: an async read that counts how often it is called"""
+    def __init__(self):
+        self.views = 0
+        self.reads = 0
+
+    async def read(self):
+        self.reads += 1
+        return {'views': self.views, 'downloads': 0}
+
+
+class TestCountBroadcaster(unittest.IsolatedAsyncioTestCase):
+    async def test_many_subscribers_share_one_read_loop(self):
+        """Test that thousands of subscribers get every update from coalesced reads"""
+        source = FakeCounts()
+        broadcaster = CountBroadcaster(source.read, max_rate=20, poll_interval=60)
+        subscriptions = [broadcaster.subscribe() for _ in range(SUBSCRIBERS)]
+        self.assertEqual(broadcaster.subscribers, SUBSCRIBERS)
+
+        first = await asyncio.gather(*(s.__anext__() for s in subscriptions))
+        self.assertTrue(all(counts == {'views': 0, 'downloads': 0} for counts in first))
+
+        # A burst of increments, each followed by notify(), is coalesced into a few reads
+        waiting = [asyncio.ensure_future(s.__anext__()) for s in subscriptions]
+        for _ in range(500):
+            source.views += 1
+            broadcaster.notify()
+            await asyncio.sleep(0)
+
+        updates = await asyncio.wait_for(asyncio.gather(*waiting), timeout=5)
+        self.assertEqual(len(updates), SUBSCRIBERS)
+        await asyncio.sleep(0.2)
+        self.assertEqual(broadcaster.counts['views'], 500)
+        self.assertLess(source.reads, 10)
+
+        for s in subscriptions:
+            s.close()
+        self.assertEqual(broadcaster.subscribers, 0)
+
+    async def test_slow_subscriber_gets_latest(self):
+        """Test that a subscriber that falls behind skips straight to the newest counts"""
+        source = FakeCounts()
+        broadcaster = CountBroadcaster(source.read, max_rate=100, poll_interval=60)
+        subscription = broadcaster.subscribe()
+        await subscription.__anext__()
+
+        for _ in range(5):
+            source.views += 1
+            broadcaster.notify()
+            await asyncio.sleep(0.05)
+
+        self.assertEqual((await subscription.__anext__())['views'], 5)
+        subscription.close()
+
+    async def test_subscriber_limit(self):
+        """Test that subscriptions beyond the limit are refused until one closes"""
+        broadcaster = CountBroadcaster(FakeCounts().read, max_subscribers=2)
+        first = broadcaster.subscribe()
+        broadcaster.subscribe()
+        with self.assertRaises(TooManySubscribers):
+            broadcaster.subscribe()
+
+        first.close()
+        first.close()  # closing twice only releases one slot
+        broadcaster.subscribe()
+        with self.assertRaises(TooManySubscribers):
+            broadcaster.subscribe()
+
+    async def test_sse_stream(self):
+        """Test the SSE framing, heartbeats and that closing the stream releases the slot"""
+        broadcaster = CountBroadcaster(FakeCounts().read, poll_interval=60)
+        stream = sse_stream(broadcaster.subscribe(), heartbeat=0.05)
+
+        self.assertEqual(await stream.__anext__(), b'retry: 5000\n\n')
+        event = await stream.__anext__()
+        self.assertTrue(event.startswith(b'event: counts\ndata: '))
+        self.assertEqual(json.loads(event.split(b'data: ')[1]), {'views': 0, 'downloads': 0})
+        self.assertEqual(await stream.__anext__(), b': ping\n\n')
+
+        await stream.aclose()
+        self.assertEqual(broadcaster.subscribers, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
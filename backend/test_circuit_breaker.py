@@ -0,0 +1,70 @@
+import unittest
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpen
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.breaker = CircuitBreaker(failure_threshold=3, slow_call_seconds=0.5, reset_timeout=10, clock=self.clock)
+
+    def test_failures_and_slow_calls_trip(self):
+        """Test that consecutive errors or slow calls open the circuit"""
+        self.breaker.record(0.01, failed=True)
+        self.breaker.record(0.9)
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.breaker.record(0.6)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertFalse(self.breaker.allow())
+        with self.assertRaises(CircuitOpen):
+            self.breaker.call(lambda: 'never called')
+        self.assertEqual(self.breaker.stats()['trips'], 1)
+
+    def test_success_resets_the_count(self):
+        """Test that a fast call in between keeps the circuit closed"""
+        for _ in range(5):
+            self.breaker.record(0.01, failed=True)
+            self.breaker.record(0.01, failed=True)
+            self.breaker.record(0.01)
+        self.assertEqual(self.breaker.state, CLOSED)
+
+    def test_half_open_allows_one_trial(self):
+        """Test that after the reset timeout one trial call decides the state"""
+        for _ in range(3):
+            self.breaker.record(1.0)
+        self.clock.now = 10
+
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+        self.assertFalse(self.breaker.allow())
+        self.breaker.record(1.0)
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.breaker.stats()['trips'], 2)
+
+        self.clock.now = 20
+        self.assertEqual(self.breaker.call(lambda: 'ok'), 'ok')
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertTrue(self.breaker.allow())
+
+    def test_release_frees_the_trial(self):
+        """Test that a released half-open trial lets the next caller through"""
+        for _ in range(3):
+            self.breaker.record(1.0)
+        self.clock.now = 10
+
+        self.assertTrue(self.breaker.allow())
+        self.assertFalse(self.breaker.allow())
+        self.breaker.release()
+        self.assertTrue(self.breaker.allow())
+        self.assertEqual(self.breaker.state, HALF_OPEN)
+
+
+if __name__ == '__main__':
+    unittest.main()
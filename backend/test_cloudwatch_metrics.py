@@ -0,0 +1,120 @@
+import threading
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+import boto3
+from moto import mock_aws
+from cloudwatch_metrics import MetricsCache, floor_to_period
+
+class StubCloudWatch:
+    """Answers get_metric_data with one datapoint per hour and records each call"""
+    def __init__(self, delay=0):
+        self.calls = []
+        self.delay = delay
+
+    def get_metric_data(self, **params):
+        self.calls.append(params)
+        time.sleep(self.delay)
+        hours = []
+        hour = floor_to_period(params['StartTime'])
+        while hour < params['EndTime']:
+            hours.append(hour)
+            hour += timedelta(hours=1)
+        return {'MetricDataResults': [
+            {'Id': 'invocations', 'Timestamps': hours, 'Values': [10.0] * len(hours)},
+            {'Id': 'latency', 'Timestamps': hours, 'Values': [20.0] * len(hours)},
+        ]}
+
+
+class TestMetricsCache(unittest.TestCase):
+    def test_one_query_for_both_series(self):
+        """Test that invocations and latency come from a single get_metric_data call"""
+        cloudwatch = StubCloudWatch()
+        data = MetricsCache(cloudwatch).get('VisitorCounterFunction')
+
+        self.assertEqual(len(cloudwatch.calls), 1)
+        self.assertEqual([q['Id'] for q in cloudwatch.calls[0]['MetricDataQueries']], ['invocations', 'latency'])
+        self.assertEqual(len(data['invocations']), 25)
+        self.assertEqual(data['total_invocations'], 250.0)
+        self.assertEqual(data['avg_duration'], 20.0)
+        self.assertEqual(data['chart_data'][0]['timestamp'], data['latency'][0]['Timestamp'].isoformat())
+
+    def test_cached_within_ttl(self):
+        """Test that repeated requests inside the TTL reuse the cached response"""
+        cloudwatch = StubCloudWatch()
+        cache = MetricsCache(cloudwatch, ttl=60)
+        for _ in range(50):
+            cache.get('VisitorCounterFunction')
+        self.assertEqual(len(cloudwatch.calls), 1)
+
+    def test_refresh_fetches_only_newest_buckets(self):
+        """Test that an expired entry re-fetches the last two buckets, not the whole day"""
+        cloudwatch = StubCloudWatch()
+        cache = MetricsCache(cloudwatch, ttl=0)
+        first = cache.get('VisitorCounterFunction')
+        second = cache.get('VisitorCounterFunction')
+
+        self.assertEqual(len(cloudwatch.calls), 2)
+        previous = first['invocations'][-2]['Timestamp']
+        self.assertEqual(cloudwatch.calls[1]['StartTime'], previous)
+        self.assertEqual(len(second['invocations']), len(first['invocations']))
+
+    def test_closed_bucket_keeps_growing(self):
+        """Test that a bucket still receiving late datapoints after the next one appears is updated"""
+        cloudwatch = StubCloudWatch()
+        cache = MetricsCache(cloudwatch, ttl=0)
+        cache.get('VisitorCounterFunction')
+
+        # Every bucket CloudWatch reports now has more invocations than before
+        original = cloudwatch.get_metric_data
+        def grown(**params):
+            response = original(**params)
+            response['MetricDataResults'][0]['Values'] = [15.0] * len(response['MetricDataResults'][0]['Values'])
+            return response
+        cloudwatch.get_metric_data = grown
+
+        data = cache.get('VisitorCounterFunction')
+        self.assertEqual([point['Sum'] for point in data['invocations'][-3:]], [10.0, 15.0, 15.0])
+        self.assertEqual(data['total_invocations'], 23 * 10.0 + 2 * 15.0)
+
+    def test_windows_are_cached_separately(self):
+        """Test that each window has its own entry and unknown windows are rejected"""
+        cloudwatch = StubCloudWatch()
+        cache = MetricsCache(cloudwatch)
+        self.assertEqual(len(cache.get('fn', 1)['invocations']), 2)
+        self.assertEqual(len(cache.get('fn', 24)['invocations']), 25)
+        self.assertEqual(len(cloudwatch.calls), 2)
+        with self.assertRaises(ValueError):
+            cache.get('fn', 5)
+
+    def test_concurrent_viewers_share_one_query(self):
+        """Test that simultaneous dashboard requests wait for one upstream query"""
+        cloudwatch = StubCloudWatch(delay=0.05)
+        cache = MetricsCache(cloudwatch)
+        threads = [threading.Thread(target=cache.get, args=('fn',)) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(cloudwatch.calls), 1)
+
+
+@mock_aws
+class TestMetricsCacheCloudWatch(unittest.TestCase):
+    def test_reads_lambda_metrics(self):
+        """Test the get_metric_data query against moto"""
+        cloudwatch = boto3.client('cloudwatch', region_name='us-east-1')
+        # A minute back, so the datapoint is safely before the query's (second-precision) EndTime
+        now = datetime.now(timezone.utc) - timedelta(minutes=1)
+        dimensions = [{'Name': 'FunctionName', 'Value': 'VisitorCounterFunction'}]
+        cloudwatch.put_metric_data(Namespace='AWS/Lambda', MetricData=[
+            {'MetricName': 'Invocations', 'Dimensions': dimensions, 'Timestamp': now, 'Value': 3},
+            {'MetricName': 'Duration', 'Dimensions': dimensions, 'Timestamp': now, 'Value': 40},
+        ])
+
+        data = MetricsCache(cloudwatch).get('VisitorCounterFunction')
+        self.assertEqual(data['total_invocations'], 3)
+        self.assertEqual(data['avg_duration'], 40)
+
+if __name__ == '__main__':
+    unittest.main()
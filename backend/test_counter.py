@@ -0,0 +1,269 @@
+import threading
+import time
+import unittest
+from unittest import mock
+import boto3
+from moto import mock_aws
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from counter import (
+    CounterAggregator, CounterStore, CounterUnavailable, ResilientCounterStore, ShardedCounterStore,
+    make_counter_store,
+)
+
+@mock_aws
+class TestCounterAggregator(unittest.TestCase):
+    def setUp(self):
+        """Set up DynamoDB mock table and an aggregator without a background flusher"""
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.table = self.dynamodb.create_table(
+            TableName='VisitorCounter',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
+        self.store = CounterStore(self.table)
+        self.aggregator = CounterAggregator(self.store, flush_interval=0, flush_threshold=10000)
+
+    def test_burst_is_flushed_as_one_write(self):
+        """Test that thousands of increments become a single update_item"""
+        client = self.table.meta.client
+        with mock.patch.object(client, 'update_item', wraps=client.update_item) as update_item:
+            for _ in range(2000):
+                self.aggregator.increment('views')
+            for _ in range(500):
+                counts = self.aggregator.increment('downloads')
+
+            self.assertEqual(counts, {'views': 2000, 'downloads': 500})
+            self.assertEqual(update_item.call_count, 0)
+
+            self.aggregator.flush()
+            self.assertEqual(update_item.call_count, 1)
+
+        self.assertEqual(self.store.read(), {'views': 2000, 'downloads': 500})
+
+    def test_threshold_triggers_flush(self):
+        """Test that reaching the threshold flushes without waiting for the interval"""
+        self.aggregator.flush_threshold = 5
+        for _ in range(5):
+            self.aggregator.increment('views')
+
+        self.assertEqual(self.store.read()['views'], 5)
+        self.assertEqual(self.aggregator.stats()['pending'], 0)
+        self.assertEqual(self.aggregator.stats()['flushes'], 1)
+
+    def test_close_flushes_pending(self):
+        """Test that shutdown writes out increments still held in memory"""
+        self.aggregator.increment('views')
+        stats = self.aggregator.stats()
+        self.assertEqual(stats['pending'], 1)
+        self.assertGreaterEqual(stats['flush_lag_seconds'], 0)
+
+        self.aggregator.close()
+        self.assertEqual(self.store.read(), {'views': 1, 'downloads': 0})
+
+    def test_failed_flush_keeps_increments(self):
+        """Test that a failed write is retried by the next flush"""
+        self.aggregator.increment('views')
+        with mock.patch.object(self.store, 'add', side_effect=RuntimeError('throttled')):
+            with self.assertRaises(RuntimeError):
+                self.aggregator.flush()
+
+        self.assertEqual(self.aggregator.stats()['pending'], 1)
+        self.aggregator.flush()
+        self.assertEqual(self.store.read()['views'], 1)
+
+    def test_legacy_count_fallback(self):
+        """Test that items written before the views attribute existed still report counts"""
+        self.table.put_item(Item={'id': 'visitor_stats', 'count': 42})
+        self.assertEqual(self.aggregator.counts(), {'views': 42, 'downloads': 0})
+
+class StallingStore:
+    """
+    In-memory stand-in for CounterStore whose calls take `latency` seconds,
+    hang while `stalled` is set, or raise while `failing` is
+    """
+
+    def __init__(self, latency=0):
+        self.totals = {'views': 100, 'downloads': 10}
+        self.latency = latency
+        self.stalled = threading.Event()
+        self.released = threading.Event()
+        self.failing = False
+        self.writes = 0
+        self.lock = threading.Lock()
+
+    def _wait(self):
+        if self.failing:
+            raise RuntimeError('ProvisionedThroughputExceededException')
+        if self.stalled.is_set():
+            self.released.wait()
+        time.sleep(self.latency)
+
+    def add(self, deltas):
+        self._wait()
+        with self.lock:
+            for field, n in deltas.items():
+                self.totals[field] += n
+            self.writes += 1
+            return dict(self.totals)
+
+    def read(self):
+        self._wait()
+        with self.lock:
+            return dict(self.totals)
+
+    def warm(self):
+        pass
+
+
+class TestResilientCounterStore(unittest.TestCase):
+    def setUp(self):
+        self.backend = StallingStore()
+        self.breaker = CircuitBreaker(failure_threshold=2, slow_call_seconds=0.1, reset_timeout=0.2)
+        self.store = ResilientCounterStore(self.backend, self.breaker, call_timeout=0.1)
+
+    def tearDown(self):
+        self.backend.released.set()
+
+    def test_stall_is_bounded_and_loses_nothing(self):
+        """Test that a stalled backend trips the breaker and every increment is reconciled afterwards"""
+        self.assertEqual(self.store.add({'views': 1}), {'views': 101, 'downloads': 10})
+
+        self.backend.stalled.set()
+        latencies = []
+        for i in range(50):
+            start = time.monotonic()
+            counts = self.store.add({'views': 1})
+            latencies.append(time.monotonic() - start)
+        self.assertLess(max(latencies), 0.5)
+        self.assertEqual(counts, {'views': 151, 'downloads': 10})
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.store.read(), {'views': 151, 'downloads': 10})
+
+        # The writes that timed out complete once the stall ends, then the rest is sent in one ADD
+        self.backend.stalled.clear()
+        self.backend.released.set()
+        time.sleep(0.25)
+        self.assertEqual(self.store.add({'downloads': 1}), {'views': 151, 'downloads': 11})
+        self.assertEqual(self.backend.totals, {'views': 151, 'downloads': 11})
+        self.assertEqual(self.store.pending(), 0)
+        self.assertEqual(self.store.stats()['state'], 'closed')
+
+    def test_errors_fall_back_to_local_counts(self):
+        """Test that failed writes are served from the last known totals and sent again later"""
+        self.store.read()
+        self.backend.failing = True
+        for _ in range(5):
+            counts = self.store.add({'views': 1})
+        self.assertEqual(counts, {'views': 105, 'downloads': 10})
+        self.assertEqual(self.store.stats()['local_increments'], 5)
+
+        self.backend.failing = False
+        time.sleep(0.25)
+        self.store.reconcile()
+        self.assertEqual(self.backend.totals['views'], 105)
+        self.assertEqual(self.backend.writes, 1)
+
+    def test_concurrent_calls_to_healthy_store(self):
+        """Test that callers queued behind each other are not counted as slow or timed out"""
+        backend = StallingStore(latency=0.1)
+        store = ResilientCounterStore(backend, CircuitBreaker(failure_threshold=5, slow_call_seconds=0.5,
+                                                              reset_timeout=5), call_timeout=1.0, workers=8)
+        threads = [threading.Thread(target=store.add, args=({'views': 1},)) for _ in range(64)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        stats = store.stats()
+        self.assertEqual(stats['state'], 'closed')
+        self.assertEqual(stats['timeouts'], 0)
+        self.assertEqual(stats['unconfirmed_increments'], 0)
+        self.assertEqual(backend.totals['views'] + stats['local_increments'], 164)
+
+    def test_cancelled_trial_is_released(self):
+        """Test that a half-open trial cancelled in the queue does not leave the breaker stuck"""
+        breaker = CircuitBreaker(failure_threshold=1, slow_call_seconds=0.1, reset_timeout=0.2)
+        store = ResilientCounterStore(self.backend, breaker, call_timeout=0.1, workers=1)
+        store.add({'views': 1})
+
+        # The only worker hangs on the timed-out write, so the trial after the reset never starts
+        self.backend.stalled.set()
+        store.add({'views': 1})
+        self.assertEqual(breaker.state, OPEN)
+        time.sleep(0.25)
+        self.assertEqual(store.add({'views': 1}), {'views': 103, 'downloads': 10})
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(store.stats()['fallbacks'], 1)
+
+        self.backend.stalled.clear()
+        self.backend.released.set()
+        time.sleep(0.05)
+        self.assertEqual(store.add({'views': 1}), {'views': 104, 'downloads': 10})
+        self.assertEqual(breaker.state, CLOSED)
+        self.assertEqual(self.backend.totals['views'], 104)
+        self.assertEqual(store.pending(), 0)
+
+    def test_unavailable_without_known_totals(self):
+        """Test that a cold store raises CounterUnavailable but still keeps the increment"""
+        self.backend.failing = True
+        with self.assertRaises(CounterUnavailable):
+            self.store.add({'views': 1})
+
+        aggregator = CounterAggregator(self.store, flush_interval=0)
+        with self.assertRaises(CounterUnavailable):
+            aggregator.increment('views')
+        with self.assertRaises(CounterUnavailable):
+            aggregator.flush()
+        self.assertEqual(aggregator.stats()['pending'], 0)
+
+        self.backend.failing = False
+        time.sleep(0.25)
+        self.assertEqual(self.store.read(), {'views': 102, 'downloads': 10})
+
+@mock_aws
+class TestShardedCounterStore(unittest.TestCase):
+    def setUp(self):
+        """Set up DynamoDB mock table and a four-shard store"""
+        self.dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.table = self.dynamodb.create_table(
+            TableName='VisitorCounter',
+            KeySchema=[{'AttributeName': 'id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': 'id', 'AttributeType': 'S'}],
+            ProvisionedThroughput={'ReadCapacityUnits': 1, 'WriteCapacityUnits': 1}
+        )
+        self.store = ShardedCounterStore(self.table, shards=4)
+
+    def test_increments_spread_over_shards(self):
+        """Test that writes land on shard items and reads sum them"""
+        for _ in range(40):
+            self.store.add({'views': 1})
+        self.store.add({'downloads': 3})
+
+        self.assertEqual(self.store.read(), {'views': 40, 'downloads': 3})
+        shard_ids = {item['id'] for item in self.table.scan()['Items']}
+        self.assertTrue(shard_ids <= set(self.store.shard_keys))
+        self.assertGreater(len(shard_ids), 1)
+
+    def test_read_is_one_batch_get(self):
+        """Test that summing the shards costs a single batch_get_item"""
+        self.store.add({'views': 1})
+        client = self.table.meta.client
+        with mock.patch.object(client, 'batch_get_item', wraps=client.batch_get_item) as batch_get_item:
+            self.store.read()
+        self.assertEqual(batch_get_item.call_count, 1)
+
+    def test_legacy_item_is_carried_over(self):
+        """Test that totals on the original single item (including 'count') are kept"""
+        self.table.put_item(Item={'id': 'visitor_stats', 'count': 100, 'downloads': 7})
+        self.store.add({'views': 1})
+
+        self.assertEqual(self.store.read(), {'views': 101, 'downloads': 7})
+
+    def test_make_counter_store(self):
+        """Test that the shard count selects the store type"""
+        self.assertIs(type(make_counter_store(self.table, shards=0)), CounterStore)
+        self.assertEqual(make_counter_store(self.table, shards=8).shards, 8)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,155 @@
+import json
+import threading
+import time
+import unittest
+import boto3
+from moto import mock_aws
+from gallery import (
+    GALLERY_STREAM_BATCH, GalleryCache, GallerySnapshot, decode_cursor, etag_matches, gallery_page,
+    list_gallery_images, parse_limit, stream_gallery,
+)
+
+@mock_aws
+class TestGalleryListing(unittest.TestCase):
+    def setUp(self):
+        """Set up a mock gallery bucket with a few photos"""
+        self.s3 = boto3.client('s3', region_name='ap-south-1')
+        self.bucket = 'g2u7a8.photos'
+        self.s3.create_bucket(Bucket=self.bucket, CreateBucketConfiguration={'LocationConstraint': 'ap-south-1'})
+        for key in ['a.jpg', 'b.PNG', 'notes.txt', 'folder/']:
+            self.s3.put_object(Bucket=self.bucket, Key=key, Body=b'x')
+
+    def test_lists_only_images(self):
+        """Test that non-image keys and folders are skipped"""
+        images = list_gallery_images(self.s3, self.bucket)
+        self.assertEqual(images, [
+            ('a.jpg', 'https://s3.ap-south-1.amazonaws.com/g2u7a8.photos/a.jpg'),
+            ('b.PNG', 'https://s3.ap-south-1.amazonaws.com/g2u7a8.photos/b.PNG'),
+        ])
+
+    def test_lists_past_first_page(self):
+        """Test that listings follow continuation tokens beyond 1000 keys"""
+        for i in range(1100):
+            self.s3.put_object(Bucket=self.bucket, Key=f'photos-{i:04d}.jpg', Body=b'x')
+        self.assertEqual(len(list_gallery_images(self.s3, self.bucket)), 1102)
+
+    def test_pages_from_s3_and_from_cache_agree(self):
+        """Test that cursors walk the whole gallery with or without a warm cache"""
+        for i in range(25):
+            self.s3.put_object(Bucket=self.bucket, Key=f'p{i:02d}.jpg', Body=b'x')
+        expected = [url for _, url in list_gallery_images(self.s3, self.bucket)]
+
+        for warm in (False, True):
+            cache = GalleryCache(lambda: list_gallery_images(self.s3, self.bucket), ttl=60, stale_ttl=60)
+            if warm:
+                cache.get()
+            else:
+                cache.peek = lambda: None
+
+            seen = []
+            cursor = None
+            while True:
+                page = gallery_page(cache, self.s3, self.bucket, 10, cursor)
+                seen.extend(page['images'])
+                cursor = page['next_cursor']
+                if cursor is None:
+                    break
+            self.assertEqual(seen, expected)
+
+    def test_stream_formats(self):
+        """Test that both streaming formats decode to the full listing"""
+        cache = GalleryCache(lambda: list_gallery_images(self.s3, self.bucket), ttl=60, stale_ttl=60)
+        cache.peek = lambda: None
+        expected = [url for _, url in list_gallery_images(self.s3, self.bucket)]
+
+        body = b''.join(stream_gallery(cache, self.s3, self.bucket, 'json'))
+        self.assertEqual(json.loads(body), {'images': expected})
+
+        lines = b''.join(stream_gallery(cache, self.s3, self.bucket, 'ndjson')).splitlines()
+        self.assertEqual([json.loads(line)['url'] for line in lines], expected)
+
+    def test_stream_sends_batches(self):
+        """Test that a cached listing is streamed a batch of URLs per chunk, not one per image"""
+        urls = [f'https://example.com/{n:03}.jpg' for n in range(250)]
+        cache = GalleryCache(lambda: None)
+        cache.peek = lambda: GallerySnapshot(urls, urls, '"etag"', time.monotonic(), None)
+
+        chunks = list(stream_gallery(cache, self.s3, self.bucket, 'ndjson'))
+        self.assertEqual(len(chunks), -(-len(urls) // GALLERY_STREAM_BATCH))
+        self.assertEqual([json.loads(line)['url'] for line in b''.join(chunks).splitlines()], urls)
+
+        chunks = list(stream_gallery(cache, self.s3, self.bucket, 'json'))
+        self.assertEqual(len(chunks), -(-len(urls) // GALLERY_STREAM_BATCH) + 2)
+        self.assertEqual(json.loads(b''.join(chunks)), {'images': urls})
+
+    def test_invalid_parameters(self):
+        """Test that bad limits and cursors are rejected"""
+        for limit in ('0', '1001', 'ten'):
+            with self.assertRaises(ValueError):
+                parse_limit(limit)
+        with self.assertRaises(ValueError):
+            decode_cursor('%%%')
+
+
+class TestGalleryCache(unittest.TestCase):
+    def setUp(self):
+        self.calls = 0
+        self.images = [('1.jpg', 'https://example.com/1.jpg')]
+
+    def loader(self):
+        self.calls += 1
+        return list(self.images)
+
+    def test_fresh_hits_do_not_reload(self):
+        """Test that the listing is fetched once while within the TTL"""
+        cache = GalleryCache(self.loader, ttl=60, stale_ttl=60)
+        first = cache.get()
+        for _ in range(100):
+            self.assertIs(cache.get(), first)
+        self.assertEqual(self.calls, 1)
+
+    def test_stale_snapshot_is_served_while_refreshing(self):
+        """Test that an expired snapshot is returned immediately and refreshed in the background"""
+        cache = GalleryCache(self.loader, ttl=0.01, stale_ttl=60)
+        first = cache.get()
+        self.images.append(('2.jpg', 'https://example.com/2.jpg'))
+        time.sleep(0.02)
+
+        self.assertIs(cache.get(), first)
+        for _ in range(100):
+            if cache.get() is not first:
+                break
+            time.sleep(0.01)
+        self.assertEqual(len(cache.get().images), 2)
+        self.assertNotEqual(cache.get().etag, first.etag)
+
+    def test_concurrent_misses_are_coalesced(self):
+        """Test that simultaneous cold requests trigger a single listing"""
+        def slow_loader():
+            time.sleep(0.05)
+            return self.loader()
+
+        cache = GalleryCache(slow_loader, ttl=60, stale_ttl=60)
+        threads = [threading.Thread(target=cache.get) for _ in range(20)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(self.calls, 1)
+
+    def test_headers_and_etag_matching(self):
+        """Test the caching headers and If-None-Match handling"""
+        cache = GalleryCache(self.loader, ttl=300, stale_ttl=600)
+        snapshot = cache.get()
+        headers = cache.headers(snapshot)
+
+        self.assertEqual(headers['ETag'], snapshot.etag)
+        self.assertIn('max-age=', headers['Cache-Control'])
+        self.assertIn('stale-while-revalidate=600', headers['Cache-Control'])
+        self.assertTrue(etag_matches(snapshot.etag, snapshot.etag))
+        self.assertTrue(etag_matches(f'"other", W/{snapshot.etag}', snapshot.etag))
+        self.assertFalse(etag_matches('"other"', snapshot.etag))
+        self.assertFalse(etag_matches(None, snapshot.etag))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,136 @@
+import struct
+import unittest
+import zlib
+import boto3
+from moto import mock_aws
+from gallery_manifest import (
+    GALLERY_MANIFEST_KEY, image_dimensions, load_manifest, manifest_handler, pillow_available, update_manifest,
+)
+from service import VisitorService
+
+
+def png(width, height):
+    """A minimal valid single-colour PNG"""
+    def chunk(kind, data):
+        return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+    rows = b''.join(b'\x00' + b'\x80\x40\x20' * width for _ in range(height))
+    return (b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+            + chunk(b'IDAT', zlib.compress(rows)) + chunk(b'IEND', b''))
+
+
+def jpeg_header(width, height, orientation=1):
+    """SOI, an EXIF block with the orientation tag and a baseline frame header"""
+    ifd = struct.pack('<H', 1) + struct.pack('<HHIHH', 0x0112, 3, 1, orientation, 0) + struct.pack('<I', 0)
+    exif = b'Exif\x00\x00' + b'II*\x00' + struct.pack('<I', 8) + ifd
+    sof = b'\x08' + struct.pack('>HH', height, width) + b'\x03\x01\x22\x00\x02\x11\x01\x03\x11\x01'
+    return (b'\xff\xd8' + b'\xff\xe1' + struct.pack('>H', len(exif) + 2) + exif
+            + b'\xff\xc0' + struct.pack('>H', len(sof) + 2) + sof)
+
+
+class TestImageDimensions(unittest.TestCase):
+    def test_formats(self):
+        """Test that PNG, JPEG and WebP headers give the displayed size"""
+        self.assertEqual(image_dimensions(png(3, 2)), (3, 2))
+        self.assertEqual(image_dimensions(jpeg_header(4000, 3000)), (4000, 3000))
+        self.assertEqual(image_dimensions(jpeg_header(4000, 3000, orientation=6)), (3000, 4000))
+        webp = b'RIFF\x00\x00\x00\x00WEBPVP8X' + b'\x0a\x00\x00\x00' + b'\x00' * 4 + b'\x7f\x07\x00' + b'\x37\x04\x00'
+        self.assertEqual(image_dimensions(webp), (1920, 1080))
+
+    def test_unknown_or_truncated(self):
+        """Test that unreadable headers give None instead of raising"""
+        self.assertIsNone(image_dimensions(b'not an image'))
+        self.assertIsNone(image_dimensions(jpeg_header(10, 10)[:30]))
+        self.assertIsNone(image_dimensions(png(3, 2)[:20]))
+
+
+@mock_aws
+class TestGalleryManifest(unittest.TestCase):
+    def setUp(self):
+        """Set up a mock gallery bucket with a few photos"""
+        self.s3 = boto3.client('s3', region_name='ap-south-1')
+        self.bucket = 'g2u7a8.photos'
+        self.s3.create_bucket(Bucket=self.bucket, CreateBucketConfiguration={'LocationConstraint': 'ap-south-1'})
+        self.s3.put_object(Bucket=self.bucket, Key='a.png', Body=png(3, 2))
+        self.s3.put_object(Bucket=self.bucket, Key='b.jpg', Body=jpeg_header(640, 480, orientation=8))
+        self.s3.put_object(Bucket=self.bucket, Key='notes.txt', Body=b'x')
+
+    def test_incremental_rebuild(self):
+        """Test that unchanged ETags are reused and an unchanged manifest is not rewritten"""
+        stats = update_manifest(self.s3, self.bucket, placeholders=False)
+        self.assertEqual((stats['inspected'], stats['reused'], stats['written']), (2, 0, True))
+
+        manifest = load_manifest(self.s3, self.bucket)
+        self.assertEqual([entry['key'] for entry in manifest['images']], ['a.png', 'b.jpg'])
+        self.assertEqual([(entry['width'], entry['height']) for entry in manifest['images']], [(3, 2), (480, 640)])
+        self.assertEqual(manifest['images'][0]['size'], len(png(3, 2)))
+
+        stats = update_manifest(self.s3, self.bucket, placeholders=False)
+        self.assertEqual((stats['inspected'], stats['reused'], stats['written']), (0, 2, False))
+
+        self.s3.put_object(Bucket=self.bucket, Key='a.png', Body=png(5, 5))
+        self.s3.put_object(Bucket=self.bucket, Key='c.png', Body=png(1, 1))
+        stats = update_manifest(self.s3, self.bucket, placeholders=False)
+        self.assertEqual((stats['inspected'], stats['reused'], stats['written']), (2, 1, True))
+        manifest = load_manifest(self.s3, self.bucket)
+        self.assertEqual([(entry['key'], entry['width']) for entry in manifest['images']],
+                         [('a.png', 5), ('b.jpg', 480), ('c.png', 1)])
+
+    @unittest.skipUnless(pillow_available(), 'Pillow is not installed')
+    def test_placeholders(self):
+        """Test that placeholders are small JPEG data URIs"""
+        update_manifest(self.s3, self.bucket, placeholders=True)
+        placeholder = load_manifest(self.s3, self.bucket)['images'][0]['placeholder']
+        self.assertTrue(placeholder.startswith('data:image/jpeg;base64,'))
+        self.assertLess(len(placeholder), 1024)
+
+    @unittest.skipUnless(pillow_available(), 'Pillow is not installed')
+    def test_placeholders_filled_after_scheduled_rebuild(self):
+        """Test that a build with Pillow adds placeholders to entries the scheduled rebuild made without them"""
+        update_manifest(self.s3, self.bucket, placeholders=False)
+        stats = update_manifest(self.s3, self.bucket, placeholders=True)
+        self.assertEqual((stats['inspected'], stats['written']), (2, True))
+        placeholder = load_manifest(self.s3, self.bucket)['images'][0]['placeholder']
+        self.assertTrue(placeholder.startswith('data:image/jpeg;base64,'))
+
+        stats = update_manifest(self.s3, self.bucket, placeholders=False)
+        self.assertEqual(stats['reused'], 2)
+
+    def test_gallery_served_with_one_get(self):
+        """Test that /gallery reads the manifest instead of listing the bucket"""
+        update_manifest(self.s3, self.bucket, placeholders=False)
+        service = VisitorService('VisitorCounter', self.bucket, guards=(None, None))
+
+        sent = []
+        def count_request(event_name, **kwargs):
+            sent.append(event_name.rsplit('.', 1)[-1])
+
+        service.s3_gallery.meta.events.register('before-call.s3', count_request)
+        reply = service.gallery({'details': '1'})
+
+        self.assertEqual(sent, ['GetObject'])
+        self.assertEqual(len(reply.body['images']), 2)
+        self.assertEqual(reply.body['details'][1], {'width': 480, 'height': 640, 'placeholder': None})
+        self.assertNotIn('details', service.gallery({}).body)
+
+    def test_scheduled_rebuild_picks_up_uploads(self):
+        """Test that the scheduled handler adds new uploads to an existing manifest and drops deleted ones"""
+        update_manifest(self.s3, self.bucket, placeholders=False)
+        self.s3.put_object(Bucket=self.bucket, Key='c.png', Body=png(1, 1))
+        self.s3.delete_object(Bucket=self.bucket, Key='a.png')
+
+        stats = manifest_handler({}, None)
+        self.assertEqual((stats['inspected'], stats['reused'], stats['written']), (1, 1, True))
+        manifest = load_manifest(self.s3, self.bucket)
+        self.assertEqual([entry['key'] for entry in manifest['images']], ['b.jpg', 'c.png'])
+
+    def test_falls_back_to_listing(self):
+        """Test that /gallery lists the bucket when there is no manifest"""
+        service = VisitorService('VisitorCounter', self.bucket, guards=(None, None))
+        reply = service.gallery({'details': '1'})
+        self.assertEqual(len(reply.body['images']), 2)
+        self.assertIsNone(reply.body['details'])
+        self.assertIsNone(load_manifest(self.s3, self.bucket, GALLERY_MANIFEST_KEY))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,144 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest import mock
+import boto3
+from moto import mock_aws
+import history
+from history import HistoryStore, deltas_from_records
+
+T0 = datetime(2026, 10, 18, 9, 0, tzinfo=timezone.utc)
+
+
+def stream_record(at, old, new, item_id='visitor_stats', event='MODIFY', sequence='100000000000000000001'):
+    """A DynamoDB stream record for a counter item changing from `old` to `new` totals"""
+    def image(counts):
+        return {'id': {'S': item_id}, **{field: {'N': str(n)} for field, n in counts.items()}}
+    data = {'Keys': {'id': {'S': item_id}}, 'ApproximateCreationDateTime': at.timestamp(),
+            'SequenceNumber': sequence, 'NewImage': image(new)}
+    if old is not None:
+        data['OldImage'] = image(old)
+    return {'eventName': event, 'dynamodb': data}
+
+
+@mock_aws
+class TestHistory(unittest.TestCase):
+    def setUp(self):
+        dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+        self.table = dynamodb.create_table(
+            TableName='VisitorHistory',
+            KeySchema=[{'AttributeName': 'resolution', 'KeyType': 'HASH'},
+                       {'AttributeName': 'start', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': 'resolution', 'AttributeType': 'S'},
+                                  {'AttributeName': 'start', 'AttributeType': 'S'}],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        self.history = HistoryStore(self.table)
+
+    def views(self, window, now):
+        return [bucket['views'] for bucket in self.history.query(window, now)['buckets']]
+
+    def test_deltas_from_records(self):
+        """Test that stream records become per-minute increments, ignoring other items and decreases"""
+        records = [
+            stream_record(T0 + timedelta(seconds=5), None, {'views': 3}, event='INSERT'),
+            stream_record(T0 + timedelta(seconds=40), {'views': 3}, {'views': 5, 'downloads': 1}),
+            stream_record(T0 + timedelta(minutes=1), {'views': 2}, {'views': 4}, item_id='visitor_stats#3'),
+            stream_record(T0 + timedelta(minutes=2), {'views': 9}, {'views': 0}),
+            stream_record(T0 + timedelta(minutes=2), {'views': 1}, {'views': 2}, item_id='other'),
+        ]
+        self.assertEqual(deltas_from_records(records), {
+            T0: {'views': 5, 'downloads': 1},
+            T0 + timedelta(minutes=1): {'views': 2, 'downloads': 0},
+        })
+
+    def test_query_reads_minutes_before_compaction(self):
+        """Test that recent minutes are summed into the window's buckets, zero-filled"""
+        self.history.append({T0: {'views': 2}, T0 + timedelta(minutes=30): {'views': 3, 'downloads': 1}})
+        self.history.append({T0: {'views': 1}})
+
+        now = T0 + timedelta(minutes=45)
+        minutes = self.views('1h', now)
+        self.assertEqual(len(minutes), 60)
+        self.assertEqual(minutes[-46], 3)
+        self.assertEqual(minutes[-16], 3)
+
+        payload = self.history.query('24h', now)
+        self.assertEqual(payload['resolution'], 'hour')
+        self.assertEqual(payload['buckets'][-1], {'start': T0.isoformat(), 'views': 6, 'downloads': 1})
+        self.assertEqual(payload['totals'], {'views': 6, 'downloads': 1})
+
+    def test_compaction(self):
+        """Test that finished hours and days are rolled up and queries give the same totals afterwards"""
+        for hour in range(30):
+            self.history.append({T0 + timedelta(hours=hour, minutes=m): {'views': 1} for m in (0, 20, 40)})
+        now = T0 + timedelta(hours=29, minutes=50)
+        before = self.history.query('30d', now)['totals']
+
+        self.assertEqual(self.history.compact(now), {'hours': 29, 'days': 1})
+        self.assertEqual(self.history.compact(now), {'hours': 0, 'days': 0})
+        marks = self.history.watermarks()
+        self.assertEqual(marks['hour'], T0 + timedelta(hours=29))
+        self.assertEqual(marks['day'], datetime(2026, 10, 19, tzinfo=timezone.utc))
+
+        hour = self.table.get_item(Key={'resolution': 'hour', 'start': '2026-10-18T09'})['Item']
+        self.assertEqual(int(hour['views']), 3)
+        day = self.table.get_item(Key={'resolution': 'day', 'start': '2026-10-18'})['Item']
+        self.assertEqual(int(day['views']), 45)
+        self.assertNotIn('expires_at', day)
+
+        self.assertEqual(self.history.query('30d', now)['totals'], before)
+        self.assertEqual(self.views('30d', now)[-2:], [45, 45])
+        self.assertEqual(self.views('24h', now)[-1], 3)
+
+    def test_late_records_join_roll_ups(self):
+        """Test that increments for an already compacted hour are added to its roll-up"""
+        self.history.append({T0: {'views': 1}})
+        now = T0 + timedelta(hours=2)
+        self.history.compact(now)
+
+        self.history.append({T0 + timedelta(minutes=5): {'views': 4}})
+        self.assertEqual(self.views('24h', now)[-3], 5)
+        self.assertEqual(self.history.query('24h', now)['totals']['views'], 5)
+
+    def test_replayed_batch_is_not_counted_twice(self):
+        """Test that a stream batch retried after a partial failure only adds what was not written yet"""
+        event = {'Records': [
+            stream_record(T0, {'views': 1}, {'views': 3}, sequence='100000000000000000001'),
+            stream_record(T0 + timedelta(minutes=5), {'views': 3}, {'views': 4}, sequence='100000000000000000002'),
+            stream_record(T0 + timedelta(minutes=5), {'views': 5}, {'views': 7}, item_id='visitor_stats#1',
+                          sequence='99000000000000000003'),
+        ]}
+        now = T0 + timedelta(minutes=10)
+        add = HistoryStore._add
+        calls = []
+
+        def flaky_add(store, *args):
+            calls.append(args)
+            if len(calls) == 2:
+                raise RuntimeError('ProvisionedThroughputExceededException')
+            return add(store, *args)
+
+        with mock.patch.object(history, 'history_store', self.history):
+            with mock.patch.object(HistoryStore, '_add', flaky_add), self.assertRaises(RuntimeError):
+                history.history_handler(event, None)
+            history.history_handler(event, None)
+            history.history_handler(event, None)
+        self.assertEqual(self.views('1h', now)[-11:-4], [2, 0, 0, 0, 0, 3, 0])
+
+        # A later batch for the same minute still counts, and roll-ups keep ignoring the replayed one
+        sequence = '100000000000000000004'
+        later = stream_record(T0 + timedelta(minutes=5), {'views': 4}, {'views': 5}, sequence=sequence)
+        self.history.append(deltas_from_records([later]), 'visitor_stats', sequence.zfill(40))
+        self.history.compact(T0 + timedelta(hours=2))
+        with mock.patch.object(history, 'history_store', self.history):
+            history.history_handler(event, None)
+        self.assertEqual(self.history.query('24h', T0 + timedelta(hours=2))['totals']['views'], 6)
+
+    def test_unknown_window(self):
+        """Test that an unsupported window is rejected with ValueError"""
+        with self.assertRaises(ValueError):
+            self.history.history('5m')
+
+
+if __name__ == '__main__':
+    unittest.main()
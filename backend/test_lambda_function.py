@@ -2,7 +2,10 @@ import unittest
 import json
 import boto3
 import os
+from unittest import mock
 from moto import mock_aws
+from counter import CounterUnavailable
+import lambda_function
 from lambda_function import lambda_handler
 
 @mock_aws
@@ -52,6 +55,120 @@ class TestVisitorCounter(unittest.TestCase):
         self.assertEqual(body['views'], 0)
         self.assertEqual(body['downloads'], 1)
 
+    def test_single_round_trip_per_hit(self):
+        """Test that each visitor hit sends exactly one DynamoDB request"""
+        self.table.put_item(Item={'id': 'visitor_stats', 'views': 5, 'downloads': 2})
+
+        sent = []
+        def count_request(event_name, **kwargs):
+            sent.append(event_name.rsplit('.', 1)[-1])
+
+        events = lambda_function.table.meta.client.meta.events
+        events.register('before-send.dynamodb', count_request)
+        try:
+            response = lambda_handler({'body': json.dumps({'action': 'download'})}, None)
+        finally:
+            events.unregister('before-send.dynamodb', count_request)
+
+        body = json.loads(response['body'])
+        self.assertEqual(body, {'views': 5, 'downloads': 3})
+        self.assertEqual(sent, ['UpdateItem'])
+
+    def test_legacy_count_fallback(self):
+        """Test that the old 'count' attribute is still reported as views"""
+        self.table.put_item(Item={'id': 'visitor_stats', 'count': 10})
+
+        response = lambda_handler({'body': json.dumps({'action': 'download'})}, None)
+        body = json.loads(response['body'])
+        self.assertEqual(body, {'views': 10, 'downloads': 1})
+
+    def test_duplicate_view_served_from_cache(self):
+        """Test that a repeat view from the same visitor is not written again"""
+        event = {
+            'body': json.dumps({'action': 'view'}),
+            'requestContext': {'http': {'method': 'POST', 'sourceIp': '198.51.100.7', 'userAgent': 'test'}}
+        }
+        response = lambda_handler(event, None)
+        self.assertEqual(json.loads(response['body'])['views'], 1)
+
+        sent = []
+        def count_request(event_name, **kwargs):
+            sent.append(event_name)
+
+        events = lambda_function.table.meta.client.meta.events
+        events.register('before-send.dynamodb', count_request)
+        try:
+            response = lambda_handler(event, None)
+        finally:
+            events.unregister('before-send.dynamodb', count_request)
+
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body']), {'views': 1, 'downloads': 0})
+        self.assertEqual(sent, [])
+
+    def test_failed_view_is_not_deduplicated(self):
+        """Test that a retry after a lost write is counted instead of served from the dedup cache"""
+        event = {
+            'body': json.dumps({'action': 'view'}),
+            'requestContext': {'http': {'method': 'POST', 'sourceIp': '198.51.100.9', 'userAgent': 'test'}}
+        }
+        with mock.patch.object(lambda_function.service.counter_store, 'add',
+                               side_effect=RuntimeError('ValidationException')):
+            response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 500)
+
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertEqual(json.loads(response['body'])['views'], 1)
+
+    def test_kept_view_stays_deduplicated(self):
+        """Test that a view the store keeps for later (CounterUnavailable) is not counted again on retry"""
+        event = {
+            'body': json.dumps({'action': 'view'}),
+            'requestContext': {'http': {'method': 'POST', 'sourceIp': '198.51.100.10', 'userAgent': 'test'}}
+        }
+        with mock.patch.object(lambda_function.service.counter_store, 'add',
+                               side_effect=CounterUnavailable('no totals known yet')) as add:
+            response = lambda_handler(event, None)
+            self.assertEqual(response['statusCode'], 500)
+            lambda_handler(event, None)
+        self.assertEqual(add.call_count, 1)
+
+    def test_rate_limited(self):
+        """Test that a client over its rate limit gets 429 with Retry-After"""
+        event = {
+            'body': json.dumps({'action': 'download'}),
+            'requestContext': {'http': {'method': 'POST', 'sourceIp': '198.51.100.8'}}
+        }
+        statuses = [lambda_handler(event, None)['statusCode'] for _ in range(30)]
+        self.assertIn(429, statuses)
+
+        response = lambda_handler(event, None)
+        self.assertEqual(response['statusCode'], 429)
+        self.assertIn('Retry-After', response['headers'])
+
+    def test_route_by_raw_path(self):
+        """Test that requests without a routeKey are routed on rawPath"""
+        response = lambda_handler({'rawPath': '/visitor/stats'}, None)
+        self.assertEqual(response['statusCode'], 200)
+        self.assertFalse(json.loads(response['body'])['batching'])
+
+        response = lambda_handler({'routeKey': 'GET /visitor/stats'}, None)
+        self.assertFalse(json.loads(response['body'])['batching'])
+
+    def test_history_rejects_unknown_window(self):
+        """Test that GET /visitor/history answers 400 for an unsupported window"""
+        response = lambda_handler({'routeKey': 'GET /visitor/history',
+                                   'queryStringParameters': {'window': '5m'}}, None)
+        self.assertEqual(response['statusCode'], 400)
+        self.assertIn('window', json.loads(response['body'])['error'])
+
+    def test_unknown_route_counts_a_view(self):
+        """Test that unmatched requests fall through to the visitor counter"""
+        response = lambda_handler({'rawPath': '/'}, None)
+        body = json.loads(response['body'])
+        self.assertEqual(body, {'views': 1, 'downloads': 0})
+
     def test_cors_headers(self):
         """Test that CORS headers are returned"""
         event = {}
@@ -0,0 +1,89 @@
+import unittest
+from ratelimit import DedupWindow, TokenBucketLimiter, client_address, fingerprint
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestTokenBucketLimiter(unittest.TestCase):
+    def test_burst_then_refill(self):
+        """Test that a client gets its burst, is limited, then refills at the rate"""
+        clock = FakeClock()
+        limiter = TokenBucketLimiter(rate=2, burst=5, clock=clock)
+
+        self.assertTrue(all(limiter.allow('a')[0] for _ in range(5)))
+        allowed, retry_after = limiter.allow('a')
+        self.assertFalse(allowed)
+        self.assertAlmostEqual(retry_after, 0.5)
+
+        # Other clients are unaffected
+        self.assertTrue(limiter.allow('b')[0])
+
+        clock.now += 0.5
+        self.assertTrue(limiter.allow('a')[0])
+        self.assertFalse(limiter.allow('a')[0])
+
+    def test_bounded(self):
+        """Test that the least recently used clients are evicted"""
+        limiter = TokenBucketLimiter(rate=1, burst=1, max_keys=100, clock=FakeClock())
+        for i in range(1000):
+            limiter.allow(f'client-{i}')
+        self.assertEqual(len(limiter._buckets), 100)
+
+
+class TestDedupWindow(unittest.TestCase):
+    def test_window(self):
+        """Test that a key is a duplicate only within the window"""
+        clock = FakeClock()
+        dedup = DedupWindow(window=60, clock=clock)
+
+        self.assertFalse(dedup.seen('a'))
+        self.assertTrue(dedup.seen('a'))
+        clock.now += 59
+        self.assertTrue(dedup.seen('a'))
+        clock.now += 1
+        self.assertFalse(dedup.seen('a'))
+
+    def test_forget(self):
+        """Test that a forgotten key is new again inside the window"""
+        dedup = DedupWindow(window=60, clock=FakeClock())
+        self.assertFalse(dedup.seen('a'))
+        dedup.forget('a')
+        self.assertFalse(dedup.seen('a'))
+        self.assertTrue(dedup.seen('a'))
+
+    def test_bounded_and_expired(self):
+        """Test that the set never exceeds max_keys and drops expired keys"""
+        clock = FakeClock()
+        dedup = DedupWindow(window=60, max_keys=100, clock=clock)
+        for i in range(1000):
+            dedup.seen(f'visitor-{i}')
+        self.assertEqual(len(dedup._seen), 100)
+
+        clock.now += 61
+        dedup.seen('new')
+        self.assertEqual(len(dedup._seen), 1)
+
+
+class TestClientIdentity(unittest.TestCase):
+    def test_client_address(self):
+        """Test that only X-Forwarded-For entries added by trusted proxies are used"""
+        self.assertEqual(client_address('10.0.0.1', '1.2.3.4', hops=0), '10.0.0.1')
+        self.assertEqual(client_address('10.0.0.1', 'forged, 1.2.3.4', hops=1), '1.2.3.4')
+        self.assertEqual(client_address('10.0.0.1', 'forged, 1.2.3.4, 10.0.0.9', hops=2), '1.2.3.4')
+        self.assertEqual(client_address('10.0.0.1', None, hops=1), '10.0.0.1')
+
+    def test_fingerprint(self):
+        """Test that fingerprints are fixed-size and tell user agents apart"""
+        self.assertEqual(len(fingerprint('1.2.3.4', 'a' * 1000)), 24)
+        self.assertNotEqual(fingerprint('1.2.3.4', 'firefox'), fingerprint('1.2.3.4', 'chrome'))
+        self.assertEqual(fingerprint('1.2.3.4', None), fingerprint('1.2.3.4', None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import importlib
+import json
+import sys
+import unittest
+from datetime import datetime, timezone
+from decimal import Decimal
+
+import serialization
+
+
+class TestSerialization(unittest.TestCase):
+    def setUp(self):
+        self.body = {
+            'views': Decimal(42),
+            'ratio': Decimal('0.5'),
+            'points': [{'Timestamp': datetime(2026, 1, 2, 3, 0, tzinfo=timezone.utc), 'Sum': 1.0}],
+        }
+        self.expected = {
+            'views': 42,
+            'ratio': 0.5,
+            'points': [{'Timestamp': '2026-01-02T03:00:00+00:00', 'Sum': 1.0}],
+        }
+
+    def test_decimal_and_datetime(self):
+        """Test that Decimals and datetimes are encoded like the old DecimalEncoder/json_serial"""
+        self.assertEqual(json.loads(serialization.dumps(self.body)), self.expected)
+        self.assertEqual(json.loads(serialization.dumps_bytes(self.body)), self.expected)
+        self.assertIsInstance(json.loads(serialization.dumps(self.body))['views'], int)
+
+    def test_fallback_without_orjson(self):
+        """Test that the stdlib fallback produces the same JSON"""
+        orjson = sys.modules.get('orjson')
+        sys.modules['orjson'] = None
+        try:
+            fallback = importlib.reload(serialization)
+            self.assertEqual(fallback.BACKEND, 'json')
+            self.assertEqual(json.loads(fallback.dumps(self.body)), self.expected)
+            self.assertEqual(json.loads(fallback.dumps_bytes(self.body)), self.expected)
+        finally:
+            if orjson is None:
+                del sys.modules['orjson']
+            else:
+                sys.modules['orjson'] = orjson
+            importlib.reload(serialization)
+
+    def test_unsupported_type(self):
+        """Test that unknown types still raise TypeError"""
+        with self.assertRaises(TypeError):
+            serialization.dumps({'value': object()})
+
+
+if __name__ == '__main__':
+    unittest.main()
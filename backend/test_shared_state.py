@@ -0,0 +1,120 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from gallery import GalleryCache
+from shared_state import SharedCounterAggregator, SharedState, open_shared_state
+
+
+class MemoryStore:
+    """In-memory stand-in for CounterStore that counts its writes"""
+
+    def __init__(self, views=100):
+        self.totals = {'views': views, 'downloads': 0}
+        self.writes = 0
+
+    def add(self, deltas):
+        for field, n in deltas.items():
+            self.totals[field] += n
+        self.writes += 1
+        return dict(self.totals)
+
+    def read(self):
+        return dict(self.totals)
+
+
+class TestSharedState(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, 'state.db')
+        # Two workers: same file, different lease owners
+        self.workers = [SharedState(self.path, owner='worker-1'), SharedState(self.path, owner='worker-2')]
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_disabled_without_path(self):
+        """Test that no shared state is opened when SHARED_STATE_PATH is empty"""
+        self.assertIsNone(open_shared_state(''))
+
+    def test_concurrent_loads_call_the_loader_once(self):
+        """Test that workers missing the same entry wait for one load instead of each calling AWS"""
+        calls = []
+        def loader():
+            calls.append(1)
+            time.sleep(0.1)
+            return [['a.jpg', 'https://example.com/a.jpg']]
+
+        results = []
+        threads = [threading.Thread(target=lambda w=w: results.append(w.load('gallery', 60, loader)))
+                   for w in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([value for value, _ in results], [[['a.jpg', 'https://example.com/a.jpg']]] * 2)
+
+    def test_gallery_cache_reuses_another_workers_listing(self):
+        """Test that a second worker's gallery cache is filled from the shared store with its age"""
+        calls = []
+        def loader():
+            calls.append(1)
+            return [('a.jpg', 'https://example.com/a.jpg')]
+
+        first = GalleryCache(loader, ttl=60, stale_ttl=60, shared=self.workers[0]).get()
+        time.sleep(0.05)
+        second = GalleryCache(loader, ttl=60, stale_ttl=60, shared=self.workers[1]).get()
+
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(second.images, first.images)
+        self.assertEqual(second.etag, first.etag)
+        self.assertGreaterEqual(time.monotonic() - second.fetched_at, 0.05)
+
+    def test_counter_is_shared_and_flushed_once(self):
+        """Test that increments from every worker are reported together and written as one ADD"""
+        store = MemoryStore()
+        counters = [SharedCounterAggregator(store, worker, flush_interval=0, flush_threshold=1000)
+                    for worker in self.workers]
+        for _ in range(30):
+            counters[0].increment('views')
+            counts = counters[1].increment('downloads')
+
+        self.assertEqual(counts, {'views': 130, 'downloads': 30})
+        self.assertEqual(counters[0].counts(), counts)
+        self.assertEqual(store.writes, 0)
+
+        counters[1].flush()
+        counters[0].flush()
+        self.assertEqual(store.writes, 1)
+        self.assertEqual(store.totals, {'views': 130, 'downloads': 30})
+        self.assertEqual(counters[0].stats()['flushes'], 1)
+        self.assertEqual(counters[0].counts(), counts)
+
+    def test_stale_totals_never_lower_the_counts(self):
+        """Test that a flush reporting old totals does not make the counts go backwards"""
+        store = MemoryStore()
+        counter = SharedCounterAggregator(store, self.workers[0], flush_interval=0)
+        counter.increment('views')
+        counter.flush()
+
+        store.add = lambda deltas: {'views': 50, 'downloads': 0}  # a degraded estimate
+        counter.increment('views')
+        counter.flush()
+        self.assertEqual(counter.counts()['views'], 102)
+
+    def test_interrupted_flush_is_retried(self):
+        """Test that a batch claimed by a worker that died is sent again"""
+        self.workers[0].add_pending({'views': 5})
+        self.assertIsNotNone(self.workers[0].claim_pending())
+        self.assertIsNone(self.workers[1].claim_pending())
+
+        self.workers[1].reset()
+        batch, _ = self.workers[1].claim_pending()
+        self.assertEqual(batch, {'views': 5, 'downloads': 0})
+
+
+if __name__ == '__main__':
+    unittest.main()
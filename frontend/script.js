@@ -248,7 +248,8 @@ document.addEventListener('DOMContentLoaded', () => {
         galleryGrid.innerHTML = '<div class="gallery-loader">Fetching images...</div>';
         try {
             console.log("Fetching: " + galleryApiEndpoint);
-            const response = await fetch(galleryApiEndpoint, { cache: "no-store" });
+            // details=1 adds each photo's size and a tiny placeholder (when the gallery manifest is built)
+            const response = await fetch(galleryApiEndpoint + '?details=1', { cache: "no-cache" });
             console.log("Response Status:", response.status);
 
             if (!response.ok) throw new Error('API failed with ' + response.status);
@@ -271,6 +272,17 @@ document.addEventListener('DOMContentLoaded', () => {
                     img.loading = 'lazy'; // Performance
                     img.alt = 'Photography';
 
+                    // Reserve the photo's space and show its blurred placeholder until it loads
+                    const details = data.details && data.details[index];
+                    if (details && details.width && details.height) {
+                        img.width = details.width;
+                        img.height = details.height;
+                    }
+                    if (details && details.placeholder) {
+                        img.style.backgroundImage = `url("${details.placeholder}")`;
+                        img.style.backgroundSize = 'cover';
+                    }
+
                     // Update: Open Lightbox with Index
                     itemDiv.onclick = () => openLightbox(index);
 
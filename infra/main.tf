@@ -5,6 +5,10 @@ resource "aws_dynamodb_table" "visitor_counter" {
   billing_mode   = "PAY_PER_REQUEST"
   hash_key       = "id"
 
+  # Every counter change, with old and new totals, feeds the visitor history
+  stream_enabled   = true
+  stream_view_type = "NEW_AND_OLD_IMAGES"
+
   attribute {
     name = "id"
     type = "S"
@@ -15,13 +19,43 @@ resource "aws_dynamodb_table" "visitor_counter" {
   }
 }
 
+# Views and downloads per minute, hour and day (see backend/history.py)
+resource "aws_dynamodb_table" "visitor_history" {
+  name           = "VisitorHistory"
+  billing_mode   = "PAY_PER_REQUEST"
+  hash_key       = "resolution"
+  range_key      = "start"
+
+  attribute {
+    name = "resolution"
+    type = "S"
+  }
+
+  attribute {
+    name = "start"
+    type = "S"
+  }
+
+  # Minute and hour buckets expire once they have been rolled up
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = {
+    Project = "CloudResume"
+  }
+}
+
 # --- Lambda Function ---
 
 # Archive the python code
 data "archive_file" "lambda_zip" {
   type        = "zip"
-  source_file = "${path.module}/../backend/lambda_function.py"
+  source_dir  = "${path.module}/../backend"
   output_path = "${path.module}/lambda_function.zip"
+  # Bytecode compiled by the pipeline is kept, except for files that are not shipped
+  excludes    = ["Dockerfile", "Dockerfile.server", ".dockerignore", "requirements.txt", "requirements-server.txt", "requirements-dev.txt", "main.py", "gunicorn.conf.py", "test_*.py", "benchmarks/**", ".pytest_cache/**", "__pycache__/test_*", "__pycache__/main.*", "__pycache__/gunicorn.conf.*"]
 }
 
 # IAM Role for Lambda
@@ -58,11 +92,32 @@ resource "aws_iam_policy" "dynamodb_access" {
       {
         Action = [
           "dynamodb:GetItem",
+          "dynamodb:BatchGetItem", # ShardedCounterStore.read (COUNTER_SHARDS > 0)
           "dynamodb:PutItem",
           "dynamodb:UpdateItem"
         ]
         Effect   = "Allow"
         Resource = aws_dynamodb_table.visitor_counter.arn
+      },
+      {
+        Action = [
+          "dynamodb:GetItem",
+          "dynamodb:PutItem",
+          "dynamodb:UpdateItem",
+          "dynamodb:Query"
+        ]
+        Effect   = "Allow"
+        Resource = aws_dynamodb_table.visitor_history.arn
+      },
+      {
+        Action = [
+          "dynamodb:DescribeStream",
+          "dynamodb:GetRecords",
+          "dynamodb:GetShardIterator",
+          "dynamodb:ListStreams"
+        ]
+        Effect   = "Allow"
+        Resource = aws_dynamodb_table.visitor_counter.stream_arn
       }
     ]
   })
@@ -95,6 +150,14 @@ resource "aws_iam_policy" "s3_list_access" {
           "arn:aws:s3:::gauravyadav.site/*",
           "arn:aws:s3:::g2u7a8.photos/*"
         ]
+      },
+      {
+        # GalleryManifestFunction writes the gallery manifest, and nothing else
+        Action = [
+          "s3:PutObject"
+        ]
+        Effect   = "Allow"
+        Resource = "arn:aws:s3:::g2u7a8.photos/gallery-manifest.json"
       }
     ]
   })
@@ -119,7 +182,7 @@ resource "aws_iam_policy" "cw_access" {
     Statement = [
       {
         Action = [
-          "cloudwatch:GetMetricStatistics"
+          "cloudwatch:GetMetricData"
         ]
         Effect   = "Allow"
         Resource = "*"
@@ -147,8 +210,11 @@ resource "aws_lambda_function" "visitor_counter_lambda" {
   environment {
     variables = {
       TABLE_NAME          = aws_dynamodb_table.visitor_counter.name
+      HISTORY_TABLE_NAME  = aws_dynamodb_table.visitor_history.name
       BUCKET_NAME         = "gauravyadav.site"
       GALLERY_BUCKET_NAME = "g2u7a8.photos"
+      # Print the full event for 1% of invocations
+      EVENT_LOG_SAMPLE_RATE = "0.01"
     }
   }
 }
@@ -159,6 +225,106 @@ resource "aws_cloudwatch_log_group" "lambda_logs" {
   retention_in_days = 7
 }
 
+# --- Visitor History ---
+
+# Appends the counter table's stream to the history buckets and rolls them up
+resource "aws_lambda_function" "visitor_history_lambda" {
+  filename         = data.archive_file.lambda_zip.output_path
+  function_name    = "VisitorHistoryFunction"
+  role             = aws_iam_role.lambda_exec.arn
+  handler          = "history.history_handler"
+  runtime          = "python3.12"
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+
+  memory_size = 256
+  timeout     = 60
+
+  environment {
+    variables = {
+      HISTORY_TABLE_NAME = aws_dynamodb_table.visitor_history.name
+    }
+  }
+}
+
+resource "aws_cloudwatch_log_group" "history_logs" {
+  name              = "/aws/lambda/${aws_lambda_function.visitor_history_lambda.function_name}"
+  retention_in_days = 7
+}
+
+# Records are delivered in batches of up to a minute, usually one history write per batch
+resource "aws_lambda_event_source_mapping" "counter_stream" {
+  event_source_arn                   = aws_dynamodb_table.visitor_counter.stream_arn
+  function_name                      = aws_lambda_function.visitor_history_lambda.arn
+  starting_position                  = "LATEST"
+  batch_size                         = 1000
+  maximum_batching_window_in_seconds = 60
+}
+
+# Roll-ups also run on a schedule, so quiet hours are compacted without new visits
+resource "aws_cloudwatch_event_rule" "history_compaction" {
+  name                = "VisitorHistoryCompaction"
+  schedule_expression = "rate(15 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "history_compaction" {
+  rule = aws_cloudwatch_event_rule.history_compaction.name
+  arn  = aws_lambda_function.visitor_history_lambda.arn
+}
+
+resource "aws_lambda_permission" "history_schedule" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.visitor_history_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.history_compaction.arn
+}
+
+# --- Gallery Manifest ---
+
+# Rebuilds gallery-manifest.json so new uploads appear without a backend deploy.
+# The gallery bucket is in ap-south-1, so its S3 events can't reach a Lambda here;
+# a schedule picks up changes instead (one listing per run).
+resource "aws_lambda_function" "gallery_manifest_lambda" {
+  filename         = data.archive_file.lambda_zip.output_path
+  function_name    = "GalleryManifestFunction"
+  role             = aws_iam_role.lambda_exec.arn
+  handler          = "gallery_manifest.manifest_handler"
+  runtime          = "python3.12"
+  source_code_hash = data.archive_file.lambda_zip.output_base64sha256
+
+  memory_size = 512
+  timeout     = 120
+
+  environment {
+    variables = {
+      GALLERY_BUCKET_NAME = "g2u7a8.photos"
+    }
+  }
+}
+
+resource "aws_cloudwatch_log_group" "gallery_manifest_logs" {
+  name              = "/aws/lambda/${aws_lambda_function.gallery_manifest_lambda.function_name}"
+  retention_in_days = 7
+}
+
+resource "aws_cloudwatch_event_rule" "gallery_manifest" {
+  name                = "GalleryManifestRebuild"
+  schedule_expression = "rate(5 minutes)"
+}
+
+resource "aws_cloudwatch_event_target" "gallery_manifest" {
+  rule = aws_cloudwatch_event_rule.gallery_manifest.name
+  arn  = aws_lambda_function.gallery_manifest_lambda.arn
+}
+
+resource "aws_lambda_permission" "gallery_manifest_schedule" {
+  statement_id  = "AllowExecutionFromEventBridge"
+  action        = "lambda:InvokeFunction"
+  function_name = aws_lambda_function.gallery_manifest_lambda.function_name
+  principal     = "events.amazonaws.com"
+  source_arn    = aws_cloudwatch_event_rule.gallery_manifest.arn
+}
+
 # --- API Gateway (HTTP API) ---
 resource "aws_apigatewayv2_api" "http_api" {
   name          = "ResumeAPI"
@@ -207,6 +373,13 @@ resource "aws_apigatewayv2_route" "metrics_route" {
   target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
 }
 
+# Route for GET /visitor/history
+resource "aws_apigatewayv2_route" "visitor_history_route" {
+  api_id    = aws_apigatewayv2_api.http_api.id
+  route_key = "GET /visitor/history"
+  target    = "integrations/${aws_apigatewayv2_integration.lambda_integration.id}"
+}
+
 # Permission for API Gateway to invoke Lambda
 resource "aws_lambda_permission" "api_gw" {
   statement_id  = "AllowExecutionFromAPIGateway"
@@ -0,0 +1,227 @@
+"""
+Open-loop load generator (MODE=load in main.py).
+
+All requests come from one address, so the backend's per-client guards
+would shape the run: run it with VISITOR_RATE_LIMIT=0 and
+VISITOR_DEDUP_WINDOW=0, as the benchmarks do. Otherwise most views are
+rejected with 429 or answered from the dedup cache. 429s are counted as
+`limited` and left out of the SLO numbers, so the rate limiter does not
+read as an outage.
+"""
+import logging
+import math
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from slo import make_tracker
+
+# Load profile: comma-separated "<duration>:<target rps>" stages. Each stage ramps
+# linearly from the previous target (starting at 0) to its own, like k6 stages.
+LOAD_STAGES = os.environ.get("LOAD_STAGES", "30s:10,2m:50,30s:0")
+# Weighted request mix: "<action>:<weight>" for the actions in ACTIONS
+LOAD_MIX = os.environ.get("LOAD_MIX", "view:60,download:10,gallery:15,metrics:10,health:5")
+LOAD_WORKERS = int(os.environ.get("LOAD_WORKERS", "64"))           # Max concurrent requests
+LOAD_MAX_BACKLOG = int(os.environ.get("LOAD_MAX_BACKLOG", "10000"))  # Scheduled but not yet sent
+REQUEST_TIMEOUT = float(os.environ.get("REQUEST_TIMEOUT", "2"))
+REPORT_INTERVAL = float(os.environ.get("REPORT_INTERVAL", "10"))
+
+# action -> (method, path, JSON body)
+ACTIONS = {
+    "view": ("POST", "/visitor", {"action": "view"}),
+    "download": ("POST", "/visitor", {"action": "download"}),
+    "gallery": ("GET", "/gallery", None),
+    "metrics": ("GET", "/metrics", None),
+    "health": ("GET", "/health", None),
+}
+
+logger = logging.getLogger(__name__)
+
+
+def parse_duration(text):
+    """'90', '90s', '2m' or '1h' -> seconds."""
+    units = {"s": 1, "m": 60, "h": 3600}
+    text = text.strip()
+    if text[-1:] in units:
+        return float(text[:-1]) * units[text[-1]]
+    return float(text)
+
+
+def parse_stages(text):
+    stages = []
+    for part in text.split(","):
+        duration, target = part.split(":")
+        stages.append((parse_duration(duration), float(target)))
+    return stages
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        action, weight = part.split(":")
+        action = action.strip()
+        if action not in ACTIONS:
+            raise ValueError(f"Unknown action '{action}' (expected one of {', '.join(ACTIONS)})")
+        mix[action] = float(weight)
+    return mix
+
+
+def send_offsets(stages, start_rate=0.0):
+    """
+    Yield the send time (seconds from start) of every request for a
+    piecewise-linear arrival rate.
+
+    The n-th request is due when the integral of the rate reaches n, solved
+    exactly per stage, so the schedule never depends on how fast responses
+    come back (open loop). A zero-length stage is a step change: the rate
+    jumps straight to its target.
+    """
+    offset = 0.0
+    rate = start_rate
+    sent = 0.0
+    n = 1
+    for duration, target in stages:
+        if duration <= 0:
+            rate = target
+            continue
+        slope = (target - rate) / duration
+        stage_total = rate * duration + slope * duration ** 2 / 2
+        while sent + stage_total >= n:
+            need = n - sent
+            if abs(slope) < 1e-12:
+                tau = need / rate
+            else:
+                tau = (-rate + math.sqrt(max(0.0, rate * rate + 2 * slope * need))) / slope
+            yield offset + tau
+            n += 1
+        sent += stage_total
+        offset += duration
+        rate = target
+
+
+class LoadGenerator:
+    """
+    Open-loop load generator.
+
+    A scheduler thread releases requests at the times given by the stage
+    profile and hands them to a pool of workers with persistent keep-alive
+    sessions. Latency is measured from the *scheduled* send time, so time a
+    request spends waiting for a free worker (because the backend is slow) is
+    counted instead of silently lowering the offered rate (coordinated
+    omission).
+    """
+
+    def __init__(self, target_url, stages, mix, workers=LOAD_WORKERS, timeout=REQUEST_TIMEOUT,
+                 max_backlog=LOAD_MAX_BACKLOG, report_interval=REPORT_INTERVAL, tracker=None):
+        self.target_url = target_url.rstrip("/")
+        self.stages = stages
+        self.actions = list(mix)
+        self.weights = [mix[action] for action in self.actions]
+        self.workers = workers
+        self.timeout = timeout
+        self.max_backlog = max_backlog
+        self.report_interval = report_interval
+        self.slo = tracker or make_tracker()
+        self.totals = {"sent": 0, "errors": 0, "dropped": 0, "limited": 0}
+        self._totals_lock = threading.Lock()
+
+        self._local = threading.local()
+        self._backlog = 0
+        self._backlog_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    @classmethod
+    def from_env(cls, target_url):
+        return cls(target_url, parse_stages(LOAD_STAGES), parse_mix(LOAD_MIX))
+
+    def _session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._local.session = session
+        return session
+
+    def fire(self, action, scheduled):
+        method, path, body = ACTIONS[action]
+        ok = False
+        limited = False
+        try:
+            response = self._session().request(method, self.target_url + path, json=body, timeout=self.timeout)
+            ok = response.status_code < 400
+            limited = response.status_code == 429
+        except requests.RequestException as e:
+            logger.debug(f"{action} failed: {str(e)}")
+        finally:
+            # A 429 is the backend's rate limiter refusing this one client, not a failure of the service
+            if not limited:
+                self.slo.record(path, action, time.perf_counter() - scheduled, ok)
+            with self._totals_lock:
+                self.totals["sent"] += 1
+                if limited:
+                    self.totals["limited"] += 1
+                elif not ok:
+                    self.totals["errors"] += 1
+            with self._backlog_lock:
+                self._backlog -= 1
+
+    def drop(self, action, scheduled):
+        # A request shed because the backlog is full still failed, as late as it is now
+        self.slo.record(ACTIONS[action][1], action, time.perf_counter() - scheduled, False)
+        with self._totals_lock:
+            self.totals["dropped"] += 1
+
+    def run(self):
+        total = sum(duration for duration, _ in self.stages)
+        logger.info(f"Starting load generator targeting {self.target_url} for {total:.0f}s "
+                    f"with stages {self.stages}")
+
+        reporter = threading.Thread(target=self._report_loop, name="load-reporter", daemon=True)
+        reporter.start()
+
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="load") as executor:
+            start = time.perf_counter()
+            for offset in send_offsets(self.stages):
+                scheduled = start + offset
+                delay = scheduled - time.perf_counter()
+                if delay > 0 and self._stop.wait(delay):
+                    break
+
+                action = random.choices(self.actions, self.weights)[0]
+                with self._backlog_lock:
+                    shed = self._backlog >= self.max_backlog
+                    if not shed:
+                        self._backlog += 1
+                if shed:
+                    self.drop(action, scheduled)
+                    continue
+                executor.submit(self.fire, action, scheduled)
+
+        self._stop.set()
+        reporter.join()
+        self.report()
+        return self.totals
+
+    def stop(self):
+        self._stop.set()
+
+    def _report_loop(self):
+        while not self._stop.wait(self.report_interval):
+            self.report()
+
+    def report(self):
+        # Latency is reported from the scheduled send time, per endpoint and action
+        self.slo.log_report(seconds=max(self.report_interval, 60))
+        totals = self.totals
+        logger.info(f"Totals: sent={totals['sent']} errors={totals['errors']} dropped={totals['dropped']} "
+                    f"limited={totals['limited']}")
+        if totals["limited"]:
+            logger.warning("Requests are being rate limited (429); run the backend with VISITOR_RATE_LIMIT=0 "
+                           "and VISITOR_DEDUP_WINDOW=0 for load tests")
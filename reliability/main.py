@@ -3,11 +3,13 @@ import requests
 import random
 import os
 import logging
+from slo import make_tracker
 
 # Configuration
+MODE = os.environ.get("MODE", "agent") # "agent": SLO probe, "load": open-loop load generator (see loadgen.py)
 TARGET_URL = os.environ.get("TARGET_URL", "http://cloud-resume-backend:8000")
 INTERVAL = float(os.environ.get("INTERVAL", "1.0")) # Seconds between requests
-FAILURE_RATE_THRESHOLD = 0.001 # 0.1% matches our 99.9% SLO
+# SLO targets (99.9% availability, latency threshold) are configured in slo.py
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
@@ -15,8 +17,7 @@ logger = logging.getLogger(__name__)
 class ReliabilityAgent:
     def __init__(self):
         self.total_requests = 0
-        self.failed_requests = 0
-        self.latency_sum = 0
+        self.slo = make_tracker()
 
     def run(self):
         logger.info(f"Starting Reliability Agent targeting {TARGET_URL}")
@@ -27,47 +28,40 @@ class ReliabilityAgent:
 
     def send_traffic(self):
         self.total_requests += 1 # Count every attempt
-        try:
-            start_time = time.time()
-            
-            # Simulate User Behavior (90% View, 10% Download)
-            action = "view"
-            if random.random() < 0.1:
-                action = "download"
 
-            payload = {"action": action}
-            
+        # Simulate User Behavior (90% View, 10% Download)
+        action = "view"
+        if random.random() < 0.1:
+            action = "download"
+
+        payload = {"action": action}
+        start_time = time.perf_counter()
+        ok = False
+        try:
             # Request to Backend
             response = requests.post(f"{TARGET_URL}/visitor", json=payload, timeout=2)
-            
-            duration = time.time() - start_time
-            self.latency_sum += duration
+            ok = response.status_code == 200
 
-            if response.status_code == 200:
-                logger.debug(f"Success: {action} in {duration:.4f}s")
+            if ok:
+                logger.debug(f"Success: {action} in {time.perf_counter() - start_time:.4f}s")
             else:
-                self.failed_requests += 1
                 logger.error(f"Failed: Status {response.status_code}")
 
         except Exception as e:
-            self.failed_requests += 1
             logger.error(f"Connection Failed: {str(e)}")
 
+        # Failed connections are recorded too, with the time it took to fail
+        self.slo.record("/visitor", action, time.perf_counter() - start_time, ok)
+
     def validate_slo(self):
-        if self.total_requests > 0 and self.total_requests % 10 == 0: # Check every 10 requests, safe divide
-            error_rate = self.failed_requests / self.total_requests
-            avg_latency = 0
-            # Latency sum might be for fewer requests if some failed connection entirely (no duration)
-            # But roughly:
-            if self.total_requests > self.failed_requests:
-                 avg_latency = self.latency_sum / (self.total_requests - self.failed_requests)
-            
-            status = "PASS"
-            if error_rate > FAILURE_RATE_THRESHOLD:
-                status = "SLO BREACH"
-            
-            logger.info(f"SLO Status: {status} | Error Rate: {error_rate:.2%} | Avg Latency: {avg_latency:.4f}s")
+        if self.total_requests % 10 == 0: # Check every 10 requests
+            # Percentiles over the last 5 minutes; burn rates over the alert windows
+            self.slo.log_report(seconds=300)
 
 if __name__ == "__main__":
-    agent = ReliabilityAgent()
-    agent.run()
+    if MODE == "load":
+        from loadgen import LoadGenerator
+        LoadGenerator.from_env(TARGET_URL).run()
+    else:
+        agent = ReliabilityAgent()
+        agent.run()
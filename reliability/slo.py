@@ -0,0 +1,275 @@
+import logging
+import math
+import os
+import threading
+import time
+
+# Availability SLO: 99.9% of requests succeed
+AVAILABILITY_TARGET = float(os.environ.get("AVAILABILITY_TARGET", "0.999"))
+# Latency SLO: LATENCY_TARGET of requests finish within LATENCY_THRESHOLD seconds
+LATENCY_THRESHOLD = float(os.environ.get("LATENCY_THRESHOLD", "0.5"))
+LATENCY_TARGET = float(os.environ.get("LATENCY_TARGET", "0.99"))
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9100"))  # 0 disables the Prometheus exporter
+
+# Multi-window, multi-burn-rate alerts (Google SRE workbook): an alert fires
+# only while both the long and the short window burn faster than the factor.
+# (severity, long window, short window, burn rate factor)
+BURN_RATE_ALERTS = (
+    ("page", 3600, 300, 14.4),
+    ("ticket", 6 * 3600, 1800, 6.0),
+)
+
+SLOT_SECONDS = 60
+HISTORY_SECONDS = max(long for _, long, _, _ in BURN_RATE_ALERTS)
+QUANTILES = (0.5, 0.9, 0.99, 0.999)
+
+logger = logging.getLogger(__name__)
+
+
+class LogHistogram:
+    """
+    Streaming latency histogram with log-spaced buckets.
+
+    Values between MIN_VALUE and MAX_VALUE land in buckets that are
+    PRECISION (2%) wide relative to their value, so any quantile is accurate
+    to about 2% and the histogram never holds more than ~800 buckets however
+    many samples it sees. Buckets are stored sparsely.
+    """
+
+    MIN_VALUE = 1e-4   # 0.1 ms
+    MAX_VALUE = 120.0  # seconds
+    PRECISION = 0.02
+    _LOG_BASE = math.log1p(PRECISION)
+    MAX_INDEX = int(math.log(MAX_VALUE / MIN_VALUE) / _LOG_BASE) + 1
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def index(cls, value):
+        if value <= cls.MIN_VALUE:
+            return 0
+        return min(cls.MAX_INDEX, int(math.log(value / cls.MIN_VALUE) / cls._LOG_BASE) + 1)
+
+    @classmethod
+    def upper_bound(cls, index):
+        return cls.MIN_VALUE * (1 + cls.PRECISION) ** index
+
+    def record(self, value):
+        index = self.index(value)
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def merge(self, other):
+        for index, n in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q):
+        if not self.count:
+            return float("nan")
+        rank = q * self.count
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.upper_bound(index), self.max)
+        return self.max
+
+
+class _Slot:
+    """Everything recorded during one SLOT_SECONDS interval."""
+
+    def __init__(self, start):
+        self.start = start
+        self.series = {}  # (endpoint, action) -> [histogram, errors, slow]
+
+    def entry(self, key):
+        entry = self.series.get(key)
+        if entry is None:
+            entry = self.series[key] = [LogHistogram(), 0, 0]
+        return entry
+
+
+class SLOTracker:
+    """
+    Sliding-window request statistics and SLO evaluation.
+
+    Samples go into per-minute slots kept for the longest alert window, so
+    memory is fixed and old history stops counting once it leaves a window.
+    Quantiles are available per (endpoint, action) and per endpoint, and both
+    the availability and latency SLOs are evaluated with multi-window burn
+    rates.
+    """
+
+    def __init__(self, latency_threshold=LATENCY_THRESHOLD, availability_target=AVAILABILITY_TARGET,
+                 latency_target=LATENCY_TARGET, clock=time.time):
+        self.latency_threshold = latency_threshold
+        self.availability_target = availability_target
+        self.latency_target = latency_target
+        self.clock = clock
+        self._slots = []
+        self._lock = threading.Lock()
+        self.exporter = None
+
+    def record(self, endpoint, action, latency, ok):
+        now = self.clock()
+        slot_start = now - now % SLOT_SECONDS
+        with self._lock:
+            if not self._slots or self._slots[-1].start != slot_start:
+                self._slots.append(_Slot(slot_start))
+                # Drop slots that no window can reach any more
+                while self._slots and self._slots[0].start <= now - HISTORY_SECONDS - SLOT_SECONDS:
+                    self._slots.pop(0)
+            entry = self._slots[-1].entry((endpoint, action))
+            entry[0].record(latency)
+            if not ok:
+                entry[1] += 1
+            if latency > self.latency_threshold:
+                entry[2] += 1
+
+        if self.exporter is not None:
+            self.exporter.observe(endpoint, action, latency, ok)
+
+    def window(self, seconds):
+        """Merge the last `seconds` of samples: {(endpoint, action): (histogram, errors, slow)}."""
+        since = self.clock() - seconds
+        merged = {}
+        with self._lock:
+            for slot in self._slots:
+                if slot.start + SLOT_SECONDS <= since:
+                    continue
+                for key, (histogram, errors, slow) in slot.series.items():
+                    entry = merged.get(key)
+                    if entry is None:
+                        entry = merged[key] = [LogHistogram(), 0, 0]
+                    entry[0].merge(histogram)
+                    entry[1] += errors
+                    entry[2] += slow
+        return merged
+
+    def quantiles(self, seconds):
+        """
+        {label: {'count', 'errors', 'p50', 'p90', 'p99', 'p999'}} for every
+        'endpoint action' pair and every endpoint over the last `seconds`.
+        """
+        per_key = self.window(seconds)
+        per_endpoint = {}
+        for (endpoint, _), (histogram, errors, slow) in per_key.items():
+            entry = per_endpoint.setdefault(endpoint, [LogHistogram(), 0, 0])
+            entry[0].merge(histogram)
+            entry[1] += errors
+            entry[2] += slow
+
+        labelled = {f"{endpoint} {action}": entry for (endpoint, action), entry in per_key.items()}
+        labelled.update(per_endpoint)
+
+        result = {}
+        for label, (histogram, errors, _) in sorted(labelled.items()):
+            summary = {"count": histogram.count, "errors": errors}
+            for q in QUANTILES:
+                summary[quantile_name(q)] = histogram.quantile(q)
+            result[label] = summary
+        return result
+
+    def burn_rate(self, seconds, slo):
+        """How fast the `slo` ('availability' or 'latency') error budget burns over a window."""
+        total = bad = 0
+        for histogram, errors, slow in self.window(seconds).values():
+            total += histogram.count
+            bad += errors if slo == "availability" else slow
+        if not total:
+            return 0.0
+        target = self.availability_target if slo == "availability" else self.latency_target
+        return (bad / total) / (1 - target)
+
+    def evaluate(self):
+        """
+        Evaluate both SLOs against every burn rate alert.
+
+        Returns {slo: {'burn_rates': {window: rate}, 'alerts': [severity, ...]}}.
+        """
+        windows = sorted({w for _, long, short, _ in BURN_RATE_ALERTS for w in (long, short)})
+        results = {}
+        for slo in ("availability", "latency"):
+            rates = {window: self.burn_rate(window, slo) for window in windows}
+            alerts = [severity for severity, long, short, factor in BURN_RATE_ALERTS
+                      if rates[long] > factor and rates[short] > factor]
+            results[slo] = {"burn_rates": rates, "alerts": alerts}
+
+        if self.exporter is not None:
+            self.exporter.publish(self, results)
+        return results
+
+    def log_report(self, seconds=300):
+        for label, summary in self.quantiles(seconds).items():
+            logger.info(f"{label:<18} n={summary['count']:<6} errors={summary['errors']:<4} "
+                        + " ".join(f"{name}={summary[name] * 1000:.1f}ms" for name in ("p50", "p90", "p99", "p999")))
+
+        for slo, result in self.evaluate().items():
+            status = "SLO BREACH (" + ", ".join(result["alerts"]) + ")" if result["alerts"] else "PASS"
+            rates = " ".join(f"{format_window(window)}={rate:.2f}x" for window, rate in result["burn_rates"].items())
+            logger.info(f"SLO {slo}: {status} | burn rates {rates}")
+
+
+def quantile_name(q):
+    return "p" + f"{q * 100:g}".replace(".", "")
+
+
+def format_window(seconds):
+    return f"{seconds // 3600}h" if seconds % 3600 == 0 else f"{seconds // 60}m"
+
+
+class PrometheusExporter:
+    """Publishes request and SLO metrics on /metrics (requires prometheus_client)."""
+
+    def __init__(self, port=METRICS_PORT, latency_threshold=LATENCY_THRESHOLD):
+        import prometheus_client as prom
+
+        buckets = sorted({0.005, 0.01, 0.025, 0.05, 0.1, 0.25, latency_threshold, 1.0, 2.5, 5.0, 10.0})
+        self.requests = prom.Counter("reliability_requests_total", "Requests sent by the reliability agent",
+                                     ["endpoint", "action", "outcome"])
+        self.duration = prom.Histogram("reliability_request_duration_seconds", "Request latency seen by the agent",
+                                       ["endpoint", "action"], buckets=buckets)
+        self.quantile = prom.Gauge("reliability_latency_quantile_seconds", "Latency quantiles over the last 5 minutes",
+                                   ["series", "quantile"])
+        self.burn_rate = prom.Gauge("reliability_slo_burn_rate", "Error budget burn rate",
+                                    ["slo", "window"])
+        self.alert = prom.Gauge("reliability_slo_alert", "1 while a burn rate alert is firing",
+                                ["slo", "severity"])
+        prom.start_http_server(port)
+        logger.info(f"Prometheus metrics on :{port}/metrics")
+
+    def observe(self, endpoint, action, latency, ok):
+        self.requests.labels(endpoint, action, "success" if ok else "error").inc()
+        self.duration.labels(endpoint, action).observe(latency)
+
+    def publish(self, tracker, results):
+        for label, summary in tracker.quantiles(300).items():
+            for q in QUANTILES:
+                value = summary[quantile_name(q)]
+                if not math.isnan(value):
+                    self.quantile.labels(label, str(q)).set(value)
+        for slo, result in results.items():
+            for window, rate in result["burn_rates"].items():
+                self.burn_rate.labels(slo, format_window(window)).set(rate)
+            for severity, _, _, _ in BURN_RATE_ALERTS:
+                self.alert.labels(slo, severity).set(1 if severity in result["alerts"] else 0)
+
+
+def make_tracker():
+    """SLOTracker with the Prometheus exporter attached when prometheus_client is installed."""
+    tracker = SLOTracker()
+    if METRICS_PORT:
+        try:
+            tracker.exporter = PrometheusExporter()
+        except ImportError:
+            logger.warning("prometheus_client is not installed; SLO metrics are only logged")
+    return tracker
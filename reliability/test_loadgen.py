@@ -0,0 +1,71 @@
+import itertools
+import math
+import time
+import unittest
+from unittest import mock
+from loadgen import LoadGenerator, send_offsets
+from slo import SLOTracker
+
+
+class TestSendOffsets(unittest.TestCase):
+    def test_constant_rate(self):
+        """Test that a flat stage sends evenly spaced requests"""
+        offsets = list(send_offsets([(10, 5)], start_rate=5))
+        self.assertEqual(len(offsets), 50)
+        for n, offset in enumerate(offsets, 1):
+            self.assertAlmostEqual(offset, n * 0.2)
+
+    def test_linear_ramp(self):
+        """Test that a ramp from 0 sends the n-th request when the integral reaches n"""
+        offsets = list(send_offsets([(10, 10)]))
+        self.assertEqual(len(offsets), 50)
+        for n, offset in enumerate(offsets, 1):
+            self.assertAlmostEqual(offset, math.sqrt(2 * n))
+
+    def test_stages_follow_on(self):
+        """Test that each stage starts from the previous target and its offsets continue in order"""
+        offsets = list(send_offsets([(2, 10), (2, 10), (2, 0)]))
+        self.assertEqual(len(offsets), 10 + 20 + 10)
+        self.assertEqual(offsets, sorted(offsets))
+        self.assertLessEqual(offsets[-1], 6)
+
+    def test_zero_length_stage_is_a_step(self):
+        """Test that a zero-length stage jumps straight to its target rate"""
+        offsets = list(send_offsets([(0, 50), (2, 50)]))
+        self.assertEqual(len(offsets), 100)
+        self.assertAlmostEqual(offsets[0], 0.02)
+        self.assertEqual(list(itertools.islice(send_offsets([(0, 0), (1, 0)]), 1)), [])
+
+
+class TestLoadGenerator(unittest.TestCase):
+    def test_dropped_requests_count_as_failures(self):
+        """Test that requests shed at the backlog limit are recorded as failed in the SLO tracker"""
+        tracker = SLOTracker()
+        generator = LoadGenerator('http://127.0.0.1:9', [(0, 100), (0.05, 100)], {'view': 1},
+                                  max_backlog=0, report_interval=3600, tracker=tracker)
+        totals = generator.run()
+
+        self.assertEqual(totals, {'sent': 0, 'errors': 0, 'dropped': 5, 'limited': 0})
+        summary = tracker.quantiles(60)['/visitor view']
+        self.assertEqual((summary['count'], summary['errors']), (5, 5))
+        self.assertGreater(tracker.burn_rate(300, 'availability'), 0)
+
+    def test_rate_limited_requests_are_not_errors(self):
+        """Test that 429 responses are counted as limited and kept out of the SLO numbers"""
+        tracker = SLOTracker()
+        generator = LoadGenerator('http://backend', [(1, 1)], {'view': 1}, tracker=tracker)
+        statuses = iter([200, 429, 500])
+        session = mock.Mock()
+        session.request.side_effect = lambda *args, **kwargs: mock.Mock(status_code=next(statuses))
+        generator._session = lambda: session
+
+        for _ in range(3):
+            generator.fire('view', time.perf_counter())
+
+        self.assertEqual(generator.totals, {'sent': 3, 'errors': 1, 'dropped': 0, 'limited': 1})
+        summary = tracker.quantiles(60)['/visitor view']
+        self.assertEqual((summary['count'], summary['errors']), (2, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import math
+import random
+import unittest
+from slo import HISTORY_SECONDS, SLOT_SECONDS, LogHistogram, SLOTracker
+
+
+class FakeClock:
+    def __init__(self, now=1_800_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def exact_quantile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+class TestLogHistogram(unittest.TestCase):
+    def test_quantiles_within_precision(self):
+        """Test that quantiles are within the bucket precision of the exact ones"""
+        rng = random.Random(7)
+        values = [rng.lognormvariate(math.log(0.05), 1.0) for _ in range(20000)]
+        histogram = LogHistogram()
+        for value in values:
+            histogram.record(value)
+
+        for q in (0.5, 0.9, 0.99, 0.999):
+            exact = exact_quantile(values, q)
+            self.assertAlmostEqual(histogram.quantile(q), exact, delta=exact * LogHistogram.PRECISION * 1.01)
+        self.assertEqual(histogram.quantile(1.0), max(values))
+        self.assertLessEqual(len(histogram.buckets), LogHistogram.MAX_INDEX + 1)
+
+    def test_merge_and_empty(self):
+        """Test that merged histograms match one fed every sample, and an empty one gives NaN"""
+        self.assertTrue(math.isnan(LogHistogram().quantile(0.5)))
+
+        left, right, both = LogHistogram(), LogHistogram(), LogHistogram()
+        for i in range(1, 1001):
+            (left if i % 2 else right).record(i / 1000)
+            both.record(i / 1000)
+        left.merge(right)
+        self.assertEqual(left.buckets, both.buckets)
+        self.assertEqual((left.count, left.max), (both.count, both.max))
+        self.assertEqual(left.quantile(0.99), both.quantile(0.99))
+
+    def test_out_of_range_values(self):
+        """Test that values outside the histogram range are clamped into the end buckets"""
+        histogram = LogHistogram()
+        histogram.record(0)
+        histogram.record(1000)
+        self.assertEqual(sorted(histogram.buckets), [0, LogHistogram.MAX_INDEX])
+        self.assertEqual(histogram.quantile(0.5), LogHistogram.MIN_VALUE)
+        self.assertEqual(histogram.quantile(1.0), LogHistogram.upper_bound(LogHistogram.MAX_INDEX))
+        self.assertEqual(histogram.max, 1000)
+
+
+class TestSLOTracker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.tracker = SLOTracker(latency_threshold=0.5, availability_target=0.999, latency_target=0.99,
+                                  clock=self.clock)
+
+    def traffic(self, minutes, per_minute, errors=0, slow=0):
+        """Record `per_minute` requests a minute, of which `errors` fail and `slow` exceed the threshold"""
+        for _ in range(minutes):
+            for i in range(per_minute):
+                latency = 1.0 if i < slow else 0.1
+                self.tracker.record('/visitor', 'view', latency, ok=i >= errors)
+            self.clock.now += SLOT_SECONDS
+
+    def test_slots_expire_from_windows(self):
+        """Test that samples stop counting once their slot leaves a window, and old slots are dropped"""
+        self.traffic(1, 10, errors=1)
+        self.assertEqual(self.tracker.quantiles(300)['/visitor']['count'], 10)
+
+        self.clock.now += 300
+        self.assertEqual(self.tracker.quantiles(300), {})
+        self.assertEqual(self.tracker.quantiles(3600)['/visitor view']['errors'], 1)
+
+        self.clock.now += HISTORY_SECONDS
+        self.tracker.record('/gallery', 'gallery', 0.1, True)
+        self.assertEqual(len(self.tracker._slots), 1)
+        self.assertEqual(list(self.tracker.quantiles(HISTORY_SECONDS)), ['/gallery', '/gallery gallery'])
+
+    def test_alerts_fire_on_burn_rate(self):
+        """Test that alerts fire only while both windows burn faster than the factor"""
+        self.traffic(10, 100)
+        result = self.tracker.evaluate()
+        self.assertEqual(result['availability']['alerts'], [])
+        self.assertEqual(result['latency']['alerts'], [])
+
+        # 1% errors burns the 0.1% budget at 10x: over the ticket factor, under the page one
+        self.traffic(60, 100, errors=1)
+        result = self.tracker.evaluate()
+        self.assertAlmostEqual(result['availability']['burn_rates'][300], 10.0)
+        self.assertEqual(result['availability']['alerts'], ['ticket'])
+
+        # 2% errors and 20% slow burn both budgets at 20x, paging as well
+        self.traffic(60, 100, errors=2, slow=20)
+        result = self.tracker.evaluate()
+        self.assertEqual(result['availability']['alerts'], ['page', 'ticket'])
+        self.assertEqual(result['latency']['alerts'], ['page', 'ticket'])
+
+        # Recovered: the short windows clear first, so the alerts stop although the long ones still burn
+        self.traffic(30, 100)
+        result = self.tracker.evaluate()
+        self.assertGreater(result['availability']['burn_rates'][6 * 3600], 6.0)
+        self.assertEqual(result['availability']['alerts'], [])
+        self.assertEqual(result['latency']['alerts'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()